@@ -0,0 +1,136 @@
+"""Benchmark of :func:`enki.lib.atomicwrite.writeFileAtomically`, the writer of saved and replaced files.
+
+Crash injection. A file is rewritten by a child process, which is killed in the middle of writing, or writing
+fails with an exception, i.e. the disk is full. Every failure must leave either the old or the new contents.
+Writing in place, as files were saved before, is checked the same way for comparison.
+Power loss is not simulated, only a crash of the process.
+
+Latency. Files of different sizes are written with every fsync policy.
+
+Usage: python benchmarks/bench_atomicwrite.py
+"""
+
+import errno
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import time
+
+from enki.lib.atomicwrite import currentUmask, writeFileAtomically
+
+CHUNK_SIZE = 64 * 1024
+CHUNK_COUNT = 32
+FAIL_AFTER_CHUNKS = [0, 1, CHUNK_COUNT / 2, CHUNK_COUNT - 1]
+SIZES_MB = [0.01, 1, 10, 50]
+FSYNC_POLICIES = ['never', 'file', 'fileAndDirectory']
+
+
+def _writeInPlace(filePath, chunks, fsyncPolicy, umask):  # pylint: disable=W0613
+    """Writing without a temporary file
+    """
+    with open(filePath, 'wb') as openedFile:
+        for data in chunks:
+            openedFile.write(data)
+
+
+def _chunks(data, failAfter, failure):
+    """Yield chunks of the data. Call failure after failAfter chunks
+    """
+    for index in range(0, len(data), CHUNK_SIZE):
+        if index / CHUNK_SIZE == failAfter:
+            failure()
+        yield data[index:index + CHUNK_SIZE]
+
+
+def _crash():
+    """Exit immediately, without flushing the buffers and running the cleanup
+    """
+    os._exit(1)  # pylint: disable=W0212
+
+
+def _diskFull():
+    """Fail as a write to the full disk
+    """
+    raise IOError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+
+
+def _inject(write, dirPath, failure, failAfter, umask):
+    """Rewrite a file and fail. Returns (file contents is old or new, count of left temporary files)
+    """
+    filePath = os.path.join(dirPath, 'file.txt')
+    oldData = 'old\n' * (CHUNK_COUNT * CHUNK_SIZE / 4)
+    newData = 'new\n' * (CHUNK_COUNT * CHUNK_SIZE / 4)
+    with open(filePath, 'wb') as openedFile:
+        openedFile.write(oldData)
+
+    if failure is _crash:
+        pid = os.fork()
+        if pid == 0:
+            write(filePath, _chunks(newData, failAfter, failure), 'file', umask)
+            os._exit(0)  # pylint: disable=W0212
+        os.waitpid(pid, 0)
+    else:
+        try:
+            write(filePath, _chunks(newData, failAfter, failure), 'file', umask)
+        except EnvironmentError:
+            pass
+
+    with open(filePath, 'rb') as openedFile:
+        data = openedFile.read()
+    leftFiles = [name for name in os.listdir(dirPath) if name != 'file.txt']
+    for name in leftFiles:
+        os.remove(os.path.join(dirPath, name))
+    return data in (oldData, newData), len(leftFiles)
+
+
+def _crashInjection(dirPath, umask):
+    """Returns count of failures, which have broken the file, written by writeFileAtomically
+    """
+    failures = [('disk full', _diskFull)]
+    if hasattr(os, 'fork'):
+        failures.append(('crash', _crash))
+
+    broken = 0
+    for writerName, write in [('atomic', writeFileAtomically), ('in place', _writeInPlace)]:
+        for failureName, failure in failures:
+            results = [_inject(write, dirPath, failure, failAfter, umask) for failAfter in FAIL_AFTER_CHUNKS]
+            intact = len([isIntact for isIntact, leftCount in results if isIntact])
+            leftCount = sum([leftCount for isIntact, leftCount in results])
+            print '%-8s %-9s: file intact after %d of %d failures, %d temporary files left' % \
+                    (writerName, failureName, intact, len(results), leftCount)
+            if write is writeFileAtomically:
+                broken += len(results) - intact
+    return broken
+
+
+def _latency(dirPath, umask):
+    """Print time of writing of files of different sizes with every fsync policy
+    """
+    filePath = os.path.join(dirPath, 'file.txt')
+    writeFileAtomically(filePath, ['warm up'], 'never', umask)  # the first write is slower
+    print '%8s %s' % ('size MB', ''.join(['%18s' % policy for policy in FSYNC_POLICIES]))
+    for sizeMb in SIZES_MB:
+        data = 'x' * int(sizeMb * 1024 * 1024)
+        times = []
+        for policy in FSYNC_POLICIES:
+            startTime = time.time()
+            writeFileAtomically(filePath, _chunks(data, None, None), policy, umask)
+            times.append((time.time() - startTime) * 1000)
+        print '%8s %s' % (sizeMb, ''.join(['%15.1f ms' % ms for ms in times]))
+
+
+def main():
+    dirPath = tempfile.mkdtemp()
+    umask = currentUmask()
+    try:
+        broken = _crashInjection(dirPath, umask)
+        _latency(dirPath, umask)
+    finally:
+        shutil.rmtree(dirPath)
+    return 1 if broken else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""Benchmark of :mod:`enki.lib.fileindex`.
+
+Builds an index of a synthetic tree of 500k files and types queries keystroke by keystroke,
+as the Locator does. Prints time of every keystroke and fails, if a keystroke takes longer than the target.
+
+Usage: python benchmarks/bench_fileindex.py [file count]
+"""
+
+import random
+import sys
+import time
+
+from enki.lib import fileindex
+
+TARGET_MS = 50
+FILES_PER_DIR = 25
+MAX_COUNT = 100  # as the Locator requests
+
+_WORDS = ['core', 'lib', 'src', 'test', 'tests', 'ui', 'widget', 'widgets', 'plugin', 'plugins', 'config',
+          'parser', 'model', 'view', 'controller', 'util', 'utils', 'main', 'data', 'docs', 'build', 'net',
+          'http', 'server', 'client', 'cache', 'index', 'search', 'file', 'files', 'io', 'event', 'editor',
+          'render', 'layout', 'theme', 'locale', 'python', 'module', 'api', 'base', 'common', 'internal']
+_EXTENSIONS = ['.py', '.c', '.h', '.cpp', '.js', '.html', '.txt', '.json', '.rst', '.ui']
+
+QUERIES = ['main', 'widget', 'cfgpars', 'mdlview', 'srvcache', 'lib/', 'src/ui/wid', 'tests/parser_1',
+           'zzz', 'edtr', 'index.h', 'qwertyuiop']
+
+
+def _makeDirs(fileCount):
+    """Generate list of (relative directory path, list of file names)
+    """
+    generator = random.Random(0)
+    dirs = []
+    count = 0
+    while count < fileCount:
+        depth = generator.randint(1, 6)
+        dirPath = '/'.join([generator.choice(_WORDS) + ('' if generator.random() < 0.7 else str(len(dirs)))
+                            for level in range(depth)])
+        names = []
+        for index in range(min(FILES_PER_DIR, fileCount - count)):
+            name = '_'.join([generator.choice(_WORDS) for part in range(generator.randint(1, 3))])
+            names.append(u'%s_%d%s' % (name, index, generator.choice(_EXTENSIONS)))
+        dirs.append((unicode(dirPath), names))
+        count += len(names)
+    return dirs
+
+
+def main():
+    fileCount = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    dirs = _makeDirs(fileCount)
+    startTime = time.time()
+    snapshot = fileindex._Snapshot('/root', None, dirs)  # pylint: disable=W0212
+    del dirs  # FileIndex doesn't keep it. Garbage collector would traverse it
+    print 'Indexed %d files in %d directories: %.2f s' % \
+            (snapshot.fileCount(), len(snapshot.dirs), time.time() - startTime)
+    startTime = time.time()
+    snapshot.buildCharMasks()  # as FileIndex does in the background thread
+    print 'Built character masks: %.2f s' % (time.time() - startTime)
+
+    worst = 0
+    for query in QUERIES:
+        previous = None
+        times = []
+        for length in range(1, len(query) + 1):
+            startTime = time.time()
+            previous = fileindex.search(snapshot, query[:length], MAX_COUNT,
+                                        fileindex.FileIndex.CANDIDATE_LIMIT, previous)
+            times.append((time.time() - startTime) * 1000)
+        worst = max(worst, max(times))
+        print '%-16s %4d matches  max %5.1f ms  [%s]' % \
+                (query, len(previous.matches), max(times), ' '.join(['%.0f' % ms for ms in times]))
+
+    print 'Slowest keystroke: %.1f ms, target %d ms' % (worst, TARGET_MS)
+    return 0 if worst <= TARGET_MS else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
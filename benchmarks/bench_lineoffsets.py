@@ -0,0 +1,94 @@
+"""Benchmark of the table of the line starts of the text editors.
+
+Converts positions in a text of 1M lines with the table and by splitting the text, as the editor did
+before the table. Also measures updating of the table, while the user types.
+
+Usage: python benchmarks/bench_lineoffsets.py [line count]
+"""
+
+import random
+import sys
+import time
+
+from enki.core.abstractdocument import _LineOffsets
+
+LINE = 'def function(self, argument):  # comment %07d\n'
+LINE_LENGTH = len(LINE % 0)  # including EOL. All lines have the same length
+SPLITTING_CALLS = 5  # splitting is slow, a few calls are enough
+TABLE_CALLS = 100000
+EDIT_COUNT = 10000
+
+
+def _toAbsPositionBySplitting(text, line, col):
+    """Conversion without the table
+    """
+    lines = text.splitlines()[:line + 1]
+    lines[-1] = lines[-1][:col]
+    return sum([len(l) for l in lines]) + len(lines) - 1
+
+
+def _toLineColBySplitting(text, absPosition):
+    """Conversion without the table
+    """
+    textBefore = text[:absPosition]
+    return textBefore.count('\n'), len(textBefore) - textBefore.rfind('\n') - 1
+
+
+def _toAbsPosition(offsets, line, col):
+    """Conversion as AbstractTextEditor does
+    """
+    return offsets.lineStart(line) + min(col, offsets.lineLength(line))
+
+
+def _toLineCol(offsets, absPosition):
+    """Conversion as AbstractTextEditor does
+    """
+    line = offsets.lineForPosition(absPosition)
+    return line, absPosition - offsets.lineStart(line)
+
+
+def _timePerCall(function, argsList):
+    """Average time of a call in microseconds
+    """
+    startTime = time.time()
+    for args in argsList:
+        function(*args)
+    return (time.time() - startTime) / len(argsList) * 1000000
+
+
+def main():
+    lineCount = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    text = ''.join([LINE % index for index in xrange(lineCount)])
+    generator = random.Random(0)
+    lines = [generator.randrange(lineCount) for index in xrange(TABLE_CALLS)]
+    positions = [generator.randrange(len(text)) for index in xrange(TABLE_CALLS)]
+
+    startTime = time.time()
+    offsets = _LineOffsets(text)
+    print '%d lines, %.1f MB. Table built in %.0f ms' % (lineCount, len(text) / 1e6, (time.time() - startTime) * 1000)
+
+    print '(line, column) to position: splitting %8.1f us, table %5.2f us' % \
+            (_timePerCall(_toAbsPositionBySplitting, [(text, line, 5) for line in lines[:SPLITTING_CALLS]]),
+             _timePerCall(_toAbsPosition, [(offsets, line, 5) for line in lines]))
+    print 'position to (line, column): splitting %8.1f us, table %5.2f us' % \
+            (_timePerCall(_toLineColBySplitting, [(text, pos) for pos in positions[:SPLITTING_CALLS]]),
+             _timePerCall(_toLineCol, [(offsets, pos) for pos in positions]))
+
+    # Typing. A character is inserted, sometimes a new line, close to the previous edit
+    line = lineCount / 2
+    edits = []
+    for index in xrange(EDIT_COUNT):
+        line = min(lineCount - 2, max(0, line + generator.randint(-3, 3)))
+        if generator.random() < 0.1:
+            edits.append((offsets, line, 1, [10, LINE_LENGTH - 10 + 1]))
+        else:
+            edits.append((offsets, line, 0, [LINE_LENGTH + 1]))
+    print 'Typing: %.2f us per edit' % _timePerCall(_LineOffsets.linesChanged, edits)
+
+    # Worst case. The step is moved over the whole table
+    edits = [(offsets, 0 if index % 2 else lineCount - 2, 0, [LINE_LENGTH + 1]) for index in xrange(20)]
+    print 'Edits at the start and at the end: %.0f us per edit' % _timePerCall(_LineOffsets.linesChanged, edits)
+
+
+if __name__ == '__main__':
+    main()
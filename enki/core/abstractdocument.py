@@ -7,12 +7,20 @@ This class is inherited by textual editor, and must be inherited by other worksp
 Classes:
     * :class:`enki.core.abstractdocument.AbstractDocument`
     * :class:`enki.core.abstractdocument.AbstractTextEditor`
+    * :class:`enki.core.abstractdocument.TextSnapshot`
     * :class:`enki.core.abstractdocument.IndentHelper`
 """
 
+import os
 import os.path
+import re
+import codecs
+import functools
+import hashlib
+import time
+from array import array
 
-from PyQt4.QtCore import pyqtSignal, QFileSystemWatcher, QObject, QTimer
+from PyQt4.QtCore import pyqtSignal, QObject
 from PyQt4.QtGui import QFileDialog, \
                         QIcon, \
                         QInputDialog, \
@@ -20,104 +28,153 @@ from PyQt4.QtGui import QFileDialog, \
                         QWidget
 
 from enki.core.core import core
+from enki.core import fileloader
 
 class _FileWatcher(QObject):
-    """File watcher.
+    """File watcher of a document.
     
-    QFileSystemWatcher notifies client about any change (file access mode, modification date, etc.)
-    But, we need signal, only after file contents had been changed
+    Notifications are received from the workspace :class:`enki.core.filewatcher.FileWatcher`,
+    which notifies clients about any change (file access mode, modification date, etc.)
+    But, we need signal, only after file contents had been changed.
+
+    Watcher doesn't keep the file contents. It keeps (size, mtime, inode) of the file and SHA-1 digest of the
+    contents. File is read and hashed only if its mtime or inode has been changed, but size is the same.
+    It is hashed by a background thread of the workspace watcher, see
+    :meth:`enki.core.filewatcher.FileWatcher.hashFile`. Notifications are coalesced by the workspace watcher.
+    Signals are emitted only when the state changes
     """
     modified = pyqtSignal(bool)
     removed = pyqtSignal(bool)
     
     def __init__(self, path):
         QObject.__init__(self)
-        self._contents = None
-        self._watcher = QFileSystemWatcher()
-        self._timer = None
-        self._path = path
+        self._digest = None  # digest of the known contents. None if not known
+        self._signature = None  # (size, mtime, inode) of the file with the known contents
+        self._hashedSignature = None  # (size, mtime, inode) of the file, which is being hashed. None if not hashed
+        self._isEnabled = False
+        self._isRemoved = False
+        self._isModified = False
+        self._path = None
         self.setPath(path)
         self.enable()
     
-    def __del__(self):
-        self._stopTimer()
-        
+    def term(self):
+        """Stop watching. Called, when the document is closed
+        """
+        self.disable()
+        self.setPath(None)
+
     def enable(self):
         """Enable signals from the watcher
         """
-        self._watcher.fileChanged.connect(self._onFileChanged)
+        self._isEnabled = True
     
     def disable(self):
         """Disable signals from the watcher
         """
-        self._watcher.fileChanged.disconnect(self._onFileChanged)
-        self._stopTimer()
+        self._isEnabled = False
     
-    def setContents(self, contents):
-        """Set file contents. Watcher uses it to compare old and new contents of the file.
+    @staticmethod
+    def newHash():
+        """Create hash object, which is used for the file contents.
+        Used for hashing of the file, which is being read by chunks. See :meth:`setDigest`
         """
-        self._contents = contents
-        # Qt File watcher may work incorrectly, if file was not existing, when it started
-        self.setPath(self._path)
+        return hashlib.sha1()
 
-    def setPath(self, path):
-        """Path had been changed or file had been created. Set new path
+    @staticmethod
+    def _statSignature(stat):
+        """Get (size, mtime, inode) for os.stat() result
         """
-        if self._watcher.files():
-            self._watcher.removePaths(self._watcher.files())
-        if path is not None and os.path.isfile(path):
-            self._watcher.addPath(path)
-        self._path = path
+        return (stat.st_size, stat.st_mtime, stat.st_ino)
 
-    def _emitModifiedStatus(self):
-        """Emit self.modified signal with right status
-        """
-        isModified = self._contents != self._safeRead(self._path)
-        self.modified.emit(isModified)
-        
-    def _onFileChanged(self):
-        """File changed. Emit own signal, if contents changed
+    def setContents(self, data, stat=None):
+        """Set file contents, which has been read or written. Watcher keeps only its digest.
+        stat is os.stat() result for the file with this contents. The file is stat'ed, if it is None
         """
-        if os.path.exists(self._path):
-            self._emitModifiedStatus()
-        else:
-            self.removed.emit(True)
-            self._startTimer()
-    
-    def _startTimer(self):
-        """Init a timer.
-        It is used for monitoring file after deletion.
-        Git removes file, than restores it.
+        self.setDigest(hashlib.sha1(data).digest(), stat)
+
+    def setDigest(self, digest, stat=None):
+        """Set digest of the file contents, which has been read or written.
+        Digest is calculated with a hash object, created by :meth:`newHash`.
+        stat is os.stat() result for the file with this contents. The file is stat'ed, if it is None
         """
-        if self._timer is None:
-            self._timer = QTimer()
-            self._timer.setInterval(500)
-            self._timer.timeout.connect(self._onCheckIfDeletedTimer)
-        self._timer.start()
-    
-    def _stopTimer(self):
-        """Stop timer, if exists
+        self._digest = digest
+        if stat is None:
+            try:
+                stat = os.stat(self._path)
+            except OSError:
+                stat = None
+        self._signature = self._statSignature(stat) if stat is not None else None
+        self._hashedSignature = None
+        self._isRemoved = False
+        self._isModified = False
+
+    def setPath(self, path):
+        """Path had been changed. Set new path. None stops watching
+        """
+        fileWatcher = core.workspace().fileWatcher()
+        if self._path is not None:
+            fileWatcher.unwatch(self._path, self._onFileChanged)
+        if path is not None:
+            path = os.path.abspath(path)
+            fileWatcher.watch(path, self._onFileChanged)
+        self._path = path
+        self._hashedSignature = None
+
+    def _setModified(self, isModified):
+        """Emit modified signal, if the state changed
         """
-        if self._timer is not None:
-            self._timer.stop()
-    
-    def _onCheckIfDeletedTimer(self):
-        """Check, if file has been restored
+        self._hashedSignature = None  # result of not finished hashing is outdated
+        if isModified != self._isModified:
+            self._isModified = isModified
+            self.modified.emit(isModified)
+
+    def _onFileChanged(self, stat):
+        """File might have been changed. stat is os.stat() result, None if the file has been removed.
+        Emit own signals, if the state changed
         """
-        if os.path.exists(self._path):
+        if not self._isEnabled:
+            return
+        
+        if stat is None:
+            self._hashedSignature = None
+            if not self._isRemoved:
+                self._isRemoved = True
+                self.removed.emit(True)
+            return
+        
+        if self._isRemoved:  # restored, i.e. git removes file, than restores it
+            self._isRemoved = False
             self.removed.emit(False)
-            self._emitModifiedStatus()
-            self.setPath(self._path)  # restart Qt file watcher after file has been restored
-            self._stopTimer()
-    
-    def _safeRead(self, path):
-        """Read file. Ignore exceptions
+        
+        signature = self._statSignature(stat)
+        if self._digest is None:
+            self._setModified(True)
+        elif signature == self._signature:
+            self._setModified(False)
+        elif self._signature is not None and signature[0] != self._signature[0]:  # size changed
+            self._setModified(True)
+        elif signature != self._hashedSignature:  # not being hashed yet
+            self._hashedSignature = signature
+            core.workspace().fileWatcher().hashFile(self._path, self.newHash,
+                                                    functools.partial(self._onFileHashed, signature))
+
+    def _onFileHashed(self, signature, digest):
+        """File has been hashed by the workspace watcher.
+        Result is ignored, if the file has been changed, saved or closed since hashing has been started
         """
-        try:
-            with open(path) as file:
-                return file.read()
-        except (OSError, IOError):
-            return None
+        if signature != self._hashedSignature:
+            return
+        self._hashedSignature = None
+        if not self._isEnabled:
+            return
+        
+        if digest == self._digest:
+            self._signature = signature  # same contents, i.e. touched. Don't hash it next time
+            self._setModified(False)
+        else:
+            self._setModified(True)
+
 
 class AbstractDocument(QWidget):
     """
@@ -128,6 +185,18 @@ class AbstractDocument(QWidget):
     DO redesign instead of doing dirty hacks
     """
     
+    LARGE_FILE_SIZE = 32 * 1024 * 1024
+    """Files bigger than this size in bytes are opened in the large file mode. See :meth:`isLargeFile`"""
+    
+    LARGE_FILE_CHUNK_SIZE = 4 * 1024 * 1024
+    """Large files are read by chunks of this size"""
+    
+    SAVE_CHUNK_SIZE = 1024 * 1024
+    """Text is converted and encoded by chunks of this count of characters, when saving"""
+    
+    _SAVING = 'saving'
+    _SAVE_FAILED = 'saveFailed'
+    
     modifiedChanged = pyqtSignal(bool)
     """
     modifiedChanged(modified)
@@ -146,6 +215,13 @@ class AbstractDocument(QWidget):
     (i.e. document has been modified externally)
     """
 
+    loaded = pyqtSignal()
+    """
+    loaded()
+
+    **Signal** emitted, when loading of a large file by chunks has been finished. See :meth:`isLoading`
+    """  # pylint: disable=W0105
+
     def __init__( self, parentObject, filePath, createNew=False):
         """Create editor and open file.
         If file is None or createNew is True, empty not saved file is created
@@ -156,6 +232,11 @@ class AbstractDocument(QWidget):
         self._filePath = filePath
         self._externallyRemoved = False
         self._externallyModified = False
+        self._saveState = None  # None, _SAVING or _SAVE_FAILED
+        self._saveError = None
+        self._largeFile = not self._neverSaved and \
+                          os.path.isfile(filePath) and \
+                          os.path.getsize(filePath) > self.LARGE_FILE_SIZE
         # File opening should be implemented in the document classes
         
         self._fileWatcher = _FileWatcher(filePath)
@@ -168,7 +249,9 @@ class AbstractDocument(QWidget):
     def del_(self):
         """Explicytly called destructor
         """
-        self._fileWatcher.disable()
+        if self.isBeingSaved():
+            core.workspace().saveQueue().wait()
+        self._fileWatcher.term()
 
     def _onWatcherFileModified(self, modified):
         """File has been modified
@@ -184,25 +267,84 @@ class AbstractDocument(QWidget):
 
     def _readFile(self, filePath):
         """Read the file contents.
+        Contents, already read by :mod:`enki.core.fileloader`, is used, if available.
         Shows QMessageBox for UnicodeDecodeError, but raises IOError, if failed to read file
         """
+        loadedFile = fileloader.takeLoaded(filePath)
+        if loadedFile is not None:
+            self._filePath = loadedFile.path
+            self._fileWatcher.setContents(loadedFile.data)
+            if loadedFile.decodeError is not None:
+                self._showDecodeError(filePath, loadedFile.decodeError)
+            return loadedFile.text
+        
         with open(filePath, 'r') as openedFile:  # Exception is ok, raise it up
             self._filePath = os.path.abspath(filePath)
+            stat = os.fstat(openedFile.fileno())
             data = openedFile.read()                
         
-        self._fileWatcher.setContents(data)
+        self._fileWatcher.setContents(data, stat)
         
         try:
             text = unicode(data, 'utf8')
         except UnicodeDecodeError, ex:
-            QMessageBox.critical(None,
-                                 self.tr("Can not decode file"),
-                                 filePath + '\n' +
-                                 unicode(str(ex), 'utf8') + 
-                                 '\nProbably invalid encoding was set. ' +
-                                 'You may corrupt your file, if saved it')
+            self._showDecodeError(filePath, unicode(str(ex), 'utf8'))
             text = unicode(data, 'utf8', 'replace')
         return text
+    
+    def _showDecodeError(self, filePath, error):
+        """Show QMessageBox for UnicodeDecodeError
+        """
+        QMessageBox.critical(None,
+                             self.tr("Can not decode file"),
+                             filePath + '\n' +
+                             error + 
+                             '\nProbably invalid encoding was set. ' +
+                             'You may corrupt your file, if saved it')
+
+    def _readFileChunks(self, filePath):
+        """Read and decode the file by chunks. Generator. Used instead of _readFile() for large files.
+        Yields tuples (text, count of read bytes).
+        
+        Shows QMessageBox for UnicodeDecodeError, but raises IOError, if failed to read file.
+        Digest of the contents is passed to the file watcher, when the whole file has been read
+        """
+        with open(filePath, 'rb') as openedFile:  # Exception is ok, raise it up
+            self._filePath = os.path.abspath(filePath)
+            stat = os.fstat(openedFile.fileno())
+            fileHash = self._fileWatcher.newHash()
+            
+            decoder = codecs.getincrementaldecoder('utf8')()
+            readSize = 0
+            while True:
+                data = openedFile.read(self.LARGE_FILE_CHUNK_SIZE)
+                readSize += len(data)
+                fileHash.update(data)
+                if not data:
+                    self._fileWatcher.setDigest(fileHash.digest(), stat)
+                try:
+                    text = decoder.decode(data, not data)
+                except UnicodeDecodeError, ex:
+                    self._showDecodeError(filePath, unicode(str(ex), 'utf8'))
+                    notDecoded = decoder.getstate()[0]  # tail of the previous chunk
+                    decoder = codecs.getincrementaldecoder('utf8')('replace')
+                    text = decoder.decode(notDecoded + data, not data)
+                
+                yield text, readSize
+                if not data:
+                    break
+
+    def isLargeFile(self):
+        """File is bigger than :attr:`LARGE_FILE_SIZE`.
+        Large files are loaded by chunks, without syntax highlighting and wrapping.
+        Plugins should avoid processing of the whole text of large files
+        """
+        return self._largeFile
+
+    def isLoading(self):
+        """Large file is being loaded by chunks. :attr:`loaded` is emitted, when loading is finished
+        """
+        return False
 
     def _setModified(self, value):
         """Set modified state for the file. Called by AbstractDocument
@@ -258,8 +400,10 @@ class AbstractDocument(QWidget):
         core.workspace().documentOpened.emit(self)
         core.workspace().currentDocumentChanged.emit(self, self)
 
-    def _saveFile(self, filePath):
-        """Low level method. Always saves file, even if not modified
+    def _saveFile(self, filePath, wait=True):
+        """Low level method. Always saves file, even if not modified.
+        Text is encoded by the GUI thread and written by :class:`enki.core.savequeue.SaveQueue`.
+        If wait is False, method returns before the file is written
         """
         # Create directory
         dirPath = os.path.dirname(filePath)
@@ -273,46 +417,80 @@ class AbstractDocument(QWidget):
                                      self.tr( "Cannot create directory '%s'. Error '%s'" % (dirPath, error)))
                 return
 
-        # Text may be separated with invalid EOL symbols. Join lines with EOL, set for the document
-        converter = { r'\r\n': '\r\n',
-                      r'\r'  : '\r',
-                      r'\n'  : '\n'}
-        text = self.text()
-        lines = text.splitlines()
-        if text.endswith('\n'):
-            lines.append('')
-        eol = converter[self.eolMode()]
-        text = eol.join(lines)
-
-        # Write file
-        try:
-            openedFile = open(filePath, 'w')
-        except IOError as ex:
+        eol = {r'\r\n': '\r\n',
+               r'\r'  : '\r',
+               r'\n'  : '\n'}[self.eolMode()]
+        
+        chunks = list(self._encodedChunks(self.text(), eol))
+        
+        self._fileWatcher.disable()  # enabled, when the last queued save is finished
+        self._saveState = self._SAVING
+        self._saveError = None
+        self.documentDataChanged.emit()
+        
+        saveQueue = core.workspace().saveQueue()
+        saveQueue.save(filePath, chunks, core.config()["Workspace"]["FsyncOnSave"],
+                       self._fileWatcher.newHash(),
+                       lambda task, revision=self.revision(): self._onSaveFinished(task, revision))
+        if wait:
+            saveQueue.wait(filePath)
+    
+    def _onSaveFinished(self, task, revision):
+        """File has been written by :class:`enki.core.savequeue.SaveQueue`.
+        revision is revision of the saved text
+        """
+        if task.error is not None:
             QMessageBox.critical(None,
                                  self.tr("Can not write to file"),
-                                 unicode(str(ex), 'utf8'))
-            return
+                                 task.error)
         
-        data = text.encode('utf8')
+        if task.superseded:  # will be written again. Watcher is still disabled
+            return
         
-        self._fileWatcher.disable()
-        try:
-            openedFile.write(data)
-            self._fileWatcher.setContents(data)
-        finally:
-            openedFile.close()
-            self._fileWatcher.enable()
+        if task.error is not None:
+            self._saveState = self._SAVE_FAILED
+            self._saveError = task.error
+        else:
+            self._fileWatcher.setDigest(task.digest)  # after renaming, when size and mtime are final
+            self._saveState = None
+            self._neverSaved = False
+            self._externallyRemoved = False
+            self._externallyModified = False
+            if revision == self.revision():  # not edited while saving
+                self._setModified(False)
+            core.mainWindow().statusBar().showMessage(self.tr("%s saved: %d bytes in %d ms" % \
+                                                   (os.path.basename(task.path),
+                                                    task.size,
+                                                    (time.time() - task.startTime) * 1000)),
+                                                      3000)
         
-        # Update states
-        self._neverSaved = False
-        self._externallyRemoved = False
-        self._externallyModified = False
-        self._setModified(False)
+        self._fileWatcher.enable()
+        self.documentDataChanged.emit()
 
-    def saveFile(self):
+    def isBeingSaved(self):
+        """Document has been saved with ``wait=False``, and the file is not written yet
+        """
+        return self._saveState == self._SAVING
+
+    def _encodedChunks(self, text, eol):
+        """Convert EOLs and encode the text to utf8 by chunks. Generator.
+        Text may be separated with invalid EOL symbols. All of them are replaced with eol, set for the document
+        """
+        eolRegExp = re.compile(r'\r\n|\r|\n')
+        pos = 0
+        while pos < len(text):
+            end = min(pos + self.SAVE_CHUNK_SIZE, len(text))
+            # don't split \r\n and surrogate pairs
+            while end < len(text) and (text[end - 1] == u'\r' or u'\ud800' <= text[end - 1] <= u'\udbff'):
+                end += 1
+            yield eolRegExp.sub(eol, text[pos:end]).encode('utf8')
+            pos = end
+
+    def saveFile(self, wait=True):
         """Save the file to file system
         
-        Shows QFileDialog if necessary
+        Shows QFileDialog if necessary.
+        If wait is False, the file is written in the background, see :meth:`isBeingSaved`
         """
         # Get path
         if not self._filePath:
@@ -321,7 +499,7 @@ class AbstractDocument(QWidget):
                 self.setFilePath(path)
             else:
                 return
-        self._saveFile(self.filePath())
+        self._saveFile(self.filePath(), wait)
         
     def saveFileAs(self):
         """Ask for new file name with dialog. Save file
@@ -360,6 +538,10 @@ class AbstractDocument(QWidget):
             toolTip += "<br/><font color='red'>%s</font>" % self.tr("Externally Modified")
         if  self._externallyRemoved:
             toolTip += "<br/><font color='red'>%s</font>" % self.tr( "Externally Deleted" )
+        if self._saveState == self._SAVING:
+            toolTip += "<br/><font color='blue'>%s</font>" % self.tr("Saving...")
+        elif self._saveState == self._SAVE_FAILED:
+            toolTip += "<br/><font color='red'>%s</font>" % (self.tr("Save failed: ") + self._saveError)
         return '<html>' + toolTip + '</html>'
     
     def modelIcon(self):
@@ -403,6 +585,152 @@ class IndentHelper:
         raise NotImplemented()
     
 
+class _LineOffsets:
+    """Table of absolute positions of the line starts. Used for fast conversion of (line, column) to absolute
+    position and back.
+    
+    Table is updated incrementally, when lines are changed. Like Scintilla partitioning, it keeps a *step*:
+    values after the step line are stored without the step delta. Edits are usually close to each other,
+    therefore only values between the previous and the current edited line are recalculated
+    """
+    def __init__(self, text):
+        self._starts = array('l', [0])
+        self._starts.extend(match.end() for match in re.finditer('\n', text))
+        self._textLength = len(text)
+        self._stepLine = 0
+        self._stepDelta = 0
+    
+    def lineCount(self):
+        """Count of lines
+        """
+        return len(self._starts)
+    
+    def textLength(self):
+        """Length of the text
+        """
+        return self._textLength
+    
+    def lineStart(self, line):
+        """Absolute position of the line start
+        """
+        if line > self._stepLine:
+            return self._starts[line] + self._stepDelta
+        else:
+            return self._starts[line]
+    
+    def lineLength(self, line):
+        """Length of the line without EOL
+        """
+        if line + 1 < len(self._starts):
+            return self.lineStart(line + 1) - 1 - self.lineStart(line)
+        else:
+            return self._textLength - self.lineStart(line)
+    
+    def lineForPosition(self, absPos):
+        """Index of the line, which contains the position. Binary search
+        """
+        low = 0
+        high = len(self._starts)
+        while high - low > 1:
+            middle = (low + high) / 2
+            if self.lineStart(middle) <= absPos:
+                low = middle
+            else:
+                high = middle
+        return low
+    
+    def _moveStep(self, line):
+        """Move the step to the line. Values between the old and the new step line are recalculated
+        """
+        if self._stepDelta:
+            starts = self._starts
+            if line > self._stepLine:
+                for index in xrange(self._stepLine + 1, min(line, len(starts) - 1) + 1):
+                    starts[index] += self._stepDelta
+            else:
+                for index in xrange(line + 1, self._stepLine + 1):
+                    starts[index] -= self._stepDelta
+        self._stepLine = line
+    
+    def linesChanged(self, line, linesAdded, newLineLengths):
+        """Lines have been edited. Old lines from line to line - linesAdded (if lines were removed)
+        have been replaced with new lines from line to line + linesAdded (if lines were added).
+        
+        newLineLengths is list of lengths of the new lines, including EOL, except the last line of the text.
+        """
+        removedCount = max(-linesAdded, 0)
+        addedCount = max(linesAdded, 0)
+        
+        self._moveStep(line)
+        start = self.lineStart(line)
+        
+        oldNextIndex = line + removedCount + 1
+        if oldNextIndex < len(self._starts):
+            oldNextStart = self.lineStart(oldNextIndex)
+        else:  # the last line has been edited. It doesn't have EOL
+            oldNextStart = self._textLength
+        
+        newStarts = array('l')
+        pos = start
+        for length in newLineLengths[:addedCount]:
+            pos += length
+            newStarts.append(pos)
+        newNextStart = start + sum(newLineLengths)
+        
+        self._starts[line + 1:line + 1 + removedCount] = newStarts
+        self._textLength += newNextStart - oldNextStart
+        self._stepLine = line + addedCount
+        self._stepDelta += newNextStart - oldNextStart
+        
+        if self._stepLine >= len(self._starts) - 1:  # nothing after the step
+            self._stepDelta = 0
+            self._stepLine = len(self._starts) - 1
+
+
+class TextSnapshot:
+    """Immutable copy of the editor text. See :meth:`AbstractTextEditor.snapshot`
+    
+    Snapshot may be used, when the text is processed for a long time, i.e. by a thread,
+    or when many lines are read. Changes of the editor don't affect it.
+    """
+    def __init__(self, text, revision):
+        self._text = text
+        self._lineOffsets = None
+        self.revision = revision
+        """Revision of the editor text, see :meth:`AbstractTextEditor.revision`"""
+    
+    def _getLineOffsets(self):
+        """Get table of the line starts. It is built on first request
+        """
+        if self._lineOffsets is None:
+            self._lineOffsets = _LineOffsets(self._text)
+        return self._lineOffsets
+    
+    def text(self):
+        """Whole text. Lines are separated with *\\n*
+        """
+        return self._text
+    
+    def textRange(self, startAbsPos, endAbsPos):
+        """Part of the text
+        """
+        return self._text[startAbsPos:endAbsPos]
+    
+    def lineCount(self):
+        """Count of lines
+        """
+        return self._getLineOffsets().lineCount()
+    
+    def line(self, index):
+        """Line of the text without EOL. None, if index is invalid
+        """
+        lineOffsets = self._getLineOffsets()
+        if index < 0 or index >= lineOffsets.lineCount():
+            return None
+        start = lineOffsets.lineStart(index)
+        return self._text[start:start + lineOffsets.lineLength(index)]
+
+
 class AbstractTextEditor(AbstractDocument):
     """Base class for text editors. Currently, only QScintilla is supported, but, we may replace it in the future
     """
@@ -458,6 +786,13 @@ class AbstractTextEditor(AbstractDocument):
 
     **Signal** emitted, after new line has been inserted by user (user pressed Enter)
     """  # pylint: disable=W0105
+
+    visibleLinesChanged = pyqtSignal()
+    """
+    visibleLinesChanged()
+
+    **Signal** emitted, when the text has been scrolled or editor has been resized. See :meth:`visibleLines`
+    """  # pylint: disable=W0105
     
     def __init__(self, parentObject, filePath, createNew=False, terminalWidget=False):
         """If terminalWidget is True, editor is used not as fully functional editor, but as interactive terminal.
@@ -465,6 +800,9 @@ class AbstractTextEditor(AbstractDocument):
         """
         AbstractDocument.__init__(self, parentObject, filePath, createNew)
         self._language = None
+        self._lineOffsets = None  # _LineOffsets. Created on first request
+        self._revision = 0
+        self.textChanged.connect(self._incrementRevision)
         self.newLineInserted.connect(self._onNewLineInserted)
     
     def eolMode(self):
@@ -558,6 +896,33 @@ class AbstractTextEditor(AbstractDocument):
         Usually this method is called only internally by openFile()
         """
         pass
+    
+    def _incrementRevision(self):
+        """textChanged handler. Text has a new revision
+        """
+        self._revision += 1
+    
+    def revision(self):
+        """Revision of the text. It is changed every time, when the text is changed.
+        May be used to check, if cached data, calculated from the text, is still valid
+        """
+        return self._revision
+    
+    def textLength(self):
+        """Length of the text. See *text()*
+        """
+        return self._getLineOffsets().textLength()
+    
+    def textRange(self, startAbsPos, endAbsPos):
+        """Part of the text from startAbsPos to endAbsPos.
+        Editors implement it without making a copy of the whole text
+        """
+        return self.text()[startAbsPos:endAbsPos]
+    
+    def snapshot(self):
+        """Get immutable :class:`TextSnapshot` of the current text
+        """
+        return TextSnapshot(self.text(), self._revision)
 
     def selectedText(self):
         """Get selected text
@@ -675,6 +1040,20 @@ class AbstractTextEditor(AbstractDocument):
             endAbsPos = self._toAbsPosition(endLine, endCol)
         self._replace(startAbsPos, endAbsPos, text)
 
+    def replaceMatches(self, replacements):
+        """Replace multiple ranges of the text as one undo action.
+        replacements is list of (startAbsPos, endAbsPos, text), sorted by position, not overlapping.
+        
+        Ranges are replaced from the last to the first, therefore positions of not replaced yet ranges are valid.
+        Editor implementations shall reimplement it, if they are able to do the replacements faster
+        """
+        self.beginUndoAction()
+        try:
+            for startAbsPos, endAbsPos, text in reversed(replacements):
+                self.replace(text, startAbsPos=startAbsPos, endAbsPos=endAbsPos)
+        finally:
+            self.endUndoAction()
+
     def beginUndoAction(self):
         """Start doing set of modifications, which will be managed as one action.
         User can Undo and Redo all modifications with one action
@@ -705,7 +1084,14 @@ class AbstractTextEditor(AbstractDocument):
         
         None, if index is invalid
         """
-        return self.lines()[index]
+        lineOffsets = self._getLineOffsets()
+        if index < 0:
+            index += lineOffsets.lineCount()
+        if index < 0 or index >= lineOffsets.lineCount():
+            return None
+        
+        start = lineOffsets.lineStart(index)
+        return self.text()[start:start + lineOffsets.lineLength(index)]
     
     def setLine(self, index, text):
         """Replace text in the line with the text.
@@ -738,28 +1124,33 @@ class AbstractTextEditor(AbstractDocument):
         """
         raise NotImplemented()
 
+    def _getLineOffsets(self):
+        """Get table of the line starts. It is built on first request
+        """
+        if self._lineOffsets is None:
+            self._lineOffsets = _LineOffsets(self.text())
+        return self._lineOffsets
+    
+    def _invalidateLineOffsets(self):
+        """Text has been changed, and the table of the line starts can't be updated incrementally.
+        Implementations must call it, or keep self._lineOffsets up to date, when the text is changed
+        """
+        self._lineOffsets = None
+
     def _toAbsPosition(self, line, col):
         """Convert (line, column) to absolute position
         """
-        lines = self.lines()
-        
-        lines = lines[:line + 1]  # remove not included lines
-        if lines:
-            lines[-1] = lines[-1][:col]  # remove not included symbols
-            
-        pos = sum([len(l) for l in lines])  # sum of all visible symbols
-        pos += (len(lines) - 1)  # EOL symbols
-        
-        return pos
+        lineOffsets = self._getLineOffsets()
+        line = min(line, lineOffsets.lineCount() - 1)
+        return lineOffsets.lineStart(line) + min(col, lineOffsets.lineLength(line))
 
     def _toLineCol(self, absPosition):
         """Convert absolute position to (line, column)
         """
-        textBefore = self.text()[:absPosition]
-        line = textBefore.count('\n')
-        eolIndex = textBefore.rfind('\n')  # -1 is ok
-        col = len(textBefore) - eolIndex - 1
-        return line, col
+        lineOffsets = self._getLineOffsets()
+        absPosition = min(absPosition, lineOffsets.textLength())
+        line = lineOffsets.lineForPosition(absPosition)
+        return line, absPosition - lineOffsets.lineStart(line)
 
     def _configureEolMode(self, originalText):
         """Detect end of line mode automatically and apply detected mode
@@ -827,6 +1218,21 @@ class AbstractTextEditor(AbstractDocument):
         """
         raise NotImplemented()
 
+    def visibleLines(self):
+        """Get tuple (first line, last line) of the text, visible on the screen.
+        Whole text, if the editor doesn't know it
+        """
+        return 0, len(self.lines()) - 1
+
+    def visibleAbsRange(self, marginLines=0):
+        """Get tuple (startAbsPos, endAbsPos) of the visible text.
+        Range is extended with marginLines lines before and after the visible lines
+        """
+        firstLine, lastLine = self.visibleLines()
+        firstLine = max(0, firstLine - marginLines)
+        lastLine = min(self.lineCount() - 1, lastLine + marginLines)
+        return self._toAbsPosition(firstLine, 0), self._toAbsPosition(lastLine, len(self.line(lastLine)))
+
     def setExtraSelections(self, selections):
         """Set additional selections.
         Used for highlighting search results
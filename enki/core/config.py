@@ -59,6 +59,14 @@ class Config():
             self._data['PlatformDefaultsHaveBeenSet'] = False
             self._data['_version'] = 4
 
+        if self._data['_version'] == 4:
+            self._data['SearchReplace'] = {'UseIndex': True}
+            self._data['_version'] = 5
+
+        if self._data['_version'] == 5:
+            self._data['Workspace']['FsyncOnSave'] = 'file'
+            self._data['_version'] = 6
+
     def _setPlatformDefaults(self):
         """Set default values, which depend on platform
         """
@@ -15,7 +15,7 @@ from PyQt4.QtGui import QApplication, QIcon
 from PyQt4.QtCore import pyqtSignal, QObject, QTimer
 
 import enki.core.defines
-from enki.resources.icons import qInitResources, qCleanupResources
+from enki.resources import initResources, cleanupResources
 
 DATA_FILES_PATH = os.path.join(os.path.dirname(__file__), '..')
 
@@ -62,6 +62,7 @@ class Core(QObject):
         self._fileFilter = None
         self._indentHelpers = {}
         self._loadedPlugins = []
+        self._pluginLoader = None
 
     def _prepareToCatchSigInt(self):
         """Catch SIGINT signal to close the application
@@ -81,7 +82,9 @@ class Core(QObject):
         if profiler is not None:
             profiler.stepDone('Catch SIGINT')
 
-        qInitResources()
+        initResources()
+        if profiler is not None:
+            profiler.stepDone('Register resources')
 
         QApplication.instance().setWindowIcon(QIcon(':/enkiicons/logo/32x32/enki.png') )
 
@@ -124,7 +127,9 @@ class Core(QObject):
         if profiler is not None:
             profiler.stepDone('Create Locator')
         
-        # Create plugins
+        # Create startup plugins. Other plugins are loaded later by the PluginLoader
+        import enki.core.pluginloader
+        self._pluginLoader = enki.core.pluginloader.PluginLoader(self._loadPlugin, self)
         if profiler is not None:
             firstPlugin = True
         pluginsPath = os.path.join(os.path.dirname(__file__), '../plugins')
@@ -132,16 +137,26 @@ class Core(QObject):
             if profiler is not None and firstPlugin:
                 firstPlugin = False
                 profiler.stepDone('Search plugins')
-            self._loadPlugin(name)
+            if self._pluginLoader.activation(name) != enki.core.pluginloader.STARTUP:
+                self._pluginLoader.add(name)
+                continue
+
+            self._loadPlugin(name, profiler)
             
             if profiler is not None:
                 profiler.stepDone('  Load %s' % name)
 
+        self._pluginLoader.start()
+
     def term(self):
         """Terminate plugins and core modules
         
         Called only by main()
         """
+        if self._pluginLoader is not None:
+            self._pluginLoader.del_()
+            del self._pluginLoader
+
         while self._loadedPlugins:
             plugin = self._loadedPlugins.pop()
             plugin.del_()
@@ -162,7 +177,7 @@ class Core(QObject):
         if self._config is not None:
             del self._config
 
-        qCleanupResources()
+        cleanupResources()
 
     def mainWindow(self):
         """Get :class:`enki.core.mainwindow.MainWindow` instance
@@ -186,6 +201,8 @@ class Core(QObject):
     
     def loadedPlugins(self):
         """Get list of curretly loaded plugins (::class:`enki.core.Plugin` instances)
+        
+        Deferred and on-demand plugins are not in the list until loaded. See :mod:`enki.core.pluginloader`
         """
         return self._loadedPlugins
     
@@ -207,11 +224,16 @@ class Core(QObject):
         """
         return self._indentHelpers[language]
 
-    def _loadPlugin(self, name):
-        """Load plugin by it's module name
+    def _loadPlugin(self, name, profiler=None):
+        """Load plugin by it's module name.
+        Construction of the plugin is measured, if profiler is passed
         """
         exec("import enki.plugins.%s as module" % name)  # pylint: disable=W0122
+        if profiler is not None:
+            profiler.beginSpan('%s.Plugin()' % name, 'plugin')
         self._loadedPlugins.append(module.Plugin())  # pylint: disable=E0602
+        if profiler is not None:
+            profiler.endSpan()
 
     def _createDefaultConfigFile(self):
         """Create default configuration file, if it is not present
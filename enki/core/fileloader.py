@@ -0,0 +1,166 @@
+"""
+fileloader --- Reading files by background threads
+==================================================
+
+Files are read and decoded by a pool of worker threads, so opening of many files doesn't block the UI.
+Loaded file is delivered to the GUI thread with a signal. Document widgets are created by the GUI thread,
+the document takes already read contents with :func:`takeLoaded` instead of reading the file again.
+
+Large files are not read by the workers, documents load it by chunks.
+See :attr:`enki.core.abstractdocument.AbstractDocument.LARGE_FILE_SIZE`
+
+See :meth:`enki.core.workspace.Workspace.openFiles`
+"""
+
+import os
+import threading
+import Queue
+
+from PyQt4.QtCore import pyqtSignal, QObject
+
+_loaded = {}  # file path: LoadedFile. Files, which have been loaded, but not taken by a document yet
+
+
+class LoadedFile:
+    """Result of loading of a file.
+
+    * path - path of the file
+    * data - not decoded contents, None if file is not loaded (failed or large)
+    * text - decoded contents
+    * decodeError - error message, if the file is not valid utf8 and had been decoded with replacement symbols
+    * error - error message, if failed to read the file
+    """
+    def __init__(self, path):
+        self.path = path
+        self.data = None
+        self.text = None
+        self.decodeError = None
+        self.error = None
+        self._stat = None  # (mtime, size) of the file, when it was read
+
+    def load(self, largeFileSize):
+        """Read and decode the file. Called by a worker thread.
+        Files bigger than largeFileSize are not read
+        """
+        try:
+            stat = os.stat(self.path)
+            if stat.st_size > largeFileSize:
+                return
+            with open(self.path, 'r') as openedFile:
+                data = openedFile.read()
+        except (IOError, OSError) as ex:
+            self.error = unicode(str(ex), 'utf8')
+            return
+
+        try:
+            self.text = unicode(data, 'utf8')
+        except UnicodeDecodeError as ex:
+            self.decodeError = unicode(str(ex), 'utf8')
+            self.text = unicode(data, 'utf8', 'replace')
+        self.data = data
+        self._stat = (stat.st_mtime, stat.st_size)
+
+    def isUpToDate(self):
+        """File has been loaded and has not been changed since
+        """
+        if self.data is None:
+            return False
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        return (stat.st_mtime, stat.st_size) == self._stat
+
+
+def takeLoaded(filePath):
+    """Get :class:`LoadedFile` for the path, if the file has been loaded by the workers and has not been
+    changed since. Returns None otherwise.
+    Loaded file is removed from the cache
+    """
+    loadedFile = _loaded.pop(os.path.abspath(filePath), None)
+    if loadedFile is not None and loadedFile.isUpToDate():
+        return loadedFile
+    else:
+        return None
+
+
+class FileLoader(QObject):
+    """Pool of threads, which read files
+    """
+    WORKER_COUNT = 4
+
+    loaded = pyqtSignal(object)
+    """
+    loaded(loadedFile)
+
+    **Signal** emitted in the GUI thread, when a file has been read or failed to read.
+    Parameter is :class:`LoadedFile`
+    """  # pylint: disable=W0105
+
+    def __init__(self, largeFileSize, parent=None):
+        """Files bigger than largeFileSize are not read by the workers
+        """
+        QObject.__init__(self, parent)
+        self._largeFileSize = largeFileSize
+        self._queue = Queue.Queue()
+        self._threads = []
+        self._generation = 0  # Incremented on cancel(). Results of the previous generations are ignored
+        self._lock = threading.Lock()
+
+    def _startThreads(self):
+        """Start worker threads, if not started yet
+        """
+        if self._threads:
+            return
+
+        for index in range(self.WORKER_COUNT):  # pylint: disable=W0612
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        """Worker thread function
+        """
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+
+            generation, loadedFile = task
+            with self._lock:
+                if generation != self._generation:
+                    continue
+            loadedFile.load(self._largeFileSize)
+            with self._lock:
+                if generation != self._generation:
+                    continue
+            self.loaded.emit(loadedFile)  # queued to the GUI thread
+
+    def load(self, filePath):
+        """Start loading the file. :attr:`loaded` is emitted, when finished
+        """
+        self._startThreads()
+        with self._lock:
+            self._queue.put((self._generation, LoadedFile(os.path.abspath(filePath))))
+
+    def store(self, loadedFile):
+        """Keep loaded file until a document takes it with :func:`takeLoaded`
+        """
+        if loadedFile.data is not None:
+            _loaded[loadedFile.path] = loadedFile
+
+    def cancel(self):
+        """Cancel loading of all queued files. Already loaded files are dropped
+        """
+        with self._lock:
+            self._generation += 1
+        _loaded.clear()
+
+    def terminate(self):
+        """Cancel loading and stop the threads
+        """
+        self.cancel()
+        for thread in self._threads:  # pylint: disable=W0612
+            self._queue.put(None)
+        self._threads = []
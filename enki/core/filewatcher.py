@@ -0,0 +1,247 @@
+"""
+filewatcher --- Shared watcher of the opened files
+==================================================
+
+One :class:`FileWatcher` instance is created by the workspace and shared by all documents.
+See :meth:`enki.core.workspace.Workspace.fileWatcher`
+
+Watcher uses one ``QFileSystemWatcher``. Every file is watched once, even if many clients watch it.
+Directory of a watched file is watched once for all files in it. Directory notifications detect removing,
+creating and renaming of the files, therefore removed files are not polled with timers.
+Files are still watched too, because directory notifications are not emitted, when a file is modified in place.
+
+Notifications are not dispatched immediately. Changed paths are collected, and processed in one batch, when
+there were no new notifications during :attr:`FileWatcher.COALESCE_MS`, but not later than
+:attr:`FileWatcher.MAX_DELAY_MS` after the first notification, therefore a file, which is written continuously
+(i.e. a growing log), is still reported. Every changed path is stat'ed once per batch
+
+Clients, which compare file contents, hash files with :meth:`FileWatcher.hashFile`. Files are read and hashed
+by a background thread, so checking of a big file doesn't block the UI
+"""
+
+import collections
+import os
+import os.path
+import threading
+import time
+
+from PyQt4.QtCore import pyqtSignal, QFileSystemWatcher, QObject, QTimer
+
+
+class _Hasher(QObject):
+    """Worker thread, which hashes files. Results are delivered to the GUI thread
+    """
+
+    _finished = pyqtSignal()
+    """File has been hashed. Queued to the GUI thread"""
+
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, parent=None):
+        QObject.__init__(self, parent)
+        self._condition = threading.Condition()
+        self._queued = collections.deque()  # (path, newHash, callback)
+        self._done = []  # (callback, digest), not delivered yet
+        self._thread = None
+        self._terminated = False
+        self._finished.connect(self._deliver)
+
+    def hashFile(self, path, newHash, callback):
+        """Queue hashing of the file. See :meth:`FileWatcher.hashFile`
+        """
+        with self._condition:
+            self._queued.append((path, newHash, callback))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work)
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notifyAll()
+
+    def terminate(self):
+        """Drop queued files and stop the thread
+        """
+        with self._condition:
+            self._terminated = True
+            self._queued.clear()
+            self._condition.notifyAll()
+
+    def _hash(self, path, newHash):
+        """Calculate digest of the file contents. Returns None, if failed to read it
+        """
+        fileHash = newHash()
+        try:
+            with open(path, 'rb') as openedFile:
+                while True:
+                    data = openedFile.read(self.CHUNK_SIZE)
+                    if not data:
+                        break
+                    fileHash.update(data)
+        except (OSError, IOError):
+            return None
+        return fileHash.digest()
+
+    def _work(self):
+        """Worker thread function
+        """
+        while True:
+            with self._condition:
+                while not self._queued and not self._terminated:
+                    self._condition.wait()
+                if self._terminated:
+                    return
+                path, newHash, callback = self._queued.popleft()
+
+            digest = self._hash(path, newHash)
+
+            with self._condition:
+                self._done.append((callback, digest))
+            self._finished.emit()
+
+    def _deliver(self):
+        """Call callbacks of the hashed files. Called in the GUI thread
+        """
+        with self._condition:
+            done = self._done
+            self._done = []
+
+        for callback, digest in done:
+            callback(digest)
+
+
+class FileWatcher(QObject):
+    """Shared file watcher.
+
+    Clients call :meth:`watch` with a callback, which is called with ``os.stat()`` result of the file,
+    when the file might have been changed, and with None, when the file has been removed
+    """
+
+    COALESCE_MS = 200
+    """Batch is processed, when there were no notifications during this time"""
+
+    MAX_DELAY_MS = 1000
+    """Batch is processed not later than this time after the first notification, even if notifications continue"""
+
+    def __init__(self, parent=None):
+        QObject.__init__(self, parent)
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.fileChanged.connect(self._onFileChanged)
+        self._watcher.directoryChanged.connect(self._onDirectoryChanged)
+        self._callbacks = {}  # file path: list of callbacks
+        self._dirFiles = {}  # directory path: set of watched file paths in it
+        self._pending = set()  # paths, which shall be checked
+        self._deadline = None  # time.time(), when the pending batch must be processed. None, if nothing is pending
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._processPending)
+
+        self._hasher = _Hasher(self)
+
+    def del_(self):
+        """Explicitly called destructor
+        """
+        self._timer.stop()
+        self._pending.clear()
+        self._deadline = None
+        self._hasher.terminate()
+
+    def watch(self, path, callback):
+        """Start watching the file. The file might not exist yet
+        """
+        path = os.path.abspath(path)
+        callbacks = self._callbacks.setdefault(path, [])
+        callbacks.append(callback)
+        if len(callbacks) > 1:  # already watched
+            return
+
+        dirPath = os.path.dirname(path)
+        files = self._dirFiles.setdefault(dirPath, set())
+        if not files and os.path.isdir(dirPath):
+            self._watcher.addPath(dirPath)
+        files.add(path)
+
+        if os.path.isfile(path):
+            self._watcher.addPath(path)
+
+    def unwatch(self, path, callback):
+        """Stop watching the file
+        """
+        path = os.path.abspath(path)
+        callbacks = self._callbacks.get(path, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+        if callbacks:  # still watched by other clients
+            return
+
+        self._callbacks.pop(path, None)
+        self._pending.discard(path)
+        if path in self._watcher.files():
+            self._watcher.removePath(path)
+
+        dirPath = os.path.dirname(path)
+        files = self._dirFiles.get(dirPath)
+        if files is not None:
+            files.discard(path)
+            if not files:
+                del self._dirFiles[dirPath]
+                if dirPath in self._watcher.directories():
+                    self._watcher.removePath(dirPath)
+
+    def hashFile(self, path, newHash, callback):
+        """Read and hash the file in a background thread.
+        newHash is a function without arguments, which creates a hash object (i.e. ``hashlib.sha1``).
+        callback is called in the GUI thread with the digest, or with None, if failed to read the file
+        """
+        self._hasher.hashFile(path, newHash, callback)
+
+    def _onFileChanged(self, path):
+        """QFileSystemWatcher notification. Remember the path
+        """
+        self._pending.add(os.path.abspath(path))
+        self._schedule()
+
+    def _onDirectoryChanged(self, dirPath):
+        """QFileSystemWatcher notification. Check all watched files in the directory
+        """
+        self._pending.update(self._dirFiles.get(os.path.abspath(dirPath), ()))
+        self._schedule()
+
+    def _schedule(self):
+        """Notification received. Restart the timer, but don't postpone the batch after the deadline
+        """
+        now = time.time()
+        if self._deadline is None:
+            self._deadline = now + self.MAX_DELAY_MS / 1000.
+        leftMs = int((self._deadline - now) * 1000)
+        self._timer.start(max(0, min(self.COALESCE_MS, leftMs)))
+
+    def _processPending(self):
+        """Stat changed files and call the callbacks
+        """
+        pending = self._pending
+        self._pending = set()
+        self._deadline = None
+
+        watchedFiles = set(self._watcher.files())
+        watchedDirs = set(self._watcher.directories())
+        for path in sorted(pending):
+            callbacks = self._callbacks.get(path)
+            if not callbacks:
+                continue
+
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stat = None
+
+            if stat is not None and not path in watchedFiles:  # created, restored or replaced with rename
+                self._watcher.addPath(path)
+                watchedFiles.add(path)
+
+            dirPath = os.path.dirname(path)
+            if not dirPath in watchedDirs and os.path.isdir(dirPath):  # directory has been recreated
+                self._watcher.addPath(dirPath)
+                watchedDirs.add(dirPath)
+
+            for callback in callbacks[:]:  # callback might unwatch the file
+                callback(stat)
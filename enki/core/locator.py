@@ -427,6 +427,15 @@ class _CompleterConstructorThread(threading.Thread):
 class Locator(QDialog):
     """Locator widget and implementation
     """
+
+    aboutToShow = pyqtSignal()
+    """
+    aboutToShow()
+
+    **Signal** emitted, when the Locator is about to be shown. Commands, added by the handlers, are available
+    in the shown Locator
+    """  # pylint: disable=W0105
+
     def __init__(self, *args):
         QDialog.__init__(self, *args)
         
@@ -631,6 +640,7 @@ class Locator(QDialog):
             curDir = '?'
         
         self.setWindowTitle(curDir)
+        self.aboutToShow.emit()
 
         self._edit.setText('')
         self._updateCompletion()
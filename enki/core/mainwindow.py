@@ -98,6 +98,7 @@ class MainWindow(QMainWindow):
         self._queuedMessageToolBar = None
         self._createdMenuPathes = []
         self._createdActions = []
+        self._stateRestored = False
 
         self.setUnifiedTitleAndToolBarOnMac( True )
         self.setIconSize( QSize( 16, 16 ) )
@@ -367,12 +368,20 @@ class MainWindow(QMainWindow):
                                     self.tr( "Cannot read file '%s'\nError: %s" % (path, error)))
         
         if state is not None:
-            self.restoreState(state)
+            self._stateRestored = self.restoreState(state)
         else:  # not state, first start
             self.showMaximized()
             for dock in self.findChildren(DockWidget):
                 dock.show()
         
+    def restoreLateDockWidget(self, dock):
+        """Restore state of the dock, which has been created after :meth:`loadState`.
+        i.e. by a deferred plugin. See :mod:`enki.core.pluginloader`
+        """
+        if not self.restoreDockWidget(dock) and \
+           not self._stateRestored:  # first start, show it as loadState() does
+            dock.show()
+        
     def _saveGeometry(self):
         """Save window geometry to the config file
         """
@@ -407,12 +416,14 @@ class MainWindow(QMainWindow):
         Open dropt files
         """
         if event.mimeData().hasUrls():
+            localFiles = []
             for url in event.mimeData().urls():
                 localFile = url.toLocalFile()
                 if os.path.isfile(localFile):
-                    core.workspace().openFile(localFile)
+                    localFiles.append(localFile)
                 elif os.path.isdir(localFile):
                     self.directoryDropt.emit(localFile)
+            core.workspace().openFiles(localFiles)
         
         # default handler
         QMainWindow.dropEvent(self, event)
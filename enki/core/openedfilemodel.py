@@ -19,6 +19,7 @@ from PyQt4.QtCore import QAbstractItemModel, \
                          Qt, \
                          QVariant
 from PyQt4.QtGui import QAbstractItemView, QAction, QActionGroup, \
+                        QFont, \
                         QIcon, \
                         QMenu, \
                         QTreeView
@@ -85,7 +86,7 @@ class _OpenedFileModel(QAbstractItemModel):
         if docPath is None:
             return 'untitled'
         
-        documentPathes = [d.filePath() for d in self._workspace.documents()]
+        documentPathes = [d.filePath() for d in self._workspace.documents(includePlaceholders=True)]
 
         uniquePath = os.path.basename(docPath)
         leftPath = os.path.dirname(docPath)
@@ -115,6 +116,10 @@ class _OpenedFileModel(QAbstractItemModel):
             return self._uniqueDocumentPath(document)
         elif role == Qt.ToolTipRole:
             return document.modelToolTip()
+        elif role == Qt.FontRole and document.isBeingSaved():
+            font = QFont()
+            font.setItalic(True)
+            return font
         else:
             return QVariant()
     
@@ -284,6 +289,14 @@ class _OpenedFileModel(QAbstractItemModel):
     def _onDocumentOpened(self, document ):
         """New document opened at workspace. Handle it
         """
+        if document in self._workspace.sortedDocuments:  # placeholder has been replaced, see replaceDocument()
+            return
+        self.addDocument(document)
+
+    def addDocument(self, document):
+        """Add document to the list.
+        Used by the workspace for documents, which are listed, but not loaded yet
+        """
         assert( not document in self._workspace.sortedDocuments )
         self._workspace.sortedDocuments.append( document )
         self.sortDocuments()
@@ -300,9 +313,26 @@ class _OpenedFileModel(QAbstractItemModel):
         index = self.documentIndex( document_ )
         self.dataChanged.emit( index, index )
     
+    def replaceDocument(self, oldDocument, newDocument):
+        """Replace document with other one in the same position.
+        Used by the workspace, when not loaded document is loaded
+        """
+        row = self._workspace.sortedDocuments.index( oldDocument )
+        self._workspace.sortedDocuments[row] = newDocument
+        newDocument.documentDataChanged.connect(self._onDocumentDataChanged)
+        
+        self.changePersistentIndex(self.createIndex( row, 0, oldDocument ), self.createIndex( row, 0, newDocument ))
+        index = self.documentIndex( newDocument )
+        self.dataChanged.emit( index, index )
+
     def _onDocumentClosed(self, document ):
         """Document has been closed. Unhandle it
         """
+        self.removeDocument(document)
+
+    def removeDocument(self, document):
+        """Remove document from the list
+        """
         index = self._workspace.sortedDocuments.index( document )
         
         if  index == -1 :
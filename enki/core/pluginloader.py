@@ -0,0 +1,168 @@
+"""
+pluginloader --- Deferred and on-demand loading of plugins
+==========================================================
+
+Plugins are listed in the ``config/plugins.json`` manifest. Activation of a plugin is one of
+
+* ``startup`` - plugin is loaded by :meth:`enki.core.core.Core.init`, before the main window is shown.
+  Plugins, which are not listed in the manifest, are loaded on startup
+* ``deferred`` - plugin is loaded after the main window has been painted first time.
+  One plugin is loaded per event loop iteration, so the UI stays responsive
+* ``onDemand`` - plugin is loaded only when one of its triggers fires
+
+Deferred plugin is loaded earlier, if one of its triggers fires before it is loaded. Triggers are
+
+* ``language:<name>`` - document with the highlighting language is opened or activated, or the language of
+  a document has been changed
+* ``suffix:<suffix>`` - file, which name ends with the suffix, is opened or activated
+* ``menu:<path>`` - main menu with the path is about to be shown. i.e. ``menu:mHelp``
+* ``locator`` - the Locator is about to be shown. Plugin, which adds Locator commands, must be loaded before
+
+Plugin, loaded by a trigger, is created while the workspace emits a signal. It doesn't receive this signal,
+therefore the plugin shall check the current state in the constructor.
+
+State of the docks, created by the not startup plugins, is restored with
+:meth:`enki.core.mainwindow.MainWindow.restoreLateDockWidget`
+"""
+
+import os.path
+
+from PyQt4.QtCore import QEvent, QObject, QTimer
+from PyQt4.QtGui import QDockWidget
+
+from enki.core.core import core, DATA_FILES_PATH
+import enki.core.json_wrapper
+
+_MANIFEST_PATH = os.path.join(DATA_FILES_PATH, 'config/plugins.json')
+
+STARTUP = 'startup'
+DEFERRED = 'deferred'
+ON_DEMAND = 'onDemand'
+
+
+class PluginLoader(QObject):
+    """Loads not startup plugins, when it is time.
+    Instance is created by :class:`enki.core.core.Core`
+
+    loadFunction is called with the plugin name, when it shall be loaded
+    """
+
+    DEFERRED_FALLBACK_MS = 3000
+    """Deferred plugins are loaded after this time, if the main window has not been painted (i.e. minimized)"""
+
+    def __init__(self, loadFunction, parent=None):
+        QObject.__init__(self, parent)
+        self._loadFunction = loadFunction
+        self._manifest = enki.core.json_wrapper.load(_MANIFEST_PATH, 'plugin manifest', {})
+        self._pending = set()  # names of not loaded plugins
+        self._deferred = []  # names of deferred plugins, in order of loading
+        self._triggers = {}  # trigger: list of plugin names
+        self._watchingPaint = False
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._loadNextDeferred)
+
+    def del_(self):
+        """Explicitly called destructor
+        """
+        self._timer.stop()
+        if self._watchingPaint:
+            core.mainWindow().removeEventFilter(self)
+            self._watchingPaint = False
+        self._pending.clear()
+
+    def activation(self, name):
+        """Get activation of the plugin. :data:`STARTUP`, :data:`DEFERRED` or :data:`ON_DEMAND`
+        """
+        return self._manifest.get(name, {}).get('activation', STARTUP)
+
+    def add(self, name):
+        """Register not startup plugin. It will be loaded later
+        """
+        entry = self._manifest.get(name, {})
+        self._pending.add(name)
+        if self.activation(name) == DEFERRED:
+            self._deferred.append(name)
+        for trigger in entry.get('triggers', []):
+            self._triggers.setdefault(trigger, []).append(name)
+
+    def start(self):
+        """Startup plugins have been loaded. Start watching triggers and waiting for the first paint
+        """
+        core.workspace().documentOpened.connect(self._onDocumentEvent)
+        core.workspace().currentDocumentChanged.connect(lambda old, new: self._onDocumentEvent(new))
+        core.workspace().languageChanged.connect(lambda document, old, new: self._onDocumentEvent(document))
+
+        for trigger in self._triggers:
+            if trigger.startswith('menu:'):
+                menu = core.actionManager().menu(trigger[len('menu:'):])
+                if menu is not None:
+                    menu.aboutToShow.connect(lambda trigger=trigger: self._fire(trigger))
+        if 'locator' in self._triggers:
+            core.locator().aboutToShow.connect(lambda: self._fire('locator'))
+
+        if self._deferred:
+            core.mainWindow().installEventFilter(self)
+            self._watchingPaint = True
+            self._timer.start(self.DEFERRED_FALLBACK_MS)
+
+    def eventFilter(self, obj, event):
+        """QObject.eventFilter implementation. Waits for the first paint of the main window
+        """
+        if event.type() == QEvent.Paint:
+            obj.removeEventFilter(self)
+            self._watchingPaint = False
+            self._timer.start(0)  # after the paint has been finished
+        return False
+
+    def _loadNextDeferred(self):
+        """Load next deferred plugin
+        """
+        if self._watchingPaint:  # fallback timer, the window hasn't been painted
+            core.mainWindow().removeEventFilter(self)
+            self._watchingPaint = False
+
+        while self._deferred:
+            name = self._deferred.pop(0)
+            if name in self._pending:
+                self._load(name)
+                break
+
+        if self._deferred:
+            self._timer.start(0)
+
+    def _onDocumentEvent(self, document):
+        """Document opened, activated or its language changed. Check triggers
+        """
+        if document is None or not self._pending:
+            return
+
+        self._fire('language:%s' % document.language())
+
+        fileName = document.fileName()
+        if fileName is not None:
+            for trigger in self._triggers.keys():
+                if trigger.startswith('suffix:') and \
+                   fileName.endswith(trigger[len('suffix:'):]):
+                    self._fire(trigger)
+
+    def _fire(self, trigger):
+        """Load plugins of the trigger, if not loaded yet
+        """
+        for name in self._triggers.pop(trigger, []):
+            if name in self._pending:
+                self._load(name)
+
+    def _load(self, name):
+        """Load the plugin and restore state of its docks
+        """
+        self._pending.discard(name)
+        mainWindow = core.mainWindow()
+        docks = mainWindow.findChildren(QDockWidget)
+
+        self._loadFunction(name)
+
+        for dock in mainWindow.findChildren(QDockWidget):
+            if not dock in docks:
+                mainWindow.restoreLateDockWidget(dock)
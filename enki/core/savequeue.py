@@ -0,0 +1,171 @@
+"""
+savequeue --- Writing files by a background thread
+==================================================
+
+Documents are written by a worker thread, so saving of many big files, or saving to a slow network file system,
+doesn't block the UI. The text is converted and encoded by the GUI thread, the worker only writes the data.
+See :meth:`enki.core.abstractdocument.AbstractDocument.saveFile`
+
+Saves of the same file are coalesced. If a file is saved again, while the previous save is queued and not
+started yet, only the latest data is written.
+
+Files are written with :func:`enki.lib.atomicwrite.writeFileAtomically`
+"""
+
+import collections
+import os.path
+import threading
+import time
+
+from PyQt4.QtCore import pyqtSignal, QObject
+
+from enki.lib.atomicwrite import currentUmask, writeFileAtomically
+
+
+class SaveTask:
+    """Save of a file.
+
+    * path - path of the file
+    * size - count of written bytes
+    * digest - digest of the written data, calculated with the hash object, passed to :meth:`SaveQueue.save`
+    * error - error message, if failed to write the file
+    * superseded - True, if newer save of the same file was pending, when the task has been delivered.
+      The file is going to be written again
+    * startTime - time.time(), when the save has been requested
+    """
+    def __init__(self, path, chunks, fsyncPolicy, fileHash, umask, callback):
+        self.path = path
+        self.size = 0
+        self.digest = None
+        self.error = None
+        self.superseded = False
+        self.startTime = time.time()
+        self._chunks = chunks
+        self._fsyncPolicy = fsyncPolicy
+        self._fileHash = fileHash
+        self._umask = umask
+        self._callback = callback
+
+    def write(self):
+        """Write the file. Called by the worker thread
+        """
+        try:
+            self.size = writeFileAtomically(self.path, self._chunks, self._fsyncPolicy, self._umask,
+                                            self._fileHash)
+            self.digest = self._fileHash.digest()
+        except (OSError, IOError) as ex:
+            self.error = unicode(str(ex), 'utf8')
+        self._chunks = None
+
+    def deliver(self):
+        """Call the callback. Called by the GUI thread
+        """
+        self._callback(self)
+
+
+class SaveQueue(QObject):
+    """Queue of files to write and a worker thread, which writes them.
+    Instance is created by the workspace. See :meth:`enki.core.workspace.Workspace.saveQueue`
+    """
+
+    _finished = pyqtSignal()
+    """Task has been finished. Queued to the GUI thread"""
+
+    def __init__(self, parent=None):
+        QObject.__init__(self, parent)
+        self._condition = threading.Condition()
+        self._queued = collections.OrderedDict()  # path: SaveTask. Not started tasks
+        self._running = None  # SaveTask, which is being written
+        self._done = []  # finished, but not delivered tasks
+        self._thread = None
+        self._terminated = False
+        self._umask = currentUmask()  # read once by the GUI thread, before the worker is started
+        self._finished.connect(self._deliver)
+
+    def save(self, path, chunks, fsyncPolicy, fileHash, callback):
+        """Queue writing of the data chunks to the file.
+        callback is called in the GUI thread with :class:`SaveTask`, when finished.
+        If the file is already queued, previous not started save is dropped, its callback is not called
+        """
+        path = os.path.abspath(path)
+        task = SaveTask(path, chunks, fsyncPolicy, fileHash, self._umask, callback)
+        with self._condition:
+            self._queued.pop(path, None)
+            self._queued[path] = task
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work)
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notifyAll()
+        return task
+
+    def umask(self):
+        """Process umask, read when the queue has been created. Shall be passed to
+        :func:`enki.lib.atomicwrite.writeFileAtomically`, if files are written by other threads
+        """
+        return self._umask
+
+    def _isPending(self, path):
+        """File is queued or is being written. Must be called with locked condition
+        """
+        return path in self._queued or \
+               (self._running is not None and self._running.path == path)
+
+    def isPending(self, path):
+        """File is queued or is being written
+        """
+        with self._condition:
+            return self._isPending(os.path.abspath(path))
+
+    def wait(self, path=None):
+        """Block until the file is written and deliver finished tasks.
+        All queued files are waited, if path is None
+        """
+        if path is not None:
+            path = os.path.abspath(path)
+        with self._condition:
+            while (self._queued or self._running is not None) if path is None else self._isPending(path):
+                self._condition.wait()
+        self._deliver()
+
+    def terminate(self):
+        """Write all queued files and stop the thread
+        """
+        self.wait()
+        with self._condition:
+            self._terminated = True
+            self._condition.notifyAll()
+        self._thread = None
+
+    def _work(self):
+        """Worker thread function
+        """
+        while True:
+            with self._condition:
+                while not self._queued and not self._terminated:
+                    self._condition.wait()
+                if not self._queued:  # terminated
+                    return
+                path, task = self._queued.popitem(last=False)  # pylint: disable=W0612
+                self._running = task
+
+            task.write()
+
+            with self._condition:
+                self._running = None
+                self._done.append(task)
+                self._condition.notifyAll()
+            self._finished.emit()
+
+    def _deliver(self):
+        """Call callbacks of the finished tasks. Called in the GUI thread
+        """
+        with self._condition:
+            done = self._done
+            self._done = []
+            for index, task in enumerate(done):
+                task.superseded = self._isPending(task.path) or \
+                                  task.path in [later.path for later in done[index + 1:]]
+
+        for task in done:
+            task.deliver()
@@ -0,0 +1,259 @@
+"""
+startprofiler --- Startup time instrumentation
+==============================================
+
+Used, when Enki is started with ``--profile`` key. For developers.
+
+Profiler records
+
+* steps of the initialization. See :meth:`StartProfiler.stepDone`
+* time of every module import. Imports are measured with a hook, installed to ``__builtin__.__import__``
+* time of construction of every plugin
+* milestones, such as first paint of the main window and restored session. See :meth:`StartProfiler.mark`
+
+Results are written as a JSON report and as a file with collapsed stacks, which can be converted to a
+flame graph with ``flamegraph.pl`` or opened with speedscope. Values in the collapsed stacks are microseconds.
+
+Module doesn't import Qt at the module level, because the profiler is created before the dependencies are checked.
+"""
+
+import __builtin__
+import json
+import sys
+import thread
+import time
+
+import enki.core.defines
+
+
+class _Span:
+    """Measured period of time. Spans are nested
+    """
+    def __init__(self, name, category, startTime):
+        self.name = name
+        self.category = category  # 'step', 'import', 'plugin' or 'span'
+        self.start = startTime
+        self.end = None
+        self.children = []
+
+    def duration(self):
+        """Duration in seconds
+        """
+        return self.end - self.start
+
+    def selfDuration(self):
+        """Duration, excluding durations of the children
+        """
+        return self.duration() - sum([child.duration() for child in self.children])
+
+
+class StartProfiler:
+    """Startup profiler.
+    Created by ``main()``, passed to :meth:`enki.core.core.Core.init`
+    """
+    def __init__(self):
+        self._startTime = time.time()
+        self._root = _Span('enki', 'root', self._startTime)
+        self._stack = [self._root]
+        self._steps = []  # (description, time)
+        self._milestones = []  # (name, time)
+        self._mainThreadId = thread.get_ident()
+        self._originalImport = None
+        self._beginStep()
+
+    def installImportHook(self):
+        """Start measuring imports
+        """
+        if self._originalImport is None:
+            self._originalImport = __builtin__.__import__
+            __builtin__.__import__ = self._import
+
+    def removeImportHook(self):
+        """Stop measuring imports
+        """
+        if self._originalImport is not None:
+            __builtin__.__import__ = self._originalImport
+            self._originalImport = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=None, level=-1):  # pylint: disable=W0622
+        """__import__ replacement. Measures imports of not yet loaded modules, made by the GUI thread
+        """
+        if thread.get_ident() != self._mainThreadId:
+            return self._originalImport(name, globals, locals, fromlist, level)
+
+        modulesCount = len(sys.modules)
+        self.beginSpan(name, 'import')
+        try:
+            return self._originalImport(name, globals, locals, fromlist, level)
+        finally:
+            self.endSpan()
+            if len(sys.modules) == modulesCount:  # already imported, nothing has been loaded
+                self._stack[-1].children.pop()
+
+    def _beginStep(self):
+        """Start new step. Step name is set by stepDone()
+        """
+        step = _Span(None, 'step', time.time())
+        self._root.children.append(step)
+        self._stack = [self._root, step]
+
+    def stepDone(self, description):
+        """Initialization step has been finished
+        """
+        now = time.time()
+        while len(self._stack) > 2:  # not closed spans
+            self.endSpan()
+        step = self._stack[-1]
+        step.name = description.strip()
+        step.end = now
+        self._steps.append((description, now))
+        self._beginStep()
+
+    def beginSpan(self, name, category='span'):
+        """Start measuring of a nested period of time. Call :meth:`endSpan` when finished
+        """
+        span = _Span(name, category, time.time())
+        self._stack[-1].children.append(span)
+        self._stack.append(span)
+        return span
+
+    def endSpan(self):
+        """Finish the span, started by the last :meth:`beginSpan` call
+        """
+        span = self._stack.pop()
+        span.end = time.time()
+
+    def mark(self, name):
+        """Remember time of a milestone, i.e. first paint of the main window
+        """
+        self._milestones.append((name, time.time()))
+
+    def watchFirstPaint(self, widget, callback=None):
+        """Mark 'First paint' milestone, when the widget is painted first time.
+        callback without arguments is called after it
+        """
+        from PyQt4.QtCore import QEvent, QObject  # lazy import, Qt is not checked yet, when the module is imported
+
+        profiler = self
+
+        class _PaintWatcher(QObject):
+            """Event filter, which waits for the first paint event
+            """
+            def eventFilter(self, obj, event):
+                """QObject.eventFilter implementation
+                """
+                if event.type() == QEvent.Paint:
+                    obj.removeEventFilter(self)
+                    profiler.mark('First paint')
+                    if callback is not None:
+                        callback()
+                return False
+
+        self._paintWatcher = _PaintWatcher()  # pylint: disable=W0201
+        widget.installEventFilter(self._paintWatcher)
+
+    def finish(self):
+        """Stop profiling. Last not finished step is dropped
+        """
+        self.removeImportHook()
+        while len(self._stack) > 2:
+            self.endSpan()
+        if self._root.children and self._root.children[-1].name is None:
+            self._root.children.pop()
+        self._root.end = time.time()
+
+    @staticmethod
+    def _ms(seconds):
+        """Convert seconds to rounded milliseconds
+        """
+        return round(seconds * 1000, 3)
+
+    def _walk(self, span, stack):
+        """Walk the spans tree. Generator. Yields (span, list of names of parent spans)
+        """
+        for child in span.children:
+            if child.end is None:
+                continue
+            yield child, stack
+            for item in self._walk(child, stack + [child.name]):
+                yield item
+
+    def report(self):
+        """Get report as a dictionary, which can be serialized to JSON
+        """
+        imports = {}  # name: [cumulative, self]
+        plugins = []
+        for span, parents in self._walk(self._root, []):
+            if span.category == 'import':
+                if span.name in parents:  # recursive import, already counted
+                    continue
+                times = imports.setdefault(span.name, [0., 0.])
+                times[0] += span.duration()
+                times[1] += span.selfDuration()
+            elif span.category == 'plugin':
+                plugins.append({'name': span.name, 'ms': self._ms(span.duration())})
+
+        steps = []
+        prevTime = self._startTime
+        for description, stepTime in self._steps:
+            steps.append({'name': description.strip(), 'ms': self._ms(stepTime - prevTime)})
+            prevTime = stepTime
+
+        importList = [{'module': name, 'cumulativeMs': self._ms(cumulative), 'selfMs': self._ms(own)} \
+                        for name, (cumulative, own) in imports.items()]
+        importList.sort(key=lambda item: item['cumulativeMs'], reverse=True)
+
+        return {'version': enki.core.defines.PACKAGE_VERSION,
+                'totalMs': self._ms(self._root.duration()),
+                'steps': steps,
+                'milestones': [{'name': name, 'ms': self._ms(markTime - self._startTime)} \
+                                    for name, markTime in self._milestones],
+                'imports': importList,
+                'plugins': plugins}
+
+    def collapsedStacks(self):
+        """Get lines of the flame graph in the collapsed stacks format: ``frame;frame;frame microseconds``
+        """
+        stacks = {}
+        for span, parents in self._walk(self._root, []):
+            names = [name.replace(';', ',') for name in parents + [span.name]]
+            key = ';'.join(names)
+            stacks[key] = stacks.get(key, 0) + span.selfDuration()
+
+        return ['%s %d' % (stack, int(duration * 1000000)) \
+                    for stack, duration in sorted(stacks.items()) \
+                        if duration > 0]
+
+    def writeReports(self, pathPrefix):
+        """Write ``pathPrefix.json`` and ``pathPrefix.folded`` files.
+        Returns list of written paths
+        """
+        jsonPath = pathPrefix + '.json'
+        with open(jsonPath, 'w') as jsonFile:
+            json.dump(self.report(), jsonFile, indent=4)
+
+        foldedPath = pathPrefix + '.folded'
+        with open(foldedPath, 'w') as foldedFile:
+            for line in self.collapsedStacks():
+                foldedFile.write(line.encode('utf8') + '\n')
+
+        return [jsonPath, foldedPath]
+
+    def printInfo(self):
+        """Print steps, milestones and the slowest imports
+        """
+        report = self.report()
+        prevTime = self._startTime
+        for description, stepTime in self._steps:
+            print '%s: %d' % (description.ljust(30), self._ms(stepTime - prevTime))
+            prevTime = stepTime
+        print 'Total                         : %d' % report['totalMs']
+
+        print
+        for milestone in report['milestones']:
+            print '%s: %d' % (milestone['name'].ljust(30), milestone['ms'])
+
+        print
+        print 'Slowest imports (cumulative, self):'
+        for item in report['imports'][:10]:
+            print '%s: %d %d' % (item['module'].ljust(30), item['cumulativeMs'], item['selfMs'])
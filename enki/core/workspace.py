@@ -25,12 +25,53 @@ from PyQt4.QtGui import QApplication, \
                         QFileDialog, \
                         QListWidgetItem, \
                         QMessageBox, \
-                        QStackedWidget
+                        QStackedWidget, \
+                        QWidget
 from PyQt4.QtCore import pyqtSignal, QEvent, Qt  # pylint: disable=E0611
 
 from enki.core.core import core, DATA_FILES_PATH
 import enki.core.openedfilemodel
 from enki.core.abstractdocument import AbstractDocument
+from enki.core.fileloader import FileLoader
+from enki.core.filewatcher import FileWatcher
+from enki.core.savequeue import SaveQueue
+
+
+class _OpenRequest:
+    """Files, passed to one :meth:`Workspace.openFiles` call
+    """
+    def __init__(self, filePaths, callback):
+        self.pending = list(filePaths)  # not opened yet, in the order of opening
+        self.ready = set()  # loaded, but not opened yet, because previous files are not loaded
+        self.errors = {}  # file path: error message
+        self.documents = []
+        self.callback = callback
+
+
+class _PlaceholderDocument(AbstractDocument):
+    """Document, which is listed in the opened files list, but not loaded yet.
+    The file is not read and not watched. Real document is created, when the placeholder is activated.
+    See :meth:`Workspace.addPlaceholders`
+    """
+    def __init__(self, filePath):
+        QWidget.__init__(self)  # AbstractDocument.__init__() is not called, it creates the file watcher
+        self._neverSaved = False
+        self._filePath = filePath
+        self._externallyRemoved = False
+        self._externallyModified = False
+        self._saveState = None
+        self._saveError = None
+        self._largeFile = False
+
+    def del_(self):
+        """Explicytly called destructor
+        """
+        pass
+
+    def isModified(self):
+        """Placeholder is never modified
+        """
+        return False
 
 
 class _UISaveFiles(QDialog):
@@ -182,6 +223,11 @@ class Workspace(QStackedWidget):
         self.sortedDocuments = []  # not protected, because available for OpenedFileModel
         self._oldCurrentDocument = None
         self._textEditorClass = None
+        self._openRequests = []  # _OpenRequest s, in order of openFiles() calls
+        self._fileLoader = FileLoader(AbstractDocument.LARGE_FILE_SIZE, self)
+        self._fileLoader.loaded.connect(self._onFileLoaded)
+        self._fileWatcher = FileWatcher(self)
+        self._saveQueue = SaveQueue(self)
         
         # create opened files explorer
         # openedFileExplorer is not protected, because it is available for OpenedFileModel
@@ -196,6 +242,10 @@ class Workspace(QStackedWidget):
     def del_(self):
         """Terminate workspace. Called by the core to clear actions
         """
+        self.cancelOpening()
+        self._fileLoader.terminate()
+        self._fileWatcher.del_()
+        self._saveQueue.terminate()
         self.openedFileExplorer.del_()
     
     def _mainWindow(self):
@@ -227,6 +277,16 @@ class Workspace(QStackedWidget):
             name = self._mainWindow().defaultTitle()
         self._mainWindow().setWindowTitle(name)
 
+    def fileWatcher(self):
+        """Get :class:`enki.core.filewatcher.FileWatcher` instance, which watches files of the opened documents
+        """
+        return self._fileWatcher
+
+    def saveQueue(self):
+        """Get :class:`enki.core.savequeue.SaveQueue` instance, which writes files of the documents
+        """
+        return self._saveQueue
+
     def setTextEditorClass(self, newEditorClass):
         """Set text editor, which is used for open textual documents.
         New editor would be used for newly opened textual documents.
@@ -290,18 +350,21 @@ class Workspace(QStackedWidget):
     def setCurrentDocument( self, document ):
         """Select active (focused and visible) document form list of opened documents
         """
-        self.setCurrentWidget( document )
+        if isinstance(document, _PlaceholderDocument):
+            self._loadPlaceholder(document)
+        else:
+            self.setCurrentWidget( document )
     
     def _activeDocumentByIndex(self, index):
         """Activate document by it's index in the list of documents
         """
-        document = self.documents()[index]
+        document = self.sortedDocuments[index]
         self.setCurrentDocument(document)
         
     def activateNextDocument(self):
         """Activate next document in the list
         """
-        documents = self.documents()
+        documents = self.sortedDocuments
         
         curIndex = documents.index(self.currentDocument())
         nextIndex = (curIndex + 1) % len(documents)
@@ -311,7 +374,7 @@ class Workspace(QStackedWidget):
     def activatePreviousDocument(self):
         """Activate previous document in the list
         """
-        documents = self.documents()
+        documents = self.sortedDocuments
         
         curIndex = documents.index(self.currentDocument())
         prevIndex = (curIndex - 1 + len(documents)) % len(documents)
@@ -390,7 +453,8 @@ class Workspace(QStackedWidget):
         
         Returns document, if opened, None otherwise
         
-        Opens modal dialog, if failed to open the file
+        Opens modal dialog, if failed to open the file.
+        File is read by the GUI thread. Use :meth:`openFiles` to open many files without blocking the UI
         """
         # Close 'untitled'
         if len(self.documents()) == 1 and \
@@ -406,6 +470,20 @@ class Workspace(QStackedWidget):
             self.setCurrentDocument( alreadyOpenedDocument )
             return alreadyOpenedDocument
 
+        placeholder = self._findPlaceholder(filePath)
+        if placeholder is not None:
+            return self._loadPlaceholder(placeholder)
+
+        document = self._createDocument(filePath)
+        if document is not None:
+            self._handleDocument( document )
+        
+        return document
+    
+    def _createDocument(self, filePath):
+        """Create document for the file using suitable plugin, or textual editor.
+        Returns the document, or None, if failed. Shows modal dialog, if failed
+        """
         documentType = None  # TODO detect document type, choose editor
         
         # select editor for the file
@@ -431,21 +509,127 @@ class Workspace(QStackedWidget):
         finally:
             QApplication.restoreOverrideCursor()
 
-        self._handleDocument( document )
-        
         if not os.access(filePath, os.W_OK):
             core.mainWindow().appendMessage( \
                         self.tr( "File '%s' is not writable" % filePath), 4000) # todo fix
         
         return document
     
+    def addPlaceholders(self, filePaths):
+        """Add files to the opened files list without opening it.
+        File is read and the document is created, when it is activated first time.
+        Used for restoring big sessions quickly.
+
+        Placeholders are not returned by :meth:`documents`, signals are not emitted for it.
+        Already opened files are skipped
+        """
+        for filePath in filePaths:
+            filePath = os.path.abspath(filePath)
+            if self.findDocumentForPath(filePath) is None and \
+               self._findPlaceholder(filePath) is None:
+                self.openedFileExplorer.model.addDocument(_PlaceholderDocument(filePath))
+
+    def _findPlaceholder(self, filePath):
+        """Find not loaded document for the path. Returns None, if not found
+        """
+        for document in self.sortedDocuments:
+            if isinstance(document, _PlaceholderDocument) and \
+               self._isSameFile(filePath, document.filePath()):
+                return document
+        return None
+
+    def _loadPlaceholder(self, placeholder):
+        """Open the file of the placeholder and replace the placeholder with the document.
+        Placeholder is removed, if failed to open the file.
+        Returns the document, or None, if failed
+        """
+        document = self._createDocument(placeholder.filePath())
+        if document is None:
+            self._removePlaceholder(placeholder)
+            return None
+
+        # keep the position in the list, documentOpened is ignored by the model for listed documents
+        self.openedFileExplorer.model.replaceDocument(placeholder, document)
+        placeholder.deleteLater()
+        self._handleDocument( document )
+        return document
+
+    def _removePlaceholder(self, placeholder):
+        """Remove not loaded document from the opened files list
+        """
+        self.openedFileExplorer.model.removeDocument(placeholder)
+        placeholder.deleteLater()
+
+    def openFiles(self, filePaths, callback=None):
+        """Open files asynchronously.
+        
+        Files are read and decoded by the threads of :class:`enki.core.fileloader.FileLoader`, UI is not blocked.
+        Documents are created by :meth:`openFile` in the order of filePaths, when the files have been read.
+        Errors are reported to the main window messages, not by modal dialogs.
+        
+        callback is called with list of opened documents, when all files have been processed.
+        See :meth:`cancelOpening`
+        """
+        filePaths = [os.path.abspath(filePath) for filePath in filePaths]  # current directory might change
+        request = _OpenRequest(filePaths, callback)
+        for filePath in filePaths:
+            if self.findDocumentForPath(filePath) is not None:
+                request.ready.add(filePath)
+            else:
+                self._fileLoader.load(filePath)
+        
+        self._openRequests.append(request)
+        self._processOpenRequests()
+    
+    def cancelOpening(self):
+        """Cancel opening of files, started with :meth:`openFiles`.
+        Already opened documents are not closed. Callbacks are not called
+        """
+        self._fileLoader.cancel()
+        self._openRequests = []
+    
+    def _onFileLoaded(self, loadedFile):
+        """File has been read by the file loader
+        """
+        for request in self._openRequests:
+            if loadedFile.path in request.pending:
+                request.ready.add(loadedFile.path)
+                if loadedFile.error is not None:
+                    request.errors[loadedFile.path] = loadedFile.error
+        
+        self._fileLoader.store(loadedFile)
+        self._processOpenRequests()
+    
+    def _processOpenRequests(self):
+        """Open loaded files in the order of requests
+        """
+        while self._openRequests:
+            request = self._openRequests[0]
+            while request.pending and request.pending[0] in request.ready:
+                filePath = request.pending.pop(0)
+                if filePath in request.errors:
+                    core.mainWindow().appendMessage( \
+                            self.tr("Failed to open file '%s': %s" % (filePath, request.errors[filePath])))
+                    continue
+                
+                document = self.openFile(filePath)
+                if document is not None:
+                    request.documents.append(document)
+            
+            if request.pending:  # wait for the next file
+                return
+            
+            self._openRequests.pop(0)
+            if request.callback is not None:
+                request.callback(request.documents)
+
     def findDocumentForPath(self, filePath):
         """Try to find document for path.
         Fimilar to open(), but doesn't open file, if it is not opened
         On Unix may return file, for which path is not equal, if soft or hards links are used
         Return None, if not found
         """
-        for document in self.sortedDocuments:
+        for document in self.documents():
             if self._isSameFile(filePath, document.filePath()):
                 return document
     
@@ -466,14 +650,25 @@ class Workspace(QStackedWidget):
         document.setFocus()
         return document
     
-    def documents(self):
+    def documents(self, includePlaceholders=False):
         """Get list of opened documents (:class:`enki.core.abstractdocument.AbstractDocument` instances)
+
+        Files, which are listed, but not loaded yet (see :meth:`addPlaceholders`), are included only if
+        includePlaceholders is True. Only filePath(), fileName() and isModified() are available for such documents
         """
-        return self.sortedDocuments
+        if includePlaceholders:
+            return self.sortedDocuments
+        else:
+            return [document for document in self.sortedDocuments \
+                        if not isinstance(document, _PlaceholderDocument)]
     
     def _doCloseDocument(self, document):
         """Closes document, even if it is modified
         """
+        if isinstance(document, _PlaceholderDocument):
+            self._removePlaceholder(document)
+            return
+
         if len(self.sortedDocuments) > 1:  # not the last document
             if document == self.sortedDocuments[-1]:  # the last document
                 self.activatePreviousDocument()
@@ -488,6 +683,9 @@ class Workspace(QStackedWidget):
     def closeDocument( self, document):
         """Close opened file, remove document from workspace and delete the widget
         """
+        if document.isBeingSaved():  # don't ask to save the file, which is being saved
+            self._saveQueue.wait()
+        
         if document.isModified():
             if _UISaveFiles(self, [document]).exec_() == QDialog.Rejected:
                 return
@@ -499,6 +697,7 @@ class Workspace(QStackedWidget):
         Will save documents, checked by user
         Returns True, if user hasn't pressed Cancel Close
         """
+        self._saveQueue.wait()
         modifiedDocuments = [d for d in self.documents() if d.isModified()]
         if modifiedDocuments:
             if (_UISaveFiles( self, modifiedDocuments).exec_() == QDialog.Rejected):
@@ -525,5 +724,10 @@ class Workspace(QStackedWidget):
     def forceCloseAllDocuments(self):
         """Close all documents without asking user to save
         """
+        # remove placeholders first, otherwise it is loaded, when next document is activated on close
+        for document in self.documents(includePlaceholders=True)[::-1]:
+            if isinstance(document, _PlaceholderDocument):
+                self._removePlaceholder(document)
+
         for document in self.documents()[::-1]:
             self._doCloseDocument(document)
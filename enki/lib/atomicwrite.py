@@ -0,0 +1,95 @@
+"""
+atomicwrite --- Writing files without leaving them truncated
+============================================================
+
+Data is written to a temporary file in the same directory, which is renamed to the file name,
+therefore a crash or a full disk never leaves a half written file. See :func:`writeFileAtomically`
+
+Module doesn't depend on Qt, therefore it is used by the replace worker processes too
+"""
+
+import os
+import os.path
+import tempfile
+from stat import S_IMODE
+
+
+def currentUmask():
+    """Get umask of the process. It can be read only by setting a new one, therefore
+    it must not be called, while other threads create files
+    """
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def writeFileAtomically(filePath, chunks, fsyncPolicy, umask, fileHash=None, ownLinks=0):
+    """Write data chunks to a temporary file in the same directory and rename it to filePath,
+    so the file is never left truncated. If filePath is a symbolic link, its target is replaced.
+    Permissions and ownership of the existing file are preserved.
+    Falls back to writing in place, if the file has hard links or the temporary file can't be created.
+
+    fsyncPolicy is ``never``, ``file`` or ``fileAndDirectory``.
+    umask is applied to permissions of a new file. It is not read here, because changing of the process umask
+    to read it is not thread safe. See :func:`currentUmask`.
+    Written data is added to fileHash, if it is not None.
+    ownLinks is count of hard links to the file, made by the caller (i.e. a backup), which must not be
+    preserved. The linked file is left unchanged, if the file is written.
+
+    Returns count of written bytes. Raises OSError and IOError
+    """
+    filePath = os.path.realpath(filePath)  # replace target of a symlink, not the link
+    try:
+        oldStat = os.stat(filePath)
+    except OSError:  # new file
+        oldStat = None
+
+    tmpFd, tmpPath = None, None
+    if oldStat is None or oldStat.st_nlink - ownLinks <= 1:  # renaming would break hard links
+        try:
+            dirPath, baseName = os.path.split(filePath)
+            tmpFd, tmpPath = tempfile.mkstemp(prefix='.%s.' % baseName, suffix='.tmp', dir=dirPath)
+        except (OSError, IOError):  # directory is not writable, but the file might be
+            if ownLinks:  # writing in place would change the linked file
+                raise
+
+    size = 0
+    try:
+        openedFile = os.fdopen(tmpFd, 'wb') if tmpFd is not None else open(filePath, 'wb')
+        with openedFile:
+            for data in chunks:
+                openedFile.write(data)
+                if fileHash is not None:
+                    fileHash.update(data)
+                size += len(data)
+            openedFile.flush()
+            if fsyncPolicy != 'never':
+                os.fsync(openedFile.fileno())
+
+        if tmpPath is not None:
+            if oldStat is not None:
+                os.chmod(tmpPath, S_IMODE(oldStat.st_mode))
+                if hasattr(os, 'chown'):
+                    try:
+                        os.chown(tmpPath, oldStat.st_uid, oldStat.st_gid)
+                    except OSError:  # not permitted to give the file to other user. Keep own
+                        pass
+            else:  # mkstemp() creates files, readable only by the owner. Use default permissions
+                os.chmod(tmpPath, 0666 & ~umask)
+
+            if os.name == 'nt' and oldStat is not None:  # Windows doesn't replace existing files
+                os.remove(filePath)
+            os.rename(tmpPath, filePath)
+            tmpPath = None
+
+            if fsyncPolicy == 'fileAndDirectory' and os.name != 'nt':  # make the rename durable
+                dirFd = os.open(os.path.dirname(filePath), os.O_RDONLY)
+                try:
+                    os.fsync(dirFd)
+                finally:
+                    os.close(dirFd)
+    finally:
+        if tmpPath is not None and os.path.exists(tmpPath):  # failed
+            os.remove(tmpPath)
+
+    return size
@@ -0,0 +1,319 @@
+"""
+dirwalker --- Cached recursive directory walker
+===============================================
+
+Walker lists directories with ``scandir``, if it is available, therefore type of the directory entries is known
+without calling ``stat()`` for every file. ``scandir`` is a part of Python 3.5+, for Python 2 it is an optional
+dependency. Without it, every entry of a not cached directory is ``lstat()``'ed.
+
+Directory listings are cached. Cached listing is used until modification time of the directory changes.
+Count of cached listings is limited by :attr:`DirWalker.MAX_CACHED_LISTINGS`, least recently used are dropped.
+
+Hidden (started with ``.``) entries, build directories (see :data:`IGNORED_DIRS`) and paths, ignored
+by ``.gitignore`` files are skipped. Ignored directories are not visited.
+
+Shared walker instance is returned by :func:`walker`. Walker is thread safe.
+"""
+
+import collections
+import os
+import os.path
+import stat
+import re
+import threading
+
+try:
+    from os import scandir  # python 3.5+
+except ImportError:
+    try:
+        from scandir import scandir  # optional dependency
+    except ImportError:
+        scandir = None
+
+IGNORED_DIRS = ('build', 'dist', '__pycache__', 'node_modules', '_build')
+
+# Directory entry types
+FILE = 'file'
+DIR = 'dir'
+DIR_LINK = 'dirLink'  # symbolic link to a directory. Not walked
+OTHER = 'other'  # sockets, devices, broken links...
+
+
+def _translateGlob(pattern):
+    """Translate .gitignore glob to a regular expression.
+    Unlike ``fnmatch.translate()``, ``*``, ``?`` and ``[...]`` don't match ``/``.
+    ``**/`` matches any count of directories, trailing ``/**`` matches everything inside
+    """
+    result = []
+    i, n = 0, len(pattern)
+    while i < n:
+        char = pattern[i]
+        atSegmentStart = i == 0 or pattern[i - 1] == '/'
+        if pattern.startswith('**/', i) and atSegmentStart:
+            result.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('**', i) and i + 2 == n and atSegmentStart:
+            result.append('.*')
+            i += 2
+        elif char == '*':
+            while i < n and pattern[i] == '*':
+                i += 1
+            result.append('[^/]*')
+        elif char == '?':
+            result.append('[^/]')
+            i += 1
+        elif char == '[':
+            j = i + 1
+            if j < n and pattern[j] in '!^':
+                j += 1
+            if j < n and pattern[j] == ']':
+                j += 1
+            while j < n and pattern[j] != ']':
+                j += 1
+            if j >= n:  # not closed. Literal '['
+                result.append('\\[')
+                i += 1
+            else:
+                chars = pattern[i + 1:j].replace('\\', '\\\\')
+                if chars[0] in '!^':
+                    chars = '^' + chars[1:]
+                result.append('(?!/)[%s]' % chars)
+                i = j + 1
+        elif char == '\\' and i + 1 < n:
+            result.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            result.append(re.escape(char))
+            i += 1
+    return '^%s$' % ''.join(result)
+
+
+class _GitIgnore:
+    """Parsed .gitignore file
+    """
+    def __init__(self, dirPath, lines):
+        self.dirPath = dirPath
+        self._rules = []  # list of (compiled regExp, dir only, anchored, negated)
+        for line in lines:
+            line = line.rstrip('\r\n')
+            if not line.strip() or \
+               line.startswith('#'):
+                continue
+            line = line.rstrip()
+
+            negated = line.startswith('!')
+            if negated:
+                line = line[1:]
+            dirOnly = line.endswith('/')
+            line = line.rstrip('/')
+            anchored = '/' in line
+            line = line.lstrip('/')
+            if line:
+                self._rules.append((re.compile(_translateGlob(line)), dirOnly, anchored, negated))
+
+    def match(self, path, isDir):
+        """Check if path, which is inside dirPath, is ignored.
+        The last matching rule wins. Returns True, if ignored, False, if included by a negated rule,
+        None, if no rules match
+        """
+        relPath = os.path.relpath(path, self.dirPath).replace(os.path.sep, '/')
+        name = os.path.basename(path)
+        for regExp, dirOnly, anchored, negated in reversed(self._rules):
+            if dirOnly and not isDir:
+                continue
+            if regExp.match(relPath if anchored else name):
+                return not negated
+        return None
+
+
+class DirWalker:
+    """Recursive directory walker with cached listings
+    """
+    MAX_CACHED_LISTINGS = 100000  # directories
+
+    def __init__(self, ignoredDirs=IGNORED_DIRS):
+        self._ignoredDirs = set(ignoredDirs)
+        # Caches are keyed by (type(path), path). In Python 2 u'/x' == '/x', but names, listed for a unicode path,
+        # are unicode, and for a byte string path - byte strings. Listings of different types are not shared
+        self._listings = collections.OrderedDict()  # key: (mtime, list of (name, type)). Least recently used first
+        self._gitIgnores = {}  # key of .gitignore path: (mtime, _GitIgnore)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _entryType(isLink, isDir, isFile):
+        """Get entry type constant
+        """
+        if isDir:
+            return DIR_LINK if isLink else DIR
+        elif isFile:
+            return FILE
+        else:
+            return OTHER
+
+    def _readDir(self, path, withStat):
+        """Read directory listing from the file system.
+        Returns tuple (list of (name, type), {file name: stat}).
+        Without scandir, files are stat'ed to get the type, stats are always returned.
+        With scandir, ``DirEntry.stat()`` is returned, if withStat is True. It is cached by the entry,
+        and on Windows is known without a system call.
+        Names are of the same type as path. Names, not decodable to unicode, are skipped for unicode paths
+        """
+        entries = []
+        stats = {}
+        isUnicode = isinstance(path, unicode)
+        if scandir is not None:
+            for entry in scandir(path):
+                if isUnicode and not isinstance(entry.name, unicode):
+                    continue
+                entryType = self._entryType(entry.is_symlink(), entry.is_dir(), entry.is_file())
+                entries.append((entry.name, entryType))
+                if withStat and entryType == FILE:
+                    try:
+                        stats[entry.name] = entry.stat()
+                    except OSError:  # removed
+                        pass
+        else:
+            for name in os.listdir(path):
+                if isUnicode and not isinstance(name, unicode):
+                    continue
+                fullPath = os.path.join(path, name)
+                try:
+                    entryStat = os.lstat(fullPath)
+                    isLink = stat.S_ISLNK(entryStat.st_mode)
+                    if isLink:
+                        entryStat = os.stat(fullPath)
+                except OSError:  # broken link or removed file
+                    entries.append((name, OTHER))
+                    continue
+                mode = entryStat.st_mode
+                entries.append((name,
+                                self._entryType(isLink, stat.S_ISDIR(mode), stat.S_ISREG(mode))))
+                if stat.S_ISREG(mode):
+                    stats[name] = entryStat
+
+        return entries, stats
+
+    def _listDir(self, path, withStat=False):
+        """Get tuple (list of (name, type), {file name: stat}) for the directory.
+        Stats are known only for just read not cached listings. See :meth:`_readDir`
+        """
+        mtime = os.stat(path).st_mtime
+        key = (type(path), path)
+        with self._lock:
+            cached = self._listings.pop(key, None)
+            if cached is not None and cached[0] == mtime:
+                self._listings[key] = cached  # move to the end, it is used recently
+                return cached[1], {}
+
+        entries, stats = self._readDir(path, withStat)
+        with self._lock:
+            self._listings.pop(key, None)
+            self._listings[key] = (mtime, entries)
+            while len(self._listings) > self.MAX_CACHED_LISTINGS:
+                self._listings.popitem(last=False)
+        return entries, stats
+
+    def listDir(self, path):
+        """Get list of (name, type) for the directory. Hidden and ignored entries are not filtered.
+        Names are unicode, if path is unicode, otherwise byte strings.
+        Raises OSError
+        """
+        return self._listDir(path)[0]
+
+    def _gitIgnore(self, dirPath):
+        """Get _GitIgnore for the directory or None, if there is no .gitignore
+        """
+        filePath = os.path.join(dirPath, '.gitignore')
+        try:
+            mtime = os.stat(filePath).st_mtime
+        except OSError:
+            return None
+
+        key = (type(filePath), filePath)
+        with self._lock:
+            cached = self._gitIgnores.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        try:
+            with open(filePath) as gitIgnoreFile:
+                gitIgnore = _GitIgnore(dirPath, gitIgnoreFile.readlines())
+        except IOError:
+            return None
+
+        with self._lock:
+            self._gitIgnores[key] = (mtime, gitIgnore)
+        return gitIgnore
+
+    def _isIgnored(self, path, isDir, gitIgnores):
+        """Check if the path is ignored by .gitignore files.
+        As in git, rules of a deeper .gitignore take precedence over the rules of its parent directories
+        """
+        for gitIgnore in reversed(gitIgnores):
+            ignored = gitIgnore.match(path, isDir)
+            if ignored is not None:
+                return ignored
+        return False
+
+    def walk(self, root, filterRegExp=None, shouldStop=None, withStat=False):
+        """Recursively walk the directory. Generator. Yields absolute paths of files.
+        Paths are unicode, if root is unicode, otherwise byte strings.
+        Files of a directory are sorted by name and yielded before files of its subdirectories.
+
+        Files, which names match filterRegExp, are skipped.
+        shouldStop is a function without arguments. Walking is stopped, when it returns True
+
+        If withStat is True, tuples (path, ``os.stat()`` result) are yielded. Every file is stat'ed once,
+        stat, made while reading the directory, is reused
+        """
+        root = os.path.abspath(root)
+        stack = [(root, [])]  # (directory path, gitIgnores of parent directories)
+        while stack:
+            if shouldStop is not None and shouldStop():
+                return
+
+            dirPath, gitIgnores = stack.pop()
+            try:
+                entries, stats = self._listDir(dirPath, withStat)
+            except OSError:
+                continue
+
+            if ('.gitignore', FILE) in entries:
+                gitIgnore = self._gitIgnore(dirPath)
+                if gitIgnore is not None:
+                    gitIgnores = gitIgnores + [gitIgnore]
+
+            subDirs = []
+            for name, entryType in sorted(entries):
+                if name.startswith('.'):
+                    continue
+                fullPath = os.path.join(dirPath, name)
+                if entryType == DIR:
+                    if not name in self._ignoredDirs and \
+                       not self._isIgnored(fullPath, True, gitIgnores):
+                        subDirs.append(fullPath)
+                elif entryType == FILE:
+                    if (filterRegExp is None or not filterRegExp.match(name)) and \
+                       not self._isIgnored(fullPath, False, gitIgnores):
+                        if not withStat:
+                            yield fullPath
+                            continue
+                        fileStat = stats.get(name)
+                        if fileStat is None:
+                            try:
+                                fileStat = os.stat(fullPath)
+                            except OSError:  # removed
+                                continue
+                        yield fullPath, fileStat
+
+            # reversed, because the stack is LIFO. Subdirectories are walked in the order of listing
+            for subDir in reversed(subDirs):
+                stack.append((subDir, gitIgnores))
+
+
+_walker = DirWalker()
+
+def walker():
+    """Get shared :class:`DirWalker` instance
+    """
+    return _walker
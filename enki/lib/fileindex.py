@@ -0,0 +1,538 @@
+"""
+fileindex --- In-memory index of project files for fuzzy search
+===============================================================
+
+Index keeps paths of all files of a directory tree. It is used by the Locator to find a file by a few typed
+characters of its name.
+
+The tree is walked with :mod:`enki.lib.dirwalker`, therefore hidden and ignored files are not indexed.
+Index is refreshed in a background thread, when it is older than :attr:`FileIndex.REFRESH_INTERVAL`.
+Old index is used, while the new one is being built. Refreshing is incremental: the walker reads again only
+directories, which modification time has been changed.
+
+Query is matched against the file name. If the query contains ``/``, the part before the last ``/`` is matched
+against the directory path, the rest against the file name. Order of preference of the files:
+
+1. file name starts with the query
+2. file name contains the query
+3. characters of the query are a subsequence of the file name
+
+Within a group, matches at word starts, compact matches and short paths are preferred.
+
+Search doesn't loop over all paths in Python. Lowercased names and directories are joined to long UTF-8 encoded
+strings, which are scanned with ``str.find()`` and regular expressions. Subsequence search checks only files, which
+names contain all characters of the query. These files are found with bit masks of the files for every character.
+Masks of the common characters are built by the background thread after the tree has been walked, other masks
+on demand. If the tree has not been changed, refreshing keeps the old snapshot with its masks.
+Only found candidates are scored and sorted. While the user types the query, next search checks only files,
+found by the previous one. Directories, found for the directory part, are reused the same way.
+
+See ``benchmarks/bench_fileindex.py`` for the search time on 500k files.
+
+Paths and queries are unicode. Byte strings are decoded from the file system encoding.
+Shared index instance is returned by :func:`index`. Index is thread safe.
+"""
+
+import bisect
+import os
+import os.path
+import re
+import string
+import sys
+import threading
+import time
+from array import array
+
+from enki.lib import dirwalker
+
+_NAME_START, _NAME_CONTAINS, _NAME_SUBSEQUENCE = range(3)
+
+_WORD_SEPARATORS = u'/_-. '
+
+_ALL_CHARS = string.maketrans('', '')
+
+_PREBUILT_MASK_CHARS = string.ascii_lowercase + string.digits + '._-'
+
+_DENSE_CANDIDATES_RATIO = 8  # the text is scanned, if more than 1/8 of the files of a range are candidates
+
+ENCODING = sys.getfilesystemencoding() or 'utf8'
+"""Encoding of the paths in the file system"""
+
+
+class _Snapshot:
+    """State of the index for a walk of the tree. Files are never changed. Time is updated, if the next walk
+    has found the same tree.
+    Directories are stored once, files of a directory are stored one after another
+    """
+    def __init__(self, root, filterRegExp, dirs):
+        """dirs is list of (relative directory path, list of file names) in order of walking
+        """
+        self.root = root
+        self.filterRegExp = filterRegExp
+        self.time = time.time()  # time of the last walk
+        self.dirs = []  # relative paths of the directories. '' for the root
+        self.names = []  # unicode file names
+        self.fileDirs = array('l')  # directory index for every file
+        self.dirStarts = array('l')  # index of the first file of every directory and the count of files
+        for dirPath, names in dirs:
+            self.dirStarts.append(len(self.names))
+            self.fileDirs.extend([len(self.dirs)] * len(names))
+            self.dirs.append(dirPath)
+            self.names.extend(names)
+        self.dirStarts.append(len(self.names))
+
+        # Lines are separated with \n. Offsets are positions of \n before every line and of the last \n
+        lowerNames = [name.lower().encode('utf8') for name in self.names]
+        lowerDirs = [dirPath.lower().encode('utf8') for dirPath in self.dirs]
+        self.namesText = '\n' + '\n'.join(lowerNames) + '\n'
+        self.dirsText = '\n' + '\n'.join(lowerDirs) + '\n'
+        self.nameOffsets = self._offsets(lowerNames)
+        self.dirOffsets = self._offsets(lowerDirs)
+        self.dirLines = dict(zip(self.dirOffsets, xrange(len(self.dirs))))  # offset: directory index
+        self._charMasks = {}  # char: bit mask of the files, which names contain the char. Filled on demand
+
+    @staticmethod
+    def _offsets(lines):
+        """Get positions of \n before every line of the joined string and of the final \n
+        """
+        offsets = array('l')
+        pos = 0
+        for line in lines:
+            offsets.append(pos)
+            pos += len(line) + 1
+        offsets.append(pos)
+        return offsets
+
+    def fileCount(self):
+        """Count of indexed files
+        """
+        return len(self.names)
+
+    def isSameTree(self, filterRegExp, dirs):
+        """Check if the snapshot contains the same files as dirs, a list of (relative directory path, list of names)
+        """
+        return filterRegExp is self.filterRegExp and \
+               len(dirs) == len(self.dirs) and \
+               [dirPath for dirPath, names in dirs] == self.dirs and \
+               [name for dirPath, names in dirs for name in names] == self.names
+
+    def buildCharMasks(self):
+        """Build masks of the common characters, so they are not built, while the user types the query
+        """
+        for char in _PREBUILT_MASK_CHARS:
+            self.charMask(char)
+
+    def path(self, line):
+        """Relative path of the file
+        """
+        dirPath = self.dirs[self.fileDirs[line]]
+        return dirPath + '/' + self.names[line] if dirPath else self.names[line]
+
+    def charMask(self, char):
+        """Bit mask of the files, which UTF-8 encoded names contain the byte.
+        Bit of the first file is the most significant
+        """
+        mask = self._charMasks.get(char)
+        if mask is None and self.namesText.find(char) == -1:
+            mask = 0
+            self._charMasks[char] = mask
+        elif mask is None:
+            # Delete other characters and replace every line with '1' or '0'. Only C-level string functions are used
+            text = self.namesText.translate(string.maketrans(char, '\x01'),
+                                            _ALL_CHARS.replace(char, '').replace('\n', ''))
+            text = text.replace('\n\x01', '1').translate(None, '\x01').replace('\n', '0')
+            mask = int(text[:-1], 2)
+            self._charMasks[char] = mask
+        return mask
+
+
+class Match:
+    """Found file.
+
+    * path - unicode path of the file, relative to the root
+    * positions - positions of the matched characters in the path. For highlighting
+    """
+    def __init__(self, path, positions, sortKey):
+        self.path = path
+        self.positions = positions
+        self.sortKey = sortKey
+
+
+def _subsequencePattern(query, lineStart=False):
+    """Regular expression, which finds the characters of the query in this order in one line.
+    Pattern starts with a literal, so the regular expression engine skips quickly to its occurrences.
+    Every character class excludes the next ASCII character, so the expression doesn't backtrack.
+    Pattern is applied to UTF-8 encoded text. Non-ASCII characters are searched lazily, because a character class
+    can't exclude a multibyte sequence.
+
+    If lineStart is True, the pattern matches from the \n before the line. It is faster for long lines,
+    where the first character occurs many times
+    """
+    parts = ['\n'] if lineStart else []
+    for index, char in enumerate(query):
+        escaped = re.escape(char.encode('utf8'))
+        if index == 0 and not lineStart:
+            parts.append(escaped)
+        elif ord(char) < 128:
+            parts.append('[^%s\n]*%s' % (escaped, escaped))
+        else:
+            parts.append('[^\n]*?%s' % escaped)
+    return re.compile(''.join(parts))
+
+
+def _subsequencePositions(text, query):
+    """Positions of the query characters in the text. Prefers matches at the word starts.
+    Returns None, if not found
+    """
+    positions = []
+    pos = 0
+    for char in query:
+        pos = text.find(char, pos)
+        if pos == -1:
+            return None
+        positions.append(pos)
+        pos += 1
+
+    # move characters to the word starts, if it is possible without breaking the order
+    for index in range(len(positions) - 1, -1, -1):
+        limit = positions[index + 1] if index + 1 < len(positions) else len(text)
+        pos = positions[index]
+        if pos == 0 or text[pos - 1] in _WORD_SEPARATORS:
+            continue
+        candidate = pos + 1
+        while candidate < limit:
+            candidate = text.find(query[index], candidate, limit)
+            if candidate == -1:
+                break
+            if text[candidate - 1] in _WORD_SEPARATORS:
+                positions[index] = candidate
+                break
+            candidate += 1
+
+    return positions
+
+
+def _matchName(lowerName, namePart):
+    """Match the file name. Returns (tier, positions) or None
+    """
+    if not namePart:
+        return _NAME_START, []
+
+    pos = lowerName.find(namePart)
+    if pos != -1:
+        return (_NAME_START if pos == 0 else _NAME_CONTAINS), range(pos, pos + len(namePart))
+
+    positions = _subsequencePositions(lowerName, namePart)
+    if positions is not None:
+        return _NAME_SUBSEQUENCE, positions
+
+    return None
+
+
+def _match(snapshot, line, query):
+    """Match the file. Returns (sort key, path, positions) or None.
+    :class:`Match` is created only for shown files, so the search allocates less objects
+    """
+    dirPart, separator, namePart = query.rpartition('/')  # pylint: disable=W0612
+    name = snapshot.names[line]
+    matched = _matchName(name.lower(), namePart)
+    if matched is None:
+        return None
+    tier, positions = matched
+
+    dirPath = snapshot.dirs[snapshot.fileDirs[line]]
+    path = dirPath + '/' + name if dirPath else name
+    lowerPath = path.lower()
+    nameStart = len(path) - len(name)
+    positions = [nameStart + pos for pos in positions]
+    if dirPart:
+        dirPositions = _subsequencePositions(dirPath.lower(), dirPart)
+        if dirPositions is None:
+            return None
+        positions = dirPositions + positions
+
+    wordStarts = len([pos for pos in positions \
+                        if pos == 0 or lowerPath[pos - 1] in _WORD_SEPARATORS])
+    gaps = positions[-1] - positions[0] - len(positions) + 1 if positions else 0
+    sortKey = (tier, -wordStarts, gaps, len(lowerPath), lowerPath)
+    return sortKey, path, positions
+
+
+class SearchResult:
+    """Result of :func:`search`.
+
+    * matches - list of :class:`Match`, best first
+    * complete - all matching files have been found. Next search for a longer query only checks them
+    """
+    def __init__(self, snapshot, query, lines, complete, maxCount, dirs=None, dirRuns=None):
+        self.snapshot = snapshot
+        self.query = query
+        self.complete = complete
+        self.dirs = dirs  # indexes of the directories, matching directory part of the query
+        self.dirRuns = dirRuns  # ranges of files in these directories
+
+        matched = []
+        self._lines = []  # indexes of the matching files
+        for line in lines:
+            match = _match(snapshot, line, query)
+            if match is not None:
+                matched.append(match)
+                self._lines.append(line)
+
+        matched.sort(key=lambda match: match[0])
+        self.matches = [Match(path, positions, sortKey) for sortKey, path, positions in matched[:maxCount]]
+
+    def canNarrow(self, snapshot, query):
+        """Matches for the query are subset of this result.
+        It is true, if the query only appends characters to the file name part of the previous query
+        """
+        return self.complete and \
+               snapshot is self.snapshot and \
+               query.startswith(self.query) and \
+               query.count('/') == self.query.count('/')
+
+    def lines(self):
+        """Indexes of all matching files. Valid only for complete result
+        """
+        return self._lines
+
+
+def _findDirs(snapshot, dirPart, candidates=None):
+    """Find indexes of directories, which paths contain dirPart characters in this order.
+    If candidates is not None, only these directories are checked
+    """
+    pattern = _subsequencePattern(dirPart, True)
+    if candidates is None:
+        starts = [match.start() for match in pattern.finditer(snapshot.dirsText)]
+        return map(snapshot.dirLines.__getitem__, starts)  # a match starts at \n before the line
+    else:
+        text = snapshot.dirsText
+        offsets = snapshot.dirOffsets
+        return [index for index in candidates \
+                    if pattern.match(text, offsets[index], offsets[index + 1] + 1) is not None]
+
+
+def _dirRuns(snapshot, dirs):
+    """Get list of [first file index, end file index] ranges of files of the directories.
+    Adjacent ranges are merged
+    """
+    runs = []
+    previous = None
+    for index in dirs:
+        if index - 1 == previous:  # files of the next directory follow files of the previous one
+            runs[-1][1] = snapshot.dirStarts[index + 1]
+        else:
+            runs.append([snapshot.dirStarts[index], snapshot.dirStarts[index + 1]])
+        previous = index
+    return runs
+
+
+def _scanNames(snapshot, namePart, runs, found, maxCount, candidateLimit):
+    """Add to found indexes of files, which names match namePart.
+    runs is list of [first file index, end file index] ranges of the files, which are checked.
+    Returns False, if scanning has been stopped before all matching files have been found
+    """
+    text = snapshot.namesText
+    offsets = snapshot.nameOffsets
+    encodedNamePart = namePart.encode('utf8')
+    for start, end in runs:  # str.find() is much faster, than a regular expression for a literal
+        endPos = offsets[end]
+        pos = text.find(encodedNamePart, offsets[start], endPos)
+        while pos != -1:
+            line = bisect.bisect_right(offsets, pos) - 1
+            found.add(line)
+            if len(found) >= candidateLimit:
+                return False
+            pos = text.find(encodedNamePart, offsets[line + 1], endPos)
+    if len(found) >= maxCount:  # subsequence matches are sorted after, they will not be shown
+        return False
+
+    # Check only files, which names contain all bytes of the query
+    mask = -1
+    for char in set(encodedNamePart):
+        mask &= snapshot.charMask(char)
+    flags = bin(mask)[2:].zfill(snapshot.fileCount())  # '1' for every candidate
+
+    pattern = _subsequencePattern(namePart)
+    for start, end in runs:
+        if flags.count('1', start, end) * _DENSE_CANDIDATES_RATIO > end - start:
+            # Masks don't filter repeated and common characters. Scanning the text is faster, than checking
+            # the most of the lines one by one
+            endPos = offsets[end]
+            match = pattern.search(text, offsets[start], endPos)
+            while match is not None:
+                line = bisect.bisect_right(offsets, match.start()) - 1
+                found.add(line)
+                if len(found) >= candidateLimit:
+                    return False
+                match = pattern.search(text, offsets[line + 1], endPos)
+            continue
+
+        line = flags.find('1', start, end)
+        while line != -1:
+            if not line in found and \
+               pattern.search(text, offsets[line] + 1, offsets[line + 1]) is not None:
+                found.add(line)
+                if len(found) >= candidateLimit:
+                    return False
+            line = flags.find('1', line + 1, end)
+    return True
+
+
+def search(snapshot, query, maxCount, candidateLimit, previous=None):
+    """Find files in the snapshot. Returns :class:`SearchResult`.
+
+    If previous result is complete, and the query extends its query, only files of the previous result
+    are checked. Otherwise the names are scanned tier by tier. Tiers are sorted before the next ones,
+    therefore the lower tiers are not scanned, when maxCount files have already been found.
+    Scanning is stopped, when candidateLimit files have been found
+    """
+    query = query.lower().lstrip('/')  # path from the root is searched as a relative path
+    if not query:  # not complete, longer query can't be narrowed from it
+        return SearchResult(snapshot, query, [], False, maxCount)
+    if previous is not None and previous.canNarrow(snapshot, query):
+        return SearchResult(snapshot, query, previous.lines(), True, maxCount, previous.dirs, previous.dirRuns)
+
+    dirPart, separator, namePart = query.rpartition('/')  # pylint: disable=W0612
+    found = set()
+    complete = True
+    dirs = None
+    dirRuns = None
+    if dirPart:
+        previousDirPart = None
+        if previous is not None and previous.snapshot is snapshot and previous.dirs is not None:
+            previousDirPart = previous.query.rpartition('/')[0]
+        if previousDirPart == dirPart:
+            dirs, dirRuns = previous.dirs, previous.dirRuns
+        else:
+            if previousDirPart is not None and dirPart.startswith(previousDirPart):
+                dirs = _findDirs(snapshot, dirPart, previous.dirs)  # only the previously found can match
+            else:
+                dirs = _findDirs(snapshot, dirPart)
+            dirRuns = _dirRuns(snapshot, dirs)
+
+        if not namePart or sum([end - start for start, end in dirRuns]) <= candidateLimit:
+            # check files of the found directories one by one
+            for start, end in dirRuns:
+                found.update(range(start, min(end, start + candidateLimit - len(found))))
+                if len(found) >= candidateLimit:
+                    complete = False
+                    break
+        else:
+            complete = _scanNames(snapshot, namePart, dirRuns, found, maxCount, candidateLimit)
+    elif namePart:
+        complete = _scanNames(snapshot, namePart, [(0, snapshot.fileCount())], found, maxCount, candidateLimit)
+
+    return SearchResult(snapshot, query, sorted(found), complete, maxCount, dirs, dirRuns)
+
+
+class FileIndex:
+    """Index of files of a directory tree
+    """
+    REFRESH_INTERVAL = 10  # Seconds. Older index is refreshed in the background, when it is used
+    MAX_FILE_COUNT = 1000000  # Walking is stopped, if the tree contains more files
+    CANDIDATE_LIMIT = 1000  # Max count of found files, which are scored and sorted
+
+    def __init__(self, walker=None):
+        self._walker = walker if walker is not None else dirwalker.walker()
+        self._snapshot = None
+        self._building = None  # (root, threading.Event) of the walk in progress
+        self._lastResult = None  # SearchResult of the last find(). Used for narrowing
+        self._lock = threading.Lock()
+
+    def _build(self, root, filterRegExp, done):
+        """Walk the tree and replace the snapshot. Works in a background thread.
+        Walker yields paths of the same type as root. Byte string paths are decoded
+        """
+        dirs = []  # (relative directory path, list of file names)
+        prefixLength = len(root.rstrip(os.path.sep)) + 1
+        count = [0]
+        snapshot = None
+        try:
+            for fullPath in self._walker.walk(root, filterRegExp, lambda: count[0] >= self.MAX_FILE_COUNT):
+                relPath = fullPath[prefixLength:]
+                if not isinstance(relPath, unicode):
+                    relPath = relPath.decode(ENCODING, 'replace')
+                dirPath, name = os.path.split(relPath)
+                dirPath = dirPath.replace(os.path.sep, '/')
+                if not dirs or dirs[-1][0] != dirPath:  # walker yields files of a directory together
+                    dirs.append((dirPath, []))
+                dirs[-1][1].append(name)
+                count[0] += 1
+
+            with self._lock:
+                oldSnapshot = self._snapshot
+            if oldSnapshot is not None and oldSnapshot.root == root and oldSnapshot.isSameTree(filterRegExp, dirs):
+                oldSnapshot.time = time.time()  # keep built masks and results for narrowing
+            else:
+                snapshot = _Snapshot(root, filterRegExp, dirs)
+        finally:
+            with self._lock:
+                if self._building is not None and self._building[1] is done:  # not replaced with other root
+                    self._building = None
+                    if snapshot is not None:
+                        self._snapshot = snapshot
+            done.set()
+
+        if snapshot is not None:
+            snapshot.buildCharMasks()
+
+    def _startBuilding(self, root, filterRegExp):
+        """Start walking in a background thread, if not started yet for the root.
+        Must be called with locked lock. Returns threading.Event, which is set, when finished
+        """
+        if self._building is not None and self._building[0] == root:
+            return self._building[1]
+
+        done = threading.Event()
+        self._building = (root, done)
+        thread = threading.Thread(target=self._build, args=(root, filterRegExp, done))
+        thread.daemon = True
+        thread.start()
+        return done
+
+    def snapshot(self, root, filterRegExp=None):
+        """Get index of the root directory. Blocks, if the directory is not indexed yet.
+        Starts refreshing in the background, if the index is outdated or the filter has been changed.
+        filterRegExp is regular expression for file names, which shall not be indexed
+        """
+        if isinstance(root, unicode):
+            root = root.encode(ENCODING)
+        root = os.path.abspath(root)
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.root == root:
+                if time.time() - snapshot.time > self.REFRESH_INTERVAL or \
+                   snapshot.filterRegExp is not filterRegExp:
+                    self._startBuilding(root, filterRegExp)
+                return snapshot
+            done = self._startBuilding(root, filterRegExp)
+
+        done.wait()
+        with self._lock:
+            return self._snapshot if self._snapshot is not None and self._snapshot.root == root else None
+
+    def find(self, root, query, filterRegExp=None, maxCount=100):
+        """Find files by the query. Returns list of :class:`Match`, best first.
+        Search is narrowed, while the user types the query
+        """
+        snapshot = self.snapshot(root, filterRegExp)
+        if snapshot is None or not query:
+            return []
+        if isinstance(query, str):
+            query = query.decode(ENCODING, 'replace')
+
+        with self._lock:
+            previous = self._lastResult
+        result = search(snapshot, query, maxCount, self.CANDIDATE_LIMIT, previous)
+        with self._lock:
+            self._lastResult = result
+        return result.matches
+
+
+_index = FileIndex()
+
+def index():
+    """Get shared :class:`FileIndex` instance
+    """
+    return _index
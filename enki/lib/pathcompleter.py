@@ -12,6 +12,7 @@ import os.path
 import glob
 
 from enki.lib.htmldelegate import htmlEscape
+from enki.lib import dirwalker
 from enki.core.locator import AbstractCompleter
 from enki.core.core import core
 
@@ -186,18 +187,18 @@ class PathCompleter(AbstractPathCompleter):
             return
 
         try:
-            filesAndDirs = os.listdir(self._path)
+            entries = dirwalker.walker().listDir(self._path)
         except OSError, ex:
             self._error = unicode(str(ex), 'utf8')
             return
         
-        if not filesAndDirs:
+        if not entries:
             self._status = 'Empty directory'
             return
             
         # filter matching
-        variants = [path for path in filesAndDirs\
-                        if path.startswith(enterredFile)]
+        variants = [name for name, entryType in entries\
+                        if name.startswith(enterredFile)]
         
         notHiddenVariants = self._filterHidden(variants)
         """If list if not ignored (not hidden) variants is empty, we use list of
@@ -209,9 +210,10 @@ class PathCompleter(AbstractPathCompleter):
         
         variants.sort()
         
+        entryTypes = dict(entries)
         for variant in variants:
             absPath = os.path.join(self._path, variant)
-            if os.path.isdir(absPath):
+            if entryTypes[variant] in (dirwalker.DIR, dirwalker.DIR_LINK):
                 self._dirs.append(absPath)
             else:
                 self._files.append(absPath)
@@ -21,6 +21,7 @@ class Plugin(QObject):
         self._action = None
         core.workspace().currentDocumentChanged.connect(self._updateAction)
         core.workspace().languageChanged.connect(self._updateAction)
+        self._updateAction()
     
     def del_(self):
         """Uninstall the plugin
@@ -8,6 +8,8 @@ from enki.core.core import core
 # Bigger indents are probably not an indents
 _MAX_INDENT = 8
 _MIN_INDENT = 2
+# Count of lines, used for detection in large files
+_LARGE_FILE_SAMPLE_LINES = 1000
 
 class Plugin:
     """Plugin interface
@@ -63,8 +65,12 @@ class Plugin:
             else:  # indents are totally not equal
                 return None
         
+        if document.isLargeFile():  # detect by the first lines, don't copy whole text
+            lines = [document.line(index) for index in range(min(document.lineCount(), _LARGE_FILE_SAMPLE_LINES))]
+        else:
+            lines = document.lines()
         # non-empty lines. Empty (without trailing whitespaces) lines between code blocks break detection algorythm
-        lines = [l for l in document.lines() if l]
+        lines = [l for l in lines if l]
         lastIndent = ''
         popularityTable = {}
         for l in lines:
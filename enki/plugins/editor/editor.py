@@ -5,7 +5,9 @@ editor --- AbstractTextEditor implementation
 Uses QScintilla  internally
 """
 
-from PyQt4.QtCore import pyqtSignal, Qt
+import os.path
+
+from PyQt4.QtCore import pyqtSignal, Qt, QTimer
 from PyQt4.QtGui import QApplication, QColor, QFont, QFrame, QIcon, QKeyEvent, QKeySequence, QPrintDialog, QVBoxLayout
 
 from PyQt4.Qsci import *  # pylint: disable=W0401,W0614
@@ -24,6 +26,7 @@ class _QsciScintilla(QsciScintilla):
     """
     
     newLineInserted = pyqtSignal()
+    resized = pyqtSignal()
     
     def __init__(self, editor):
         self._editor = editor
@@ -38,6 +41,12 @@ class _QsciScintilla(QsciScintilla):
         if hasattr(self, "SCI_INDICSETOUTLINEALPHA"):
             self.SendScintilla(self.SCI_INDICSETOUTLINEALPHA, 0, 0)
 
+    def resizeEvent(self, event):
+        """Widget resized. Emit signal, count of visible lines might be changed
+        """
+        super(_QsciScintilla, self).resizeEvent(event)
+        self.resized.emit()
+
     def keyPressEvent(self, event):
         """Key pressing handler
         """
@@ -165,6 +174,9 @@ class Editor(AbstractTextEditor):
         
         self._cachedText = None  # QScintilla.text is slow, therefore we cache it
         self._eolMode = '\n'
+        self._bulkReplaceInProgress = False  # textChanged is emitted once for replaceMatches()
+        self._loadingChunks = None  # _readFileChunks() generator, while large file is being loaded
+        self._loadingTimer = None
         
         # Configure editor
         self.qscintilla = _QsciScintilla(self)
@@ -192,12 +204,21 @@ class Editor(AbstractTextEditor):
         # connections
         self.qscintilla.cursorPositionChanged.connect(self.cursorPositionChanged)
         self.qscintilla.modificationChanged.connect(self.modifiedChanged)
-        self.qscintilla.textChanged.connect(self._onTextChanged)
+        # not textChanged, because table of line starts must be updated before the signal is emitted
+        self.qscintilla.SCN_MODIFIED.connect(self._onScintillaModified)
+        self.qscintilla.verticalScrollBar().valueChanged.connect(self.visibleLinesChanged)
+        self.qscintilla.resized.connect(self.visibleLinesChanged)
         
         self.applySettings()
         self.lexer = Lexer(self)
         
-        if not self._neverSaved:
+        if self._largeFile:
+            # The first chunk is loaded now and used as a sample for EOL detection, the rest - by the timer
+            self._loadingChunks = self._readFileChunks(filePath)
+            originalText, readSize = self._loadingChunks.next()  # pylint: disable=W0612
+            self.setText(originalText)
+            self._startLargeFileLoading()
+        elif not self._neverSaved:
             originalText = self._readFile(filePath)
             self.setText(originalText)
         else:
@@ -205,8 +226,8 @@ class Editor(AbstractTextEditor):
         
         myConfig = core.config()["Editor"]
         
-        # convert tabs if needed
-        if  myConfig["Indentation"]["ConvertUponOpen"]:
+        # convert tabs if needed. Too slow for large files
+        if  myConfig["Indentation"]["ConvertUponOpen"] and not self._largeFile:
             self._convertIndentation()
         
         #autodetect eol, need
@@ -215,6 +236,104 @@ class Editor(AbstractTextEditor):
         self.modifiedChanged.emit(self.isModified())
         self.cursorPositionChanged.emit(*self.cursorPosition())
 
+    def del_(self):
+        """Explicitly called destructor. Stop loading of a large file
+        """
+        self._stopLargeFileLoading()
+        super(Editor, self).del_()
+
+    def reload(self):
+        """Reload the file from the disk.
+        Large file is reloaded by chunks, as when it is opened. Loading in progress is cancelled
+        """
+        self._stopLargeFileLoading()
+        if not self._largeFile:
+            super(Editor, self).reload()
+            return
+
+        pos = self.absCursorPosition()
+        self._loadingChunks = self._readFileChunks(self.filePath())
+        text, readSize = self._loadingChunks.next()  # pylint: disable=W0612
+        self.setText(text)
+        self._externallyModified = False
+        self._externallyRemoved = False
+        self.setCursorPosition(absPos = min(pos, len(text)))
+        self._startLargeFileLoading()
+
+    def _startLargeFileLoading(self):
+        """Start loading the rest of a large file by chunks.
+        Chunk is appended on every timer event, therefore UI is not blocked.
+        Editor is read-only, until the file is loaded
+        """
+        self._loadingFileSize = max(os.path.getsize(self.filePath()), 1)
+        self.qscintilla.setReadOnly(True)
+        self.qscintilla.SendScintilla(self.qscintilla.SCI_SETUNDOCOLLECTION, False)
+        if self._loadingTimer is None:
+            self._loadingTimer = QTimer(self)
+            self._loadingTimer.timeout.connect(self._onLoadingTimer)
+        self._loadingTimer.start(0)
+
+    def _stopLargeFileLoading(self):
+        """Cancel loading of a large file, if it is being loaded. Not loaded chunks are dropped
+        """
+        if self._loadingChunks is None:
+            return
+        self._loadingTimer.stop()
+        self._loadingChunks.close()
+        self._loadingChunks = None
+        self.qscintilla.setReadOnly(False)
+        self.qscintilla.SendScintilla(self.qscintilla.SCI_SETUNDOCOLLECTION, True)
+
+    def _onLoadingTimer(self):
+        """Append next chunk of a large file
+        """
+        try:
+            text, readSize = self._loadingChunks.next()
+        except StopIteration:
+            self._finishLargeFileLoading()
+            return
+        except IOError, ex:
+            core.mainWindow().appendMessage('Failed to load %s: %s' % (self.filePath(), str(ex)))
+            self._finishLargeFileLoading()
+            return
+        
+        # Table of line starts is built later, when required. Updating it for every appended line is slow
+        self._invalidateLineOffsets()
+        self.qscintilla.setReadOnly(False)
+        self.qscintilla.append(text)
+        self.qscintilla.setReadOnly(True)
+        self._setModified(False)
+        
+        core.mainWindow().statusBar().showMessage(self.tr("Loading %s: %d%%" % \
+                                                   (self.fileName(), readSize * 100 / self._loadingFileSize)))
+
+    def _finishLargeFileLoading(self):
+        """Large file has been loaded. Make editor editable
+        """
+        self._loadingTimer.stop()
+        self._loadingChunks = None
+        self.qscintilla.setReadOnly(False)
+        self.qscintilla.SendScintilla(self.qscintilla.SCI_SETUNDOCOLLECTION, True)
+        self.qscintilla.SendScintilla(self.qscintilla.SCI_EMPTYUNDOBUFFER)
+        self._setModified(False)
+        self.qscintilla.linesChanged.emit()
+        core.mainWindow().statusBar().showMessage(self.tr("%s loaded" % self.fileName()), 3000)
+        self.loaded.emit()
+
+    def isLoading(self):
+        """Large file is being loaded by chunks
+        """
+        return self._loadingChunks is not None
+
+    def _saveFile(self, filePath, wait=True):
+        """Save the file. Not loaded completely large file is not saved
+        """
+        if self._loadingChunks is not None:
+            core.mainWindow().appendMessage('%s is being loaded, it can not be saved now' % self.fileName(),
+                                            5000)
+            return
+        super(Editor, self)._saveFile(filePath, wait)
+
     def _initQsciShortcuts(self):
         """Clear default QScintilla shortcuts, and restore only ones, which are needed for Enki.
         
@@ -367,7 +486,7 @@ class Editor(AbstractTextEditor):
         # and wrapping is enabled
         myConfig = core.config()["Editor"]
         
-        if myConfig["Wrap"]["Enabled"] and self.qscintilla.lines() < 2048:
+        if myConfig["Wrap"]["Enabled"] and self.qscintilla.lines() < 2048 and not self._largeFile:
             self.qscintilla.setWrapMode(self._WRAP_MODE_TO_QSCI[myConfig["Wrap"]["Mode"]])
             self.qscintilla.setWrapVisualFlags(self._WRAP_FLAG_TO_QSCI[myConfig["Wrap"]["EndVisualFlag"]],
                                                self._WRAP_FLAG_TO_QSCI[myConfig["Wrap"]["StartVisualFlag"]],
@@ -420,11 +539,32 @@ class Editor(AbstractTextEditor):
         
         self._applyWrapMode()
     
+    def _onScintillaModified(self, position, modificationType, text, length, linesAdded, *args):  # pylint: disable=W0613,R0913
+        """Scintilla modification notification handler.
+        Update table of line starts for inserted or deleted text and emit textChanged
+        """
+        if not modificationType & (self.qscintilla.SC_MOD_INSERTTEXT | self.qscintilla.SC_MOD_DELETETEXT):
+            return
+        
+        if self._lineOffsets is not None:
+            line = self.qscintilla.SendScintilla(self.qscintilla.SCI_LINEFROMPOSITION, position)
+            newLineLengths = []
+            for index in xrange(line, line + max(linesAdded, 0) + 1):
+                lineText = self.qscintilla.text(index)
+                if self._eolMode == r'\r\n' and lineText.endswith('\r\n'):
+                    newLineLengths.append(len(lineText) - 1)
+                else:
+                    newLineLengths.append(len(lineText))
+            self._lineOffsets.linesChanged(line, linesAdded, newLineLengths)
+        
+        self._onTextChanged()
+    
     def _onTextChanged(self):
-        """QScintilla signal handler. Emits own signal
+        """Text changed. Emits own signal
         """
         self._cachedText = None
-        self.textChanged.emit()
+        if not self._bulkReplaceInProgress:
+            self.textChanged.emit()
 
     #
     # AbstractDocument interface
@@ -455,6 +595,7 @@ class Editor(AbstractTextEditor):
         self.qscintilla.setEolMode(self._EOL_CONVERTOR_TO_QSCI[mode])
         self.qscintilla.convertEols(self._EOL_CONVERTOR_TO_QSCI[mode])
         self._eolMode = mode
+        self._invalidateLineOffsets()
 
     def indentWidth(self):
         """Indentation width in symbol places (spaces)
@@ -479,7 +620,11 @@ class Editor(AbstractTextEditor):
     def _applyLanguage(self, language):
         """Set programming language of the file.
         Called Only by :mod:`enki.plugins.associations` to select syntax highlighting language.
+        
+        Large files are not highlighted, it is too slow
         """
+        if self._largeFile:
+            return
         self.lexer.applyLanguage(language)
 
     def text(self):
@@ -488,18 +633,41 @@ class Editor(AbstractTextEditor):
         if self._cachedText is not None:
             return self._cachedText
         
-        self._cachedText = self.qscintilla.text()
+        self._cachedText = self._toUnixEol(self.qscintilla.text())
+        return self._cachedText
 
+    def _toUnixEol(self, text):
+        """Replace EOLs of the file with \\n
+        """
         if self._eolMode == r'\r\n':
-            self._cachedText = self._cachedText.replace('\r\n', '\n')
+            return text.replace('\r\n', '\n')
         elif self._eolMode == r'\r':
-            self._cachedText = self._cachedText.replace('\r', '\n')
+            return text.replace('\r', '\n')
+        else:
+            return text
+
+    def textRange(self, startAbsPos, endAbsPos):
+        """Part of the text. Read from Scintilla with SCI_GETTEXTRANGE, whole text is not copied
+        """
+        start, end = self._toScintillaPositions((startAbsPos, endAbsPos))
+        return self._toUnixEol(self.qscintilla.text(start, end))
+
+    def line(self, index):
+        """Line of the text. Read from Scintilla with SCI_GETLINE, whole text is not copied.
         
-        return self._cachedText
+        None, if index is invalid
+        """
+        if index < 0:
+            index += self.lineCount()
+        if index < 0 or index >= self.lineCount():
+            return None
+        
+        return self.qscintilla.text(index).rstrip('\r\n')
 
     def setText(self, text):
         """Set text in the QScintilla, clear modified flag, update line numbers bar
         """
+        self._invalidateLineOffsets()  # building new table is faster, than updating
         self.qscintilla.setText(text)
         self.qscintilla.linesChanged.emit()
         self._setModified(False)
@@ -553,6 +721,35 @@ class Editor(AbstractTextEditor):
                                      endLine, endCol)
         self.replaceSelectedText(text)
     
+    def replaceMatches(self, replacements):
+        """Replace multiple ranges of the text as one undo action.
+        replacements is list of (startAbsPos, endAbsPos, text), sorted by position, not overlapping.
+
+        Ranges are replaced with Scintilla target replace, from the last to the first, therefore
+        positions of not replaced yet ranges are not changed. textChanged is emitted once
+        """
+        if not replacements:
+            return
+
+        positions = []
+        for startAbsPos, endAbsPos, text in replacements:  # pylint: disable=W0612
+            positions.append(startAbsPos)
+            positions.append(endAbsPos)
+        scintillaPositions = list(self._toScintillaPositions(positions))
+
+        self._bulkReplaceInProgress = True
+        self.qscintilla.beginUndoAction()
+        try:
+            for index in range(len(replacements) - 1, -1, -1):
+                text = replacements[index][2].encode('utf8')
+                self.qscintilla.SendScintilla(self.qscintilla.SCI_SETTARGETSTART, scintillaPositions[index * 2])
+                self.qscintilla.SendScintilla(self.qscintilla.SCI_SETTARGETEND, scintillaPositions[index * 2 + 1])
+                self.qscintilla.SendScintilla(self.qscintilla.SCI_REPLACETARGET, len(text), text)
+        finally:
+            self.qscintilla.endUndoAction()
+            self._bulkReplaceInProgress = False
+            self._onTextChanged()
+
     def beginUndoAction(self):
         """Start doing set of modifications, which will be managed as one action.
         User can Undo and Redo all modifications with one action
@@ -581,6 +778,17 @@ class Editor(AbstractTextEditor):
         """
         return self.qscintilla.lines()
 
+    def visibleLines(self):
+        """Get tuple (first line, last line) of the text, visible on the screen
+        """
+        firstVisible = self.qscintilla.SendScintilla(self.qscintilla.SCI_GETFIRSTVISIBLELINE)
+        linesOnScreen = self.qscintilla.SendScintilla(self.qscintilla.SCI_LINESONSCREEN)
+        # Visible (display) lines differ from the document lines, if the text is folded or wrapped
+        firstLine = self.qscintilla.SendScintilla(self.qscintilla.SCI_DOCLINEFROMVISIBLE, firstVisible)
+        lastLine = self.qscintilla.SendScintilla(self.qscintilla.SCI_DOCLINEFROMVISIBLE,
+                                                 firstVisible + linesOnScreen)
+        return firstLine, min(lastLine, self.lineCount() - 1)
+
     def printFile(self):
         """Print file
         """
@@ -600,6 +808,17 @@ class Editor(AbstractTextEditor):
 
             printer.printRange(self.qscintilla, f, t)
 
+    def _toScintillaPositions(self, absPositions):
+        """Convert absolute positions to indexes, used internally by Scintilla. Generator.
+
+        We have positions as absolute position of unicode symbol or EOL.
+        Underlying Scintilla uses a byte index from the start of the text.
+        This index differs from absolute position, if \\r\\n or unicode is being used
+        """
+        for absPos in absPositions:
+            line, column = self._toLineCol(absPos)
+            yield self.qscintilla.positionFromLineIndex(line, column)
+
     def setExtraSelections(self, selections):
         """Set additional selections.
         Used for highlighting search results
@@ -608,55 +827,17 @@ class Editor(AbstractTextEditor):
         self.qscintilla.SendScintilla(self.qscintilla.SCI_INDICATORCLEARRANGE, 0, self.qscintilla.length())
         self.qscintilla.SendScintilla(self.qscintilla.SCI_SETINDICATORCURRENT, 0)
         
-        """hlamer: I'm very sorry, but, too lot of extra selections freezes the editor
-        I should to an optimization for searching and highlighting only visible lines
-        """
-        if len(selections) > 256:
-            return
+        # Count of selections is not limited. Search controller passes only selections on the visible lines,
+        # because highlighting all matches of a big file freezes the editor
         
-        """We have positions as turples (absolute position of unicode symbol or EOL, length)
-        We need to convert it to byte indexes, used internally by Scintilla
-        Sorry, code below is a bit complicated. It is optimized for performance, not for readability
-        !!! If you edited it, check performance with profiler on 4K LOC file. Try to search reg exp "." !!!
-        """
-        # Convert absolute positions to (line, column)
-        # Applying _toLineCol() to every item is too slow, if we have many search results (i.e. 5K)
-        line = 0
-        column = 0
-        lastPos = 0
-        text = self.text()
+        positions = []
         for startAbsPos, length in selections:
-            endAbsPos = startAbsPos + length
-        
-            # Calculate index of start of selection. WARNING: COPY-PASTED CODE, SEE BELOW
-            textBetween = text[lastPos:startAbsPos]
-            textBetweenLen = startAbsPos - lastPos
-            eolCount = textBetween.count('\n')
-            line = line + eolCount
-            if eolCount:
-                column = textBetweenLen - textBetween.rfind('\n') - 1
-            else:
-                column = column + textBetweenLen
-            startLine, startCol = line, column
-            lastPos = startAbsPos
-            
-            # Calculate index of end of selection WARNING: COPY-PASTED CODE, SEE ABOVE
-            textBetween = text[lastPos:endAbsPos]
-            textBetweenLen = endAbsPos - lastPos
-            eolCount = textBetween.count('\n')
-            line = line + eolCount
-            if eolCount:
-                column = textBetweenLen - textBetween.rfind('\n') - 1
-            else:
-                column = column + textBetweenLen
-            endLine, endCol = line, column
-            lastPos = endAbsPos
-            
-            #Underlying Scintilla uses a byte index from the start of the text
-            #This index differs from absolute position, if \r\n or unicode is being used
-            startScintillaIndex = self.qscintilla.positionFromLineIndex(startLine, startCol)
-            endScintillaIndex = self.qscintilla.positionFromLineIndex(endLine, endCol)
-        
+            positions.append(startAbsPos)
+            positions.append(startAbsPos + length)
+        scintillaPositions = self._toScintillaPositions(positions)
+
+        # zip() of the same generator returns pairs (start, end)
+        for startScintillaIndex, endScintillaIndex in zip(scintillaPositions, scintillaPositions):
             self.qscintilla.SendScintilla(self.qscintilla.SCI_INDICATORFILLRANGE,
                                           startScintillaIndex,
                                           endScintillaIndex - startScintillaIndex)
@@ -719,7 +900,7 @@ class Editor(AbstractTextEditor):
                 canMove = startLine + disposition >= 0
             else:  # move down
                 endAbsPos = self._toAbsPosition(endLine, endCol)
-                canMove = endAbsPos + 1 < len(self.text())
+                canMove = endAbsPos + 1 < self.textLength()
             
             if canMove:
                 self.beginUndoAction()
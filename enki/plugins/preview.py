@@ -33,6 +33,7 @@ class Plugin(QObject):
         self._wasVisible = None
         core.workspace().currentDocumentChanged.connect(self._onDocumentChanged)
         core.workspace().languageChanged.connect(self._onDocumentChanged)
+        self._onDocumentChanged()  # plugin might be loaded, when a previewable document is already opened
 
     def _onDocumentChanged(self):
         """Document or Language changed.
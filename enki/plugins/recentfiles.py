@@ -56,7 +56,7 @@ class Plugin(QObject):
         """List of existing recent files
         """
         opened = set([document.filePath() \
-                        for document in core.workspace().documents()])
+                        for document in core.workspace().documents(includePlaceholders=True)])
         return [path for path in self._recent \
                     if os.path.exists(path) and \
                     not path in opened]
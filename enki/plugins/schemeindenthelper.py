@@ -85,9 +85,9 @@ class SchemeIndentHelper(enki.core.abstractdocument.IndentHelper):
         curAbsPos = editor.absCursorPosition()
         curLine, curCol = editor.cursorPosition()
 
-        linesBefore = editor.lines()[:curLine]
-        
-        textBefore = '\n'.join(linesBefore)
+        textBefore = editor.textRange(0, curAbsPos - curCol)
+        if textBefore.endswith('\n'):  # EOL of the previous line
+            textBefore = textBefore[:-1]
 
         try:
             indentWidth = nextLineIndent(textBefore)
@@ -6,12 +6,14 @@ This module implements S&R plugin functionality. It joins together all other mod
 """
 import re
 
-from PyQt4.QtCore import QObject, Qt
+from PyQt4.QtCore import QObject, Qt, QTimer
 from PyQt4.QtGui import QApplication, QAction, QIcon, QMessageBox
 
 
 from enki.core.core import core
 import substitutions
+import replacer
+import matchindex
 
 ModeFlagSearch = 0x1
 ModeFlagReplace = 0x2
@@ -30,6 +32,9 @@ ModeReplaceOpenedFiles = ModeFlagReplace | ModeFlagOpenedFiles
 class Controller(QObject):
     """S&R module business logic
     """
+    HIGHLIGHT_DELAY_MS = 100  # Found items are highlighted, when user stopped typing or scrolling
+    HIGHLIGHT_MARGIN_LINES = 50  # Lines before and after the visible lines, which are highlighted too
+    
     def __init__(self):
         QObject.__init__(self)
         self._mode = None
@@ -37,11 +42,13 @@ class Controller(QObject):
         self._replaceThread = None
         self._widget = None
         self._dock = None
+        self._matchIndexes = {}  # document: matchindex.MatchIndex
         self._searchInFileStartPoint = None
         self._searchInFileLastCursorPos = None
         self._createActions()
         
         core.workspace().currentDocumentChanged.connect(self._resetSearchInFileStartPoint)
+        core.workspace().documentClosed.connect(self._onDocumentClosed)
         QApplication.instance().focusChanged.connect(self._resetSearchInFileStartPoint)
         # QScintilla .cursorPositionChanged is emitted with delay.
 
@@ -123,6 +130,11 @@ class Controller(QObject):
                       "search-replace-opened-files.png", "Ctrl+Alt+Meta+R",
                       "Replace in opened files...",
                       self._onModeSwitchTriggered, ModeReplaceOpenedFiles)
+        createAction("aUndoReplaceDirectory", "&Undo Replace in Directory",
+                      "undo.png", "",
+                      "Restore files, changed by the last replace in directory",
+                      self._onUndoReplaceInDirectoryTriggered, None,
+                      replacer.Journal().exists())
         
         am = core.actionManager()
         core.workspace().currentDocumentChanged.connect( \
@@ -143,11 +155,16 @@ class Controller(QObject):
         self._widget.searchInDirectoryStopPressed.connect(self._onSearchInDirectoryStopPressed)
         self._widget.replaceCheckedStartPressed.connect(self._onReplaceCheckedStartPressed)
         self._widget.replaceCheckedStopPressed.connect(self._onReplaceCheckedStopPressed)
+        self._highlightTimer = QTimer(self)
+        self._highlightTimer.setSingleShot(True)
+        self._highlightTimer.setInterval(self.HIGHLIGHT_DELAY_MS)
+        self._highlightTimer.timeout.connect(self._updateFoundItemsHighlighting)
+        
         self._widget.visibilityChanged.connect(self._updateFoundItemsHighlighting)
         
         self._widget.searchRegExpChanged.connect(self._updateFileActionsState)
         self._widget.searchRegExpChanged.connect(self._onRegExpChanged)
-        self._widget.searchRegExpChanged.connect(self._updateFoundItemsHighlighting)
+        self._widget.searchRegExpChanged.connect(self._highlightTimer.start)
         
         self._widget.searchNext.connect(self._onSearchNext)
         self._widget.searchPrevious.connect(self._onSearchPrevious)
@@ -157,7 +174,9 @@ class Controller(QObject):
         
         core.workspace().currentDocumentChanged.connect(self._updateFileActionsState)  # always disabled, if no widget
         core.workspace().currentDocumentChanged.connect(self._onCurrentDocumentChanged)
-        core.workspace().textChanged.connect(self._updateFoundItemsHighlighting)
+        core.workspace().textChanged.connect(self._highlightTimer.start)
+        if core.workspace().currentDocument() is not None:
+            core.workspace().currentDocument().visibleLinesChanged.connect(self._highlightTimer.start)
 
         core.mainWindow().centralLayout().addWidget( self._widget )
         self._widget.setVisible( False )
@@ -219,40 +238,54 @@ class Controller(QObject):
             return
         
         regExp = self._widget.getRegExp()
-        selections = [ (match.start(), len(match.group(0)))\
-                        for match in regExp.finditer(document.text())]
+        startAbsPos, endAbsPos = document.visibleAbsRange(self.HIGHLIGHT_MARGIN_LINES)
+        # Only part of the text is copied and searched. It ends HIGHLIGHT_MARGIN_LINES after the last highlighted
+        # line, so matches, which start in the highlighted range and span a few lines, are not cut
+        textEndPos = document.visibleAbsRange(self.HIGHLIGHT_MARGIN_LINES * 2)[1]
+        text = document.textRange(startAbsPos, textEndPos)
+        selections = []
+        for match in regExp.finditer(text):
+            if startAbsPos + match.start() > endAbsPos:
+                break
+            selections.append((startAbsPos + match.start(), len(match.group(0))))
         document.setExtraSelections(selections)
     
     def _onCurrentDocumentChanged(self, old, new):
-        """Current document changed. Clear highlighted items
+        """Current document changed. Clear highlighted items, highlight items in the new document
         """
         if old is not None:
+            old.visibleLinesChanged.disconnect(self._highlightTimer.start)
             old.setExtraSelections([])
+        if new is not None:
+            new.visibleLinesChanged.connect(self._highlightTimer.start)
+            self._highlightTimer.start()
     
-    @staticmethod
-    def _searchInText(regExp, text, startPoint, forward):
-        """Search in text and return tuple (nearest match, all matches)
-        (None, None) if not found
+    def _searchInDocument(self, document, regExp, startPoint, forward):
+        """Search in document, select the nearest match and show its number.
+        Returns start position of the match or None if not found
         """
-        matches = [m for m in regExp.finditer(text)]
-        if matches:
-            if forward:
-                matchesAfter = [match for match in matches \
-                                    if match.start() >= startPoint]
-                if matchesAfter:
-                    match = matchesAfter[0]
-                else:  # wrap, search from start
-                    match = matches[0]
-            else:  # reverse search
-                matchesBefore = [match for match in matches \
-                                    if match.start() < startPoint]
-                if matchesBefore:
-                    match = matchesBefore[-1]
-                else:  # wrap, search from end
-                    match = matches[-1]
-            return match, matches
-        else:
-            return None, None
+        index = self._matchIndexes.get(document)
+        if index is None:
+            index = matchindex.MatchIndex(document)
+            self._matchIndexes[document] = index
+        
+        found = index.find(regExp, startPoint, forward)
+        if found is None:
+            return None
+        
+        matchNumber, start, end = found
+        document.goTo(absPos = start, selectionLength = end - start)
+        if index.isComplete():
+            message = 'Match %d of %d' % (matchNumber + 1, index.count())
+        else:  # the rest of big document is being indexed
+            message = 'Match %d of at least %d' % (matchNumber + 1, index.count())
+        core.mainWindow().statusBar().showMessage(message, 3000)
+        return start
+
+    def _onDocumentClosed(self, document):
+        """Forget match index of the closed document
+        """
+        self._matchIndexes.pop(document, None)
 
     #
     # Search word under cursor
@@ -280,7 +313,6 @@ class Controller(QObject):
             return
         
         regExp = re.compile('\\b%s\\b' % re.escape(word))
-        text = document.text()
 
         # avoid matching word under cursor
         if forward:
@@ -288,12 +320,7 @@ class Controller(QObject):
         else:
             startPoint = wordStartAbsPos
         
-        match, matches = self._searchInText(regExp, document.text(), startPoint, forward)
-        if match is not None:
-            document.goTo(absPos = match.start(), selectionLength = len(match.group(0)))
-            core.mainWindow().statusBar().showMessage('Match %d of %d' % \
-                                                      (matches.index(match) + 1, len(matches)), 3000)
-        else:
+        if self._searchInDocument(document, regExp, startPoint, forward) is None:
             self._resetSelection(core.workspace().currentDocument())
 
     #
@@ -379,13 +406,10 @@ class Controller(QObject):
             else:
                 self._searchInFileStartPoint = start
         
-        match, matches = self._searchInText(regExp, document.text(), self._searchInFileStartPoint, forward)
-        if match:
-            document.goTo(absPos = match.start(), selectionLength = len(match.group(0)))
-            self._searchInFileLastCursorPos = match.start()
+        matchStart = self._searchInDocument(document, regExp, self._searchInFileStartPoint, forward)
+        if matchStart is not None:
+            self._searchInFileLastCursorPos = matchStart
             self._widget.setState(self._widget.Good)  # change background acording to result
-            core.mainWindow().statusBar().showMessage('Match %d of %d' % \
-                                                      (matches.index(match) + 1, len(matches)), 3000)
         else:
             self._widget.setState(self._widget.Bad)
             self._resetSelection(core.workspace().currentDocument())
@@ -427,32 +451,20 @@ class Controller(QObject):
 
         oldPos = document.absCursorPosition()
         
-        document.beginUndoAction()
-        
-        pos = 0
-        count = 0
-        match = regExp.search(document.text(), pos)
-        while match is not None:
-            document.goTo(absPos = match.start(), selectionLength = len(match.group(0)))
-            replaceTextSubed = substitutions.makeSubstitutions(replaceText, match)
-                
-            document.replaceSelectedText(replaceTextSubed)
-            
-            count += 1
-            
-            pos = match.start() + len(replaceTextSubed)
-            
-            if not match.group(0) and not replText:  # avoid freeze when replacing empty with empty
-                pos  += 1
-            if pos < len(document.text()):
-                match = regExp.search(document.text(), pos)
-            else:
-                match = None
-
-        document.endUndoAction()
+        replacements = replacer.findAllReplacements(document.text(), regExp, replaceText)
+        document.replaceMatches(replacements)
+        count = len(replacements)
         
         if oldPos is not None:
-            document.setCursorPosition(absPos = oldPos) # restore cursor position
+            # cursor is moved by replacements, which are before it. Inside replaced text it is moved to the end
+            shift = 0
+            for start, end, text in replacements:
+                if start >= oldPos:
+                    break
+                if end > oldPos:
+                    oldPos = end
+                shift += len(text) - (end - start)
+            document.setCursorPosition(absPos = oldPos + shift) # restore cursor position
         core.mainWindow().statusBar().showMessage( self.tr( "%d match(es) replaced." % count ), 3000 )
     
     #
@@ -515,7 +527,9 @@ class Controller(QObject):
         self._replaceThread.resultsHandled.connect(self._dock.onResultsHandledByReplaceThread)
         self._replaceThread.error.connect(self._onReplaceThreadError)
         self._replaceThread.finalStatus.connect(self._onReplaceThreadFinalStatus)
+        self._replaceThread.finished.connect(self._onReplaceThreadFinished)
 
+        self._widget.setReplaceInProgress(True)
         self._replaceThread.replace( self._dock.getCheckedItems(),
                                      replaceText)
 
@@ -534,6 +548,33 @@ class Controller(QObject):
         """Handler for replace in directory finished event
         """
         self._widget.setReplaceInProgress(False)
+        self._updateUndoReplaceAction()
+
+    def _updateUndoReplaceAction(self):
+        """Enable 'undo replace in directory', if there is the journal of the last replace
+        """
+        core.actionManager().action("mNavigation/mSearchReplace/aUndoReplaceDirectory").setEnabled(
+                                                                                replacer.Journal().exists())
+
+    def _onUndoReplaceInDirectoryTriggered(self):
+        """Handler for 'undo replace in directory' action.
+        Restore original files from the journal of the last replace
+        """
+        if self._replaceThread is not None and self._replaceThread.isRunning():
+            return
+
+        if QMessageBox.question(core.mainWindow(),
+                                self.tr("Undo replace in directory"),
+                                self.tr("Restore all files, changed by the last replace in directory?\n"
+                                        "Files, changed after the replace, are not restored"),
+                                QMessageBox.Yes | QMessageBox.No) != QMessageBox.Yes:
+            return
+
+        restored, errors = replacer.Journal().rollback(core.workspace().saveQueue().umask())
+        for error in errors:
+            core.mainWindow().appendMessage(error)
+        core.mainWindow().statusBar().showMessage(self.tr("%d file(s) restored") % restored, 3000)
+        self._updateUndoReplaceAction()
 
     def _onReplaceThreadFinalStatus(self, message):
         """Show replace thread status on status bar
@@ -0,0 +1,123 @@
+"""
+matchindex --- Cached positions of matches in a document
+========================================================
+
+Index is used by Search Next/Previous in the current file. Positions of all matches are kept in arrays, so
+next or previous match and its number are found with a binary search instead of searching the whole text on
+every step.
+
+Index is valid for one regular expression and one revision of the document text. It is invalidated, when the
+text is changed. Small texts are indexed at once. Big texts are indexed as far as it is required by the current
+step, the rest is indexed by small pieces in the GUI thread, when there are no events to process.
+"""
+
+import bisect
+import time
+from array import array
+
+from PyQt4.QtCore import QObject, QTimer
+
+
+class MatchIndex(QObject):
+    """Index of matches of a regular expression in a document
+    """
+    SYNC_INDEX_SIZE = 1024 * 1024  # Texts smaller than this are indexed at once
+    BACKGROUND_STEP_TIME = 0.02  # Seconds. Max time of one background indexing step
+
+    def __init__(self, document):
+        QObject.__init__(self, document)
+        self._document = document
+        self._key = None  # (pattern, flags, document revision)
+        self._starts = array('l')
+        self._ends = array('l')
+        self._iterator = None  # finditer() of the text. None, if all matches are indexed
+
+        self._backgroundTimer = QTimer(self)
+        self._backgroundTimer.setSingleShot(True)
+        self._backgroundTimer.timeout.connect(self._onBackgroundTimer)
+
+        document.textChanged.connect(self._onTextChanged)
+
+    def _onTextChanged(self):
+        """Document text changed. Index is not valid anymore
+        """
+        self._key = None
+        self._iterator = None
+        self._backgroundTimer.stop()
+
+    def _reset(self, regExp):
+        """Start indexing for the regular expression, if index is not valid for it
+        """
+        key = (regExp.pattern, regExp.flags, self._document.revision())
+        if key == self._key:
+            return
+
+        self._key = key
+        self._starts = array('l')
+        self._ends = array('l')
+        text = self._document.text()
+        self._iterator = regExp.finditer(text)
+        if len(text) < self.SYNC_INDEX_SIZE:
+            self._indexUntil(None)
+        else:
+            self._backgroundTimer.start(0)
+
+    def _indexUntil(self, position, deadline=None):
+        """Index matches until the first match, which starts at or after the position,
+        or until the deadline (time.time() value).
+        None position means "until the end of the text"
+        """
+        if self._iterator is None:
+            return
+
+        for match in self._iterator:
+            self._starts.append(match.start())
+            self._ends.append(match.end())
+            if position is not None and match.start() >= position:
+                return
+            if deadline is not None and time.time() > deadline:
+                return
+
+        self._iterator = None
+
+    def _onBackgroundTimer(self):
+        """Index next piece of the text
+        """
+        self._indexUntil(None, time.time() + self.BACKGROUND_STEP_TIME)
+        if self._iterator is not None:
+            self._backgroundTimer.start(0)
+
+    def isComplete(self):
+        """All matches of the text have been indexed. count() is exact
+        """
+        return self._iterator is None
+
+    def count(self):
+        """Count of indexed matches
+        """
+        return len(self._starts)
+
+    def find(self, regExp, startPoint, forward):
+        """Find the nearest match. Search is wrapped at the end (start) of the text.
+        Returns tuple (index of the match, start, end) or None if not found
+        """
+        self._reset(regExp)
+
+        if forward:
+            if not self._starts or self._starts[-1] < startPoint:
+                self._indexUntil(startPoint)
+            index = bisect.bisect_left(self._starts, startPoint)
+            if index == len(self._starts):  # wrap, search from start
+                index = 0
+        else:
+            if not self._starts or self._starts[-1] < startPoint:
+                self._indexUntil(startPoint)
+            index = bisect.bisect_left(self._starts, startPoint) - 1
+            if index < 0:  # wrap, search from end
+                self._indexUntil(None)
+                index = len(self._starts) - 1
+
+        if not self._starts:
+            return None
+
+        return index, self._starts[index], self._ends[index]
@@ -0,0 +1,105 @@
+"""
+planner --- Analysis of the searched regular expression
+=======================================================
+
+Planner finds strings, which must be present in a text, if the regular expression matches it.
+Files, which don't contain this strings, are skipped with a fast bytes-level search in the not decoded file
+contents, without running the regular expression.
+
+Module doesn't depend on Qt, plans are passed to the search worker processes
+"""
+
+import re
+import sre_parse
+import sre_constants
+
+
+def _literalRuns(subPattern):
+    """Get literal strings, which must be present in a text, if the parsed pattern matches it
+    """
+    runs = []
+    current = []
+
+    def flush():
+        """Finish current literal sequence
+        """
+        if current:
+            runs.append(u''.join(current))
+            del current[:]
+
+    for op, av in subPattern:
+        if op == sre_constants.LITERAL:
+            current.append(unichr(av))
+        elif op == sre_constants.SUBPATTERN:  # (group, pattern)
+            flush()
+            runs.extend(_literalRuns(av[1]))
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):  # (min, max, pattern)
+            flush()
+            if av[0] >= 1:  # repeated item is present at least once
+                runs.extend(_literalRuns(av[2]))
+        else:  # branches, character classes, etc. We don't know, what will be matched
+            flush()
+    flush()
+
+    return runs
+
+def requiredLiterals(regExp):
+    """Get list of strings, which must be present in a text, if regExp matches it.
+
+    Empty list means "can't say anything about the text"
+    """
+    try:
+        parsed = sre_parse.parse(regExp.pattern, regExp.flags)
+    except (sre_constants.error, ValueError):
+        return []
+
+    return _literalRuns(parsed)
+
+
+class SearchPlan:
+    """Plan of the search for a regular expression.
+
+    * regExp - the regular expression
+    * literals - list of strings, which must be present in a text, if regExp matches it.
+      If the regular expression is a plain string (a common case, when "Regular expression" option is
+      not checked), it is the only item of the list
+    """
+    def __init__(self, regExp):
+        self.regExp = regExp
+        self.literals = requiredLiterals(regExp)
+        self._ignoreCase = bool(regExp.flags & re.IGNORECASE)
+        self._prefilter = self._makePrefilter()
+
+    def _makePrefilter(self):
+        """Get list of utf8 encoded strings for bytes-level search, the longest first.
+
+        Case insensitive search is done in the lowercased bytes, therefore only ASCII literals are used
+        """
+        prefilter = []
+        for literal in self.literals:
+            if self._ignoreCase:
+                try:
+                    prefilter.append(literal.lower().encode('ascii'))
+                except UnicodeEncodeError:
+                    continue
+            else:
+                prefilter.append(literal.encode('utf8'))
+
+        return sorted(prefilter, key=len, reverse=True)
+
+    def mayMatch(self, data):
+        """Check not decoded utf8 file contents with the prefilter.
+
+        Returns False, if the regular expression definitely doesn't match the data
+        """
+        if not self._prefilter:
+            return True
+
+        if self._ignoreCase:
+            data = data.lower()
+
+        for literal in self._prefilter:
+            if data.find(literal) == -1:
+                return False
+
+        return True
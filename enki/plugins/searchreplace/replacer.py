@@ -0,0 +1,278 @@
+"""
+replacer --- Replacements in not opened files
+=============================================
+
+Code, which does replacements in files on the disk.
+
+Module doesn't depend on Qt, therefore it is imported and executed by
+the replace worker processes (see :class:`threads.ReplaceThread`)
+
+Files are written with :func:`enki.lib.atomicwrite.writeFileAtomically`, therefore file is never left
+truncated. Original file is kept in the :class:`Journal` directory, so a whole replace batch can be rolled back
+"""
+
+import os
+import os.path
+import shutil
+import json
+
+from enki.core.defines import CONFIG_DIR
+from enki.lib.atomicwrite import writeFileAtomically
+
+import substitutions
+
+_JOURNAL_DIR = os.path.join(CONFIG_DIR, 'replacejournal')
+_READ_CHUNK_SIZE = 1024 * 1024  # backup is restored by chunks
+
+
+def _replacements(matches, replaceText):
+    """Make list of (start, end, new text) for the matches
+    """
+    return [(match.start(), match.end(), substitutions.makeSubstitutions(replaceText, match)) \
+                for match in matches]
+
+def findReplacements(content, regExp, spans, replaceText, scanAfter=None):
+    """Make list of (start, end, new text) for the results of the search.
+
+    Results don't store match objects, therefore regExp is matched again at every (start, end) span.
+    Span is skipped, if the text has been changed and doesn't match.
+
+    scanAfter is (start, end) of the last stored match of a file, which results have been truncated, or None.
+    Matches after it are not stored, the text is searched for them again
+    """
+    def matches():
+        """Matches at the spans and after scanAfter. Generator
+        """
+        pos = 0
+        for start, end in sorted(spans):
+            if start < pos:  # overlaps previous match
+                continue
+            match = regExp.match(content, start)
+            if match is not None and match.end() == end:
+                yield match
+                pos = end
+
+        if scanAfter is not None:
+            for match in regExp.finditer(content, scanAfter[1]):
+                if match.start() < pos or match.span() == tuple(scanAfter):  # overlaps or it is the last stored
+                    continue
+                yield match
+
+    return _replacements(matches(), replaceText)
+
+def findAllReplacements(content, regExp, replaceText):
+    """Make list of (start, end, new text) for all occurrences of regExp in the text
+    """
+    return _replacements(regExp.finditer(content), replaceText)
+
+def applyReplacements(content, replacements):
+    """Build new text in one pass. replacements is list of (start, end, new text), sorted by position
+    """
+    parts = []
+    pos = 0
+    for start, end, text in replacements:
+        parts.append(content[pos:start])
+        parts.append(text)
+        pos = end
+    parts.append(content[pos:])
+
+    return u''.join(parts)
+
+def _backup(fileName, backupPath):
+    """Keep original file in the journal. Returns True, if hard link is used.
+    File, which has other hard links, is copied, because it is written in place and the link would be changed too.
+    Target of a symbolic link is kept
+    """
+    filePath = os.path.realpath(fileName)
+    if os.stat(filePath).st_nlink == 1:
+        try:
+            os.link(filePath, backupPath)
+            return True
+        except (OSError, AttributeError):  # other file system or link() is not supported
+            pass
+    shutil.copy2(filePath, backupPath)
+    return False
+
+def _readChunks(filePath):
+    """Read the file by chunks. Generator
+    """
+    with open(filePath, 'rb') as openedFile:
+        while True:
+            data = openedFile.read(_READ_CHUNK_SIZE)
+            if not data:
+                return
+            yield data
+
+def replaceInFile(task):
+    """Do replacements in the file. Worker process function.
+
+    task is tuple (file name, regExp, list of (start, end), scanAfter, replace text, backup path, umask).
+    See :func:`findReplacements` about scanAfter and :func:`enki.lib.atomicwrite.writeFileAtomically`
+    about the umask.
+    Returns tuple (file name, count of replacements, error message or None)
+    """
+    fileName, regExp, spans, scanAfter, replaceText, backupPath, umask = task
+    try:
+        with open(fileName, 'rb') as openedFile:
+            data = openedFile.read()
+    except IOError as ex:
+        return fileName, 0, "Error opening file: %s" % str(ex)
+
+    try:
+        content = unicode(data, 'utf8')
+    except UnicodeDecodeError as ex:
+        return fileName, 0, "File %s not read: unicode error '%s'. File may be corrupted" % (fileName, str(ex))
+
+    replacements = findReplacements(content, regExp, spans, replaceText, scanAfter)
+    if not replacements:
+        return fileName, 0, None
+    content = applyReplacements(content, replacements)
+
+    try:
+        data = content.encode('utf8')
+    except UnicodeEncodeError as ex:
+        return fileName, 0, "Failed to encode file to utf8: %s" % str(ex)
+
+    try:
+        linked = _backup(fileName, backupPath)
+        writeFileAtomically(fileName, [data], 'file', umask, ownLinks=1 if linked else 0)
+    except (IOError, OSError) as ex:
+        return fileName, 0, "Error while saving replaced content: %s" % str(ex)
+
+    return fileName, len(replacements), None
+
+
+class Journal:
+    """Journal of the last replace in not opened files.
+
+    List of files is written to the pending batch before the files are changed. Original file is linked or copied
+    to the batch directory just before it is replaced, therefore journal is valid even if the replace was interrupted.
+    When the replace is finished, the pending batch replaces the previous one, if at least one file has been changed.
+    Otherwise it is dropped and the previous batch can still be rolled back.
+
+    Sizes and modification times of the replaced files are remembered. Files, which have been changed after the
+    replace, are not restored
+    """
+    _JOURNAL_FILE = 'journal.json'
+    _PENDING = 'pending'  # batch of the replace in progress or interrupted
+    _DONE = 'done'  # batch of the last finished replace
+
+    def __init__(self, dirPath=_JOURNAL_DIR):
+        self._dirPath = dirPath
+        self._entries = []  # list of [file name, backup file name, [mtime, size] after the replace or None]
+
+    def _batchDir(self, batch):
+        """Directory of the batch
+        """
+        return os.path.join(self._dirPath, batch)
+
+    def _filePath(self, batch):
+        """Path of the journal file of the batch
+        """
+        return os.path.join(self._batchDir(batch), self._JOURNAL_FILE)
+
+    def _lastBatch(self):
+        """Batch, which shall be rolled back, or None
+        """
+        for batch in (self._PENDING, self._DONE):
+            if os.path.isfile(self._filePath(batch)):
+                return batch
+        return None
+
+    def exists(self):
+        """Check if there is a batch, which can be rolled back
+        """
+        return self._lastBatch() is not None
+
+    def _writeEntries(self):
+        """Write entries of the pending batch
+        """
+        with open(self._filePath(self._PENDING), 'w') as journalFile:
+            json.dump(self._entries, journalFile)
+
+    def _finishPending(self):
+        """Replace the last finished batch with the pending one
+        """
+        doneDir = self._batchDir(self._DONE)
+        if os.path.isdir(doneDir):
+            shutil.rmtree(doneDir)
+        os.rename(self._batchDir(self._PENDING), doneDir)
+
+    def create(self, fileNames):
+        """Start new pending batch. Previous batch is kept until :meth:`finish` is called.
+        Returns dictionary {file name: backup path}
+        """
+        if os.path.isdir(self._batchDir(self._PENDING)):  # interrupted replace. It is the last one now
+            self._finishPending()
+        os.makedirs(self._batchDir(self._PENDING))
+        self._entries = [[fileName, str(index), None] for index, fileName in enumerate(fileNames)]
+        self._writeEntries()
+        return dict([(fileName, os.path.join(self._batchDir(self._PENDING), backupName)) \
+                        for fileName, backupName, replacedStat in self._entries])
+
+    def finish(self, replacedFiles):
+        """Replace has been finished. replacedFiles is list of files, which have been changed.
+        Pending batch replaces the previous one, if the list is not empty, otherwise it is dropped
+        """
+        if not replacedFiles:
+            shutil.rmtree(self._batchDir(self._PENDING), ignore_errors=True)
+            return
+
+        replaced = set(replacedFiles)
+        for entry in self._entries:
+            if entry[0] in replaced:
+                try:
+                    stat = os.stat(entry[0])
+                except OSError:
+                    continue
+                entry[2] = [stat.st_mtime, stat.st_size]
+        self._writeEntries()
+        self._finishPending()
+
+    @staticmethod
+    def _isChanged(fileName, replacedStat):
+        """Check if the file has been changed after the replace
+        """
+        try:
+            stat = os.stat(fileName)
+        except OSError:  # removed
+            return True
+        return [stat.st_mtime, stat.st_size] != replacedStat
+
+    def rollback(self, umask):
+        """Restore original files of the last batch and discard it.
+        Contents is written back to the files, so links, permissions and ownership of the files are kept.
+        See :func:`enki.lib.atomicwrite.writeFileAtomically` about the umask.
+        Returns tuple (count of restored files, list of error messages)
+        """
+        batch = self._lastBatch()
+        if batch is None:
+            return 0, []
+
+        try:
+            with open(self._filePath(batch)) as journalFile:
+                entries = json.load(journalFile)
+        except (IOError, ValueError) as ex:
+            return 0, ["Failed to read replace journal: %s" % str(ex)]
+
+        restored = 0
+        errors = []
+        for fileName, backupName, replacedStat in entries:
+            backupPath = os.path.join(self._batchDir(batch), backupName)
+            if not os.path.exists(backupPath):  # file had not been changed
+                continue
+            if os.path.exists(fileName) and os.path.samefile(backupPath, fileName):  # linked, but not written
+                continue
+            if replacedStat is not None and self._isChanged(fileName, replacedStat):
+                errors.append("%s has been changed after the replace, not restored" % fileName)
+                continue
+            try:
+                writeFileAtomically(fileName, _readChunks(backupPath), 'file', umask)
+                os.remove(backupPath)  # not restored again, if the batch is kept because of errors
+                restored += 1
+            except (IOError, OSError) as ex:
+                errors.append("Failed to restore %s: %s" % (fileName, str(ex)))
+
+        if not errors:
+            shutil.rmtree(self._batchDir(batch), ignore_errors=True)
+        return restored, errors
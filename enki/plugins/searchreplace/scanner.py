@@ -0,0 +1,277 @@
+"""
+scanner --- Search in the file contents
+=======================================
+
+Code, which reads files and searches for the regular expression in it.
+
+Module doesn't depend on Qt and the core, therefore it is imported and executed by
+the search worker processes (see :class:`threads.SearchThread`)
+
+Files bigger than LARGE_FILE_SIZE are not loaded to the memory, but scanned by chunks with a bounded window
+(see :func:`scanLargeFile`). Count of stored matches per file is limited with MAX_MATCHES_PER_FILE.
+Results of such file are marked as truncated, replacing searches for the not stored matches again
+"""
+
+import os
+import codecs
+import itertools
+import array
+
+import searchindex
+
+LARGE_FILE_SIZE = 16 * 1024 * 1024  # bytes
+CHUNK_SIZE = 1024 * 1024  # bytes
+MAX_MATCH_LENGTH = 64 * 1024  # characters. Longer matches might be not found in large files
+MAX_LINE_LENGTH = 4096  # characters. Longer lines are cut in the search results for large files
+MAX_MATCHES_PER_FILE = 10000
+
+def isBinary(fileObject):
+    """Expects, that file position is 0, when exits, file position is 0
+    """
+    binary = '\0' in fileObject.read( 4096 )
+    fileObject.seek(0)
+    return binary
+
+
+def readFile(fileName, plan=None):
+    """Read text from file. Returns empty string for binary or not readable files.
+
+    If :class:`planner.SearchPlan` is passed, not decoded file contents is checked with its prefilter,
+    and empty string is returned, if the file can't contain matches
+    """
+    try:
+        with open(fileName) as openedFile:
+            if isBinary(openedFile):
+                return ''
+            data = openedFile.read()
+            if plan is not None and not plan.mayMatch(data):
+                return ''
+            return unicode(data, 'utf8', errors = 'ignore')
+    except IOError as ex:
+        print ex
+        return ''
+
+
+class FrozenMatch:
+    """Copy of a re match object, which can be passed between processes.
+
+    re match objects are not picklable. This class implements subset of the match object interface,
+    which is used by the search results and by substitutions.makeSubstitutions()
+
+    offset is added to the match positions. Used, when match was found in a part of the text
+    """
+    def __init__(self, match, offset=0):
+        self._start = match.start() + offset
+        self._end = match.end() + offset
+        self._groups = (match.group(0),) + match.groups()
+
+    def start(self):
+        """Start position of the match
+        """
+        return self._start
+
+    def end(self):
+        """End position of the match
+        """
+        return self._end
+
+    def group(self, index=0):
+        """Get captured group. Raises IndexError, if index is invalid
+        """
+        return self._groups[index]
+
+    def groups(self):
+        """Get all captured subgroups
+        """
+        return self._groups[1:]
+
+
+def scanContent(regExp, content):
+    """Search in the text. Generator.
+
+    Yields (match, line, column, wholeLine) tuple for every occurrence
+    """
+    lastPos = 0
+    eolCount = 0
+    eol = "\n"
+
+    # Process result for all occurrences
+    for match in regExp.finditer(content):
+        start = match.start()
+
+        eolStart = content.rfind( eol, 0, start)
+        eolEnd = content.find( eol, start + len(match.group(0)))
+        eolCount += content[lastPos:start].count( eol )
+        lastPos = start
+
+        wholeLine = content[eolStart+1 : eolEnd]
+        column = start - eolStart
+        if eolStart != 0:
+            column -= 1
+
+        yield match, eolCount, column, wholeLine
+
+def scanLargeFile(regExp, fileName):
+    """Search in the file without loading it to the memory. Generator.
+
+    File is read and decoded by chunks. Regular expression is searched in a window, which consists of
+    not processed tail of previous chunk and new chunk. Match is accepted, only if it ends
+    at least MAX_MATCH_LENGTH characters before the window end, or if the window end is the end of the file.
+    Lines are counted incrementally.
+
+    Yields (FrozenMatch, line, column, wholeLine) tuple for every occurrence.
+    Match positions are absolute positions in the file text
+    """
+    eol = u"\n"
+    decoder = codecs.getincrementaldecoder('utf8')(errors='ignore')
+
+    window = u''
+    windowOffset = 0  # position of the window start in the file text
+    searchPos = 0  # position in the window, from which search is continued
+    eolCount = 0  # count of EOLs before countedPos
+    countedPos = 0  # position in the window
+    lineStart = 0  # absolute position of the start of the line, which contains window start
+
+    try:
+        with open(fileName, 'rb') as openedFile:
+            if isBinary(openedFile):
+                return
+
+            finished = False
+            while not finished:
+                chunk = openedFile.read(CHUNK_SIZE)
+                finished = not chunk
+                window += decoder.decode(chunk, finished)
+
+                if finished:
+                    limit = len(window)
+                else:
+                    limit = len(window) - MAX_MATCH_LENGTH
+
+                nextPos = max(searchPos, limit)
+                for match in regExp.finditer(window, searchPos):
+                    if match.end() > limit:  # match might continue in the next chunk
+                        nextPos = match.start()
+                        break
+
+                    start = match.start()
+                    eolCount += window.count(eol, countedPos, start)
+                    countedPos = start
+
+                    eolStart = window.rfind(eol, 0, start)
+                    if eolStart != -1:
+                        lineStart = windowOffset + eolStart + 1
+                    eolEnd = window.find(eol, match.end())
+                    if eolEnd == -1:
+                        eolEnd = len(window)
+                    wholeLine = window[max(eolStart + 1, start - MAX_LINE_LENGTH) : \
+                                       min(eolEnd, match.end() + MAX_LINE_LENGTH)]
+
+                    yield FrozenMatch(match, windowOffset), eolCount, windowOffset + start - lineStart, wholeLine
+
+                    nextPos = max(match.end(), limit)
+
+                # Drop processed part of the window, but keep beginning of the current line for wholeLine.
+                # Window size is bounded even if a match or a line is too long
+                cutPos = max(window.rfind(eol, 0, nextPos) + 1,
+                             nextPos - MAX_LINE_LENGTH,
+                             limit - MAX_MATCH_LENGTH,
+                             0)
+                cutPos = min(cutPos, nextPos)
+                if countedPos < cutPos:
+                    eolCount += window.count(eol, countedPos, cutPos)
+                    countedPos = 0
+                else:
+                    countedPos -= cutPos
+                eolBeforeCut = window.rfind(eol, 0, cutPos)
+                if eolBeforeCut != -1:
+                    lineStart = windowOffset + eolBeforeCut + 1
+
+                window = window[cutPos:]
+                windowOffset += cutPos
+                searchPos = nextPos - cutPos
+    except IOError as ex:
+        print ex
+
+def _isLargeFile(fileName):
+    """Check if file shall be scanned by chunks
+    """
+    try:
+        return os.path.getsize(fileName) > LARGE_FILE_SIZE
+    except OSError:
+        return False
+
+def scanFile(plan, fileName, content, needSignature):
+    """Search in the file for the regular expression of the :class:`planner.SearchPlan`.
+
+    content is text of the file or None, if file shall be read.
+    Returns tuple (iterator of (match, line, column, wholeLine), signature).
+    Iterator yields at most MAX_MATCHES_PER_FILE + 1 matches. The last one only shows, that there are more matches.
+    Signature is a trigram signature for the :class:`searchindex.SearchIndex` or None, if not needSignature.
+    Signature is never required for large files, they are bigger than :data:`searchindex.INDEX_MAX_FILE_SIZE`
+    """
+    signature = None
+    if content is None and _isLargeFile(fileName):
+        matches = scanLargeFile(plan.regExp, fileName)
+    else:
+        if content is None:
+            if needSignature:  # whole contents is required for the signature
+                content = readFile(fileName)
+            else:
+                content = readFile(fileName, plan)
+        matches = scanContent(plan.regExp, content)
+        if needSignature:
+            signature = searchindex.trigramSignature(content)
+
+    return itertools.islice(matches, MAX_MATCHES_PER_FILE + 1), signature
+
+def compactMatches(matches):
+    """Convert iterable of (match, line, column, wholeLine) to the compact form, which is stored
+    by the search results and passed between processes.
+
+    Returns tuple (starts, ends, lines, columns, truncated). Positions are stored in typed arrays, text is not stored.
+    At most MAX_MATCHES_PER_FILE matches are stored, truncated is True, if there are more
+    """
+    starts = array.array('l')
+    ends = array.array('l')
+    lines = array.array('l')
+    columns = array.array('l')
+    truncated = False
+    for match, line, column, wholeLine in matches:  # pylint: disable=W0612
+        if len(starts) == MAX_MATCHES_PER_FILE:
+            truncated = True
+            break
+        starts.append(match.start())
+        ends.append(match.end())
+        lines.append(line)
+        columns.append(column)
+    return starts, ends, lines, columns, truncated
+
+#
+# Worker process part
+#
+
+_workerPlan = None
+
+def initWorker(plan):
+    """Worker process initializer. Remembers :class:`planner.SearchPlan`, which will be executed
+    """
+    global _workerPlan  # pylint: disable=W0603
+    _workerPlan = plan
+
+def _scanFile(fileName, content, needSignature):
+    """Search in the file. Returns tuple (compact matches, signature).
+    Signature is None, if not needSignature
+    """
+    matches, signature = scanFile(_workerPlan, fileName, content, needSignature)
+    return compactMatches(matches), signature
+
+def scanFilesInWorker(tasks):
+    """Worker process function.
+
+    tasks is list of (file name, file contents or None, need signature). Contents is passed for opened files.
+    Trigram signature for the search index is calculated, if need signature is True
+    Returns list of (file name, compact matches, signature or None). See :func:`compactMatches`
+    """
+    return [(fileName,) + _scanFile(fileName, content, needSignature) \
+                for fileName, content, needSignature in tasks]
@@ -0,0 +1,197 @@
+"""
+searchindex --- Persistent trigram index for search in directory
+================================================================
+
+Index remembers, which trigrams (3 symbol sequences) every file contains.
+Before searching, literal parts of the regular expression are extracted by :mod:`planner`, and files, which
+can't contain it, are skipped without reading.
+
+Trigrams of a file are stored as a bit signature (a Bloom filter with two hash functions). Size of the signature
+depends on count of different trigrams in the file, so big files don't set all bits. The signature may say
+"file probably contains the trigram" for a file, which doesn't contain it, but never says "doesn't contain"
+for a file, which contains it. Therefore index never hides a real match.
+
+Files bigger than :data:`INDEX_MAX_FILE_SIZE` are not indexed and always searched.
+
+Index is stored in CONFIG_DIR, one file per search root. File is reindexed, when its modification time or size
+has been changed.
+
+Module doesn't depend on Qt, signatures are calculated by the search worker processes
+"""
+
+import os
+import os.path
+import hashlib
+import binascii
+import zlib
+import cPickle
+
+from enki.core.defines import CONFIG_DIR
+
+_INDEX_DIR = os.path.join(CONFIG_DIR, 'searchindex')
+_FORMAT_VERSION = 2
+
+INDEX_MAX_FILE_SIZE = 1024 * 1024  # bytes. Bigger files are not indexed
+
+_MIN_SIGNATURE_BITS = 256
+_MAX_SIGNATURE_BITS = 256 * 1024
+_BITS_PER_TRIGRAM = 2  # with 2 hash functions every trigram of a query passes a foreign file with P ~ 0.4
+
+
+def _trigrams(text):
+    """Set of trigrams of the UTF-8 encoded text. Case insensitive.
+    Trigrams are generated one by one, the list of all trigrams of the text is not built
+    """
+    data = text.lower().encode('utf8')
+    return set(data[i:i + 3] for i in xrange(len(data) - 2))  # empty for texts shorter than 3 bytes
+
+def _signatureSize(trigramCount):
+    """Count of bits of the signature for the count of trigrams. Power of 2
+    """
+    bitCount = _MIN_SIGNATURE_BITS
+    while bitCount < trigramCount * _BITS_PER_TRIGRAM and bitCount < _MAX_SIGNATURE_BITS:
+        bitCount *= 2
+    return bitCount
+
+def _setBits(bits, trigrams):
+    """Set bits of the trigrams in the bytearray. Every trigram sets 2 bits
+    """
+    mask = len(bits) * 8 - 1
+    for trigram in trigrams:
+        for bitIndex in (zlib.crc32(trigram) & mask, zlib.crc32(trigram[::-1]) & mask):
+            bits[bitIndex / 8] |= 1 << (bitIndex % 8)
+
+def _toLong(bits):
+    """Convert bytearray of bits to long. The first byte is the lowest
+    """
+    bits = bytearray(bits)
+    bits.reverse()  # the lowest byte must be the last in the hex string
+    return long(binascii.hexlify(bits), 16)
+
+def trigramSignature(text):
+    """Calculate signature of the text.
+    Returns tuple (count of bits, long, where bits are set for every contained trigram).
+    Size of the signature is chosen by the count of trigrams
+    """
+    trigrams = _trigrams(text)
+    bitCount = _signatureSize(len(trigrams))
+    bits = bytearray(bitCount / 8)
+    _setBits(bits, trigrams)
+    return bitCount, _toLong(bits)
+
+class SearchIndex:
+    """Trigram index of the search root directory.
+
+    Usage:
+
+    * filterFile() for every file before the search
+    * update() for every stale file, after it had been read
+    * removeMissing() when the whole directory has been walked
+    * save() when search is finished
+
+    filterFile() and update() may be called from different threads
+    """
+    def __init__(self, rootPath, plan):
+        """plan is :class:`planner.SearchPlan` of the current search
+        """
+        self._rootPath = rootPath
+        self._filePath = os.path.join(_INDEX_DIR,
+                                      hashlib.md5(rootPath.encode('utf8')).hexdigest() + '.pickle')
+        self._files = {}  # file path: (mtime, size, signature)
+        self._pendingStats = {}  # file path: (mtime, size) for files, which are being reindexed
+
+        self._queryTrigrams = set()  # trigrams of the literals of the query
+        for literal in plan.literals:
+            self._queryTrigrams.update(_trigrams(literal))
+        self._queryMasks = {}  # signature bit count: signature of the query literals
+
+        self._load()
+
+    def _queryMask(self, bitCount):
+        """Signature of the query literals for signatures of the size
+        """
+        mask = self._queryMasks.get(bitCount)
+        if mask is None:
+            bits = bytearray(bitCount / 8)
+            _setBits(bits, self._queryTrigrams)
+            mask = _toLong(bits)
+            self._queryMasks[bitCount] = mask
+        return mask
+
+    def _load(self):
+        """Load the index from the disk. Broken or outdated index is ignored
+        """
+        if not os.path.exists(self._filePath):
+            return
+
+        try:
+            with open(self._filePath, 'rb') as openedFile:
+                data = cPickle.load(openedFile)
+        except Exception, ex:  # broken file? Will be rebuilt
+            print 'Failed to load search index %s: %s' % (self._filePath, str(ex))
+            return
+
+        if data.get('version') == _FORMAT_VERSION and \
+           data.get('root') == self._rootPath:
+            self._files = data['files']
+
+    def save(self):
+        """Save the index to the disk. Writes temporary file and renames it,
+        so index is never left half written
+        """
+        data = {'version': _FORMAT_VERSION,
+                'root': self._rootPath,
+                'files': self._files}
+        tmpPath = self._filePath + '.tmp'
+        try:
+            if not os.path.isdir(_INDEX_DIR):
+                os.makedirs(_INDEX_DIR)
+            with open(tmpPath, 'wb') as openedFile:
+                cPickle.dump(data, openedFile, cPickle.HIGHEST_PROTOCOL)
+            os.rename(tmpPath, self._filePath)
+        except (OSError, IOError), ex:
+            print 'Failed to save search index %s: %s' % (self._filePath, str(ex))
+
+    def filterFile(self, filePath, stat=None):
+        """Check if the file might contain matches.
+        stat is ``os.stat()`` result of the file, if already known, i.e. from the directory walker.
+
+        Returns tuple (candidate, stale). Candidate is True, if file shall be searched.
+        Stale is True, if file is not indexed or had been changed since indexed.
+        Stale files are always candidates. Too big files are always candidates and never stale
+        """
+        if stat is None:
+            try:
+                stat = os.stat(filePath)
+            except OSError:
+                return False, False
+
+        if stat.st_size > INDEX_MAX_FILE_SIZE:
+            self._files.pop(filePath, None)
+            return True, False
+
+        fileStat = (stat.st_mtime, stat.st_size)
+        indexed = self._files.get(filePath)
+        if indexed is None or indexed[:2] != fileStat:
+            self._pendingStats[filePath] = fileStat
+            return True, True
+
+        bitCount, signature = indexed[2]
+        queryMask = self._queryMask(bitCount)
+        return signature & queryMask == queryMask, False
+
+    def update(self, filePath, signature):
+        """Stale file has been read. Update its signature
+        """
+        fileStat = self._pendingStats.pop(filePath, None)
+        if fileStat is not None:
+            self._files[filePath] = fileStat + (signature,)
+
+    def removeMissing(self, existingFiles):
+        """Remove from the index files, which are not in existingFiles list.
+        Called after the whole tree has been walked
+        """
+        existing = set(existingFiles)
+        for filePath in self._files.keys():
+            if not filePath in existing:
+                del self._files[filePath]
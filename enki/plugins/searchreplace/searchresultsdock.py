@@ -164,16 +164,17 @@ class SearchResultsDock(DockWidget):
     def _onResultActivated(self, index ):
         """Item doubleclicked in the model, opening file
         """
-        result = index.internalPointer()
-        if isinstance(result, searchresultsmodel.Result):
+        result = self._model.resultForIndex(index)
+        if result is not None:
             fileResults = index.parent().internalPointer()
             core.workspace().goTo( result.fileName,
                                    line=result.line,
                                    column=result.column,
-                                   selectionLength=len(result.match.group(0)))
-            core.mainWindow().statusBar().showMessage('Match %d of %d' % \
-                                                      (fileResults.results.index(result) + 1,
-                                                       len(fileResults.results)), 3000)
+                                   selectionLength=result.end - result.start)
+            message = 'Match %d of at least %d' if fileResults.truncated else 'Match %d of %d'
+            core.mainWindow().statusBar().showMessage(message % \
+                                                      (result.row + 1,
+                                                       fileResults.count()), 3000)
             self.setFocus()
 
     def clear(self):
@@ -187,17 +188,10 @@ class SearchResultsDock(DockWidget):
         self._model.appendResults(fileResultList)
 
     def getCheckedItems(self):
-        """Get items, which must be replaced, as dictionary {file name : list of items}
+        """Get items, which must be replaced, as dictionary {file name : (regExp, list of (start, end), scanAfter)}
+        See :meth:`searchresultsmodel.SearchResultsModel.checkedMatches`
         """
-        items = {}
-
-        for fileRes in self._model.fileResults:
-            for row, result in enumerate(fileRes.results):
-                if result.checkState == Qt.Checked :
-                    if not result.fileName in items: 
-                        items[result.fileName] = []
-                    items[ result.fileName ].append(result)
-        return items
+        return self._model.checkedMatches()
 
     def setReplaceMode(self, enabled):
         """When replace mode is enabled, dock shows checkbox near every item
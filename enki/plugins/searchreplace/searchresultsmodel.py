@@ -3,6 +3,9 @@ searchresultsmodel --- Model for search results
 ===============================================
 """
 
+import os.path
+import collections
+
 from PyQt4.QtCore import pyqtSignal, QAbstractItemModel, \
                          QDir, \
                          QModelIndex, Qt, \
@@ -11,23 +14,85 @@ from PyQt4.QtCore import pyqtSignal, QAbstractItemModel, \
 from PyQt4.QtGui import QApplication
 
 from enki.lib.htmldelegate import htmlEscape
+from enki.core.core import core
+
+import scanner
+
+
+class _LineCache:
+    """Lines of recently displayed files.
+
+    Search results don't store text of the lines, it is read, when the result is displayed.
+    Lines of opened documents are taken from the editor. Lines of large files are not read
+    """
+    MAX_FILES = 8
+
+    def __init__(self):
+        self._files = collections.OrderedDict()  # file name: list of lines or None
+
+    def clear(self):
+        """Forget all lines. Files might be changed
+        """
+        self._files.clear()
+
+    @staticmethod
+    def _readLines(fileName):
+        """Read lines of the file. Returns None for too large files
+        """
+        try:
+            if os.path.getsize(fileName) > scanner.LARGE_FILE_SIZE:
+                return None
+        except OSError:
+            return None
+
+        return scanner.readFile(fileName).split('\n')
+
+    def line(self, fileName, index):
+        """Get text of the line or None, if not available
+        """
+        document = core.workspace().findDocumentForPath(fileName)
+        if document is not None and hasattr(document, 'line'):
+            if index < document.lineCount():
+                return document.line(index)
+            return None
+
+        if fileName in self._files:
+            lines = self._files.pop(fileName)
+        else:
+            lines = self._readLines(fileName)
+        self._files[fileName] = lines  # move to the end, as recently used
+        if len(self._files) > self.MAX_FILES:
+            self._files.popitem(last=False)
+
+        if lines is None or index >= len(lines):
+            return None
+        return lines[index]
+
 
 class Result:  # pylint: disable=R0902
-    """One found by search thread item. Consists coordinates and capture. Used by SearchResultsModel
+    """One found by search thread item. Consists coordinates and checked state.
+
+    Results are not stored by the model. The object is created on demand from the :class:`FileResults` arrays
     """
-    def __init__ (self, fileName, wholeLine, line, column, match):  # pylint: disable=R0913
-        self.fileName = fileName
-        self.wholeLine = wholeLine
-        self.line = line
-        self.column = column
-        self.match = match
-        self.checkState = Qt.Checked
+    def __init__ (self, fileResults, row):
+        self.fileName = fileResults.fileName
+        self.row = row
+        self.line = fileResults.lines[row]
+        self.column = fileResults.columns[row]
+        self.start = fileResults.starts[row]
+        self.end = fileResults.ends[row]
+        self.checkState = fileResults.checkStates[row]
     
-    def text(self):  # pylint: disable=W0613
-        """Displayable text of search result. Shown as line in the search results dock
+    def text(self, wholeLine):
+        """Displayable text of search result. Shown as line in the search results dock.
+        wholeLine is text of the line, which contains the match, or None, if not available
         """
-        beforeMatch = self.wholeLine[:self.column].lstrip()
-        afterMatch = self.wholeLine[self.column + len(self.match.group(0)):].rstrip()
+        if wholeLine is None:
+            return 'Line: %d, Column: %d' % (self.line + 1, self.column)
+
+        matchEnd = self.column + self.end - self.start
+        beforeMatch = wholeLine[:self.column].lstrip()
+        afterMatch = wholeLine[matchEnd:].rstrip()
         
         if QApplication.instance().palette().base().color().lightnessF() > 0.5:
             backgroundColor = 'yellow'
@@ -46,60 +111,110 @@ class Result:  # pylint: disable=R0902
                   htmlEscape(beforeMatch),
                   backgroundColor,
                   foregroundColor,
-                  htmlEscape(self.match.group(0)),
+                  htmlEscape(wholeLine[self.column:matchEnd]),
                   htmlEscape(afterMatch))
     
-    def tooltip(self):
+    def tooltip(self, wholeLine):
         """Tooltip of the search result"""
-        return self.wholeLine
-    
-    def hasChildren(self):
-        """Check if QAbstractItem has children"""
-        return False
+        return wholeLine or ''
+
+
+class _Children:
+    """Internal pointer of the model indexes of a file matches.
+
+    Matches are not stored as objects, therefore indexes of all matches of a file point to this object
+    """
+    def __init__(self, fileResults):
+        self.fileResults = fileResults
+
 
 class FileResults:
-    """Object stores all items, found in the file
+    """Object stores all items, found in the file.
+
+    Positions of the matches are stored in typed arrays (see :func:`scanner.compactMatches`),
+    checked states - in a bytearray. Memory usage is small even for millions of matches.
+
+    regExp is the searched regular expression. It is used to match the text again, when replacing
+
+    If the file contains more than :data:`scanner.MAX_MATCHES_PER_FILE` matches, only the first ones are stored,
+    and truncated is True. Not stored matches are searched again and replaced, if the file is checked
     """
-    def __init__(self, baseDir, fileName, results):
+    def __init__(self, baseDir, fileName, regExp, compactMatches):  # pylint: disable=R0913
         self.baseDir = baseDir
         self.fileName = fileName
-        self.results = results
+        self.regExp = regExp
+        self.starts, self.ends, self.lines, self.columns, self.truncated = compactMatches
+        self.checkStates = bytearray([Qt.Checked]) * len(self.starts)
         self.checkState = Qt.Checked
+        self.children = _Children(self)
     
     def __str__(self):
         """Convertor to string. Used for debugging
         """
-        return '%s (%d)' % (self.fileName, len(self.results))
+        return '%s (%d)' % (self.fileName, self.count())
     
+    def count(self):
+        """Count of matches
+        """
+        return len(self.starts)
+
+    def result(self, row):
+        """Get :class:`Result` for the match
+        """
+        return Result(self, row)
+
+    def setCheckState(self, state):
+        """Set checked state for the file and all the matches
+        """
+        self.checkState = state
+        self.checkStates[:] = bytearray([state]) * self.count()
+
     def updateCheckState(self):
         """Update own checked state after checked state of child result changed or
         child result removed
         """
-        if all([res.checkState == Qt.Checked for res in self.results]):  # if all checked
+        if not Qt.Checked in self.checkStates:
+            self.checkState = Qt.Unchecked
+        elif not Qt.Unchecked in self.checkStates:
             self.checkState = Qt.Checked
-        elif any([res.checkState == Qt.Checked for res in self.results]):  # if any checked
-            self.checkState = Qt.PartiallyChecked
         else:
-            self.checkState = Qt.Unchecked
+            self.checkState = Qt.PartiallyChecked
     
+    def removeRows(self, first, last):
+        """Remove matches from first to last row inclusive
+        """
+        for storage in (self.starts, self.ends, self.lines, self.columns, self.checkStates):
+            del storage[first:last + 1]
+
     def text(self):
         """Displayable text of the file results. Shown as line in the search results dock
         baseDir is base directory of current search operation
         """
-        return '%s (%d)' % (QDir(self.baseDir).relativeFilePath(self.fileName), len(self.results))
+        if self.truncated:
+            countText = 'first %d matches' % self.count()
+        else:
+            countText = '%d' % self.count()
+        return '%s (%s)' % (QDir(self.baseDir).relativeFilePath(self.fileName), countText)
     
     def tooltip(self):
         """Tooltip of the item in the results dock
         """
+        if self.truncated:
+            return '%s\nFile contains more than %d matches, only the first ones are shown.\n' \
+                   'Replacing replaces not shown matches too, unless the file is unchecked' % \
+                        (self.fileName, scanner.MAX_MATCHES_PER_FILE)
         return self.fileName
     
     def hasChildren(self):
         """Check if item has children
         """
-        return 0 != len(self.results)
+        return 0 != self.count()
 
 class SearchResultsModel(QAbstractItemModel):
     """AbstractItemodel used for display search results in 'Search in directory' and 'Replace in directory' mode
+
+    Top level indexes point to :class:`FileResults`, match indexes point to its children object.
+    Match data is created only for displayed rows
     """
     firstResultsAvailable = pyqtSignal()
     
@@ -108,6 +223,7 @@ class SearchResultsModel(QAbstractItemModel):
         """
         QAbstractItemModel.__init__(self, parent )
         self._replaceMode = False
+        self._lineCache = _LineCache()
         
         self.fileResults = []  # list of FileResults
 
@@ -118,7 +234,7 @@ class SearchResultsModel(QAbstractItemModel):
         if self.fileResults:
             self.dataChanged.emit(self.index(0, 0, QModelIndex()),
                                   self.index(len(self.fileResults) - 1,
-                                             len(self.fileResults[-1].results) - 1,
+                                             self.fileResults[-1].count() - 1,
                                              QModelIndex()))
 
     def index(self, row, column, parent ):
@@ -128,8 +244,7 @@ class SearchResultsModel(QAbstractItemModel):
             return QModelIndex()
         
         if parent.isValid():  # index for result
-            result = parent.internalPointer().results[row]
-            return self.createIndex( row, column, result )
+            return self.createIndex( row, column, parent.internalPointer().children )
         else:  # need index for fileRes
             return self.createIndex( row, column, self.fileResults[row])
 
@@ -139,12 +254,12 @@ class SearchResultsModel(QAbstractItemModel):
         if not index.isValid() :
             return QModelIndex()
         
-        if not isinstance(index.internalPointer(), Result):  # it is an top level item
+        if not isinstance(index.internalPointer(), _Children):  # it is an top level item
             return QModelIndex()
         
-        result = index.internalPointer()
-        for row, fileRes in enumerate(self.fileResults):
-            if fileRes.fileName == result.fileName:
+        fileRes = index.internalPointer().fileResults
+        for row, item in enumerate(self.fileResults):
+            if item is fileRes:
                 return self.createIndex(row, 0, fileRes)
         else:
             assert(0)
@@ -153,10 +268,12 @@ class SearchResultsModel(QAbstractItemModel):
         """See QAbstractItemModel docs
         """
         # root parents
-        if item.isValid():
+        if not item.isValid():
+            return len(self.fileResults) != 0
+        elif isinstance(item.internalPointer(), FileResults):
             return item.internalPointer().hasChildren()
         else:
-            return len(self.fileResults) != 0
+            return False
 
     def columnCount(self, parent ):  # pylint: disable=W0613
         """See QAbstractItemModel docs
@@ -168,10 +285,10 @@ class SearchResultsModel(QAbstractItemModel):
         """
         if not parent.isValid():  # root elements
             return len(self.fileResults)
-        elif isinstance(parent.internalPointer(), Result):  # result
+        elif isinstance(parent.internalPointer(), _Children):  # result
             return 0
         elif isinstance(parent.internalPointer(), FileResults):  # file
-            return len(parent.internalPointer().results)
+            return parent.internalPointer().count()
         else:
             assert(0)
     
@@ -185,21 +302,38 @@ class SearchResultsModel(QAbstractItemModel):
         
         return flags
     
+    def resultForIndex(self, index):
+        """Get :class:`Result` for the index or None, if the index is not a match
+        """
+        if index.isValid() and isinstance(index.internalPointer(), _Children):
+            return index.internalPointer().fileResults.result(index.row())
+        return None
+
     def data(self, index, role ):
         """See QAbstractItemModel docs
         """
         if not index.isValid() :
             return QVariant()
         
-        # Common code for file and result
-        result = index.internalPointer()
-        if role == Qt.DisplayRole:
-            return result.text()
-        elif role == Qt.ToolTipRole:
-            return result.tooltip()
-        elif role == Qt.CheckStateRole:
+        if isinstance(index.internalPointer(), _Children):
+            result = self.resultForIndex(index)
+            if role == Qt.DisplayRole:
+                return result.text(self._lineCache.line(result.fileName, result.line))
+            elif role == Qt.ToolTipRole:
+                return result.tooltip(self._lineCache.line(result.fileName, result.line))
+        else:
+            fileRes = index.internalPointer()
+            if role == Qt.DisplayRole:
+                return fileRes.text()
+            elif role == Qt.ToolTipRole:
+                return fileRes.tooltip()
+
+        if role == Qt.CheckStateRole:
             if  self.flags( index ) & Qt.ItemIsUserCheckable:
-                return result.checkState
+                if isinstance(index.internalPointer(), _Children):
+                    return index.internalPointer().fileResults.checkStates[index.row()]
+                else:
+                    return index.internalPointer().checkState
         
         return QVariant()
     
@@ -209,24 +343,21 @@ class SearchResultsModel(QAbstractItemModel):
         If file unchecked - we need uncheck all items,
         if item unchecked...
         """
-        if isinstance(index.internalPointer(), Result):  # it is a Result
+        if isinstance(index.internalPointer(), _Children):  # it is a Result
             if role == Qt.CheckStateRole:
                 # update own state
-                index.internalPointer().checkState = value.toInt()[0]
+                fileRes = index.internalPointer().fileResults
+                fileRes.checkStates[index.row()] = value.toInt()[0]
                 self.dataChanged.emit( index, index )  # own checked state changed
                 # update parent state
-                fileRes = index.parent().internalPointer()
-                assert(isinstance(fileRes, FileResults))
                 fileRes.updateCheckState()
                 self.dataChanged.emit(index.parent(), index.parent())  # parent checked state might be changed
         elif isinstance(index.internalPointer(), FileResults):  # it is a FileResults
             if role == Qt.CheckStateRole:
                 fileRes = index.internalPointer()
-                fileRes.checkState = value.toInt()[0]
-                for res in fileRes.results:
-                    res.checkState = value.toInt()[0]
+                fileRes.setCheckState(value.toInt()[0])
                 firstChildIndex = self.index(0, 0, index)
-                lastChildIndex = self.index(len(fileRes.results) - 1, 0, index)
+                lastChildIndex = self.index(fileRes.count() - 1, 0, index)
                 self.dataChanged.emit(firstChildIndex, lastChildIndex)
         else:
             assert(0)
@@ -236,9 +367,7 @@ class SearchResultsModel(QAbstractItemModel):
         """Check all items
         """
         for fileRes in self.fileResults:
-            fileRes.checkState = state
-            for match in fileRes.results:
-                match.checkState = state
+            fileRes.setCheckState(state)
         self.dataChanged.emit(self.createIndex(0, 0, self.fileResults[0]),
                               self.createIndex(len(self.fileResults) - 1, 0, self.fileResults[-1]))
     
@@ -254,6 +383,7 @@ class SearchResultsModel(QAbstractItemModel):
         """
         self.beginRemoveRows(QModelIndex(), 0, len(self.fileResults) - 1)
         self.fileResults = []
+        self._lineCache.clear()
         self.endRemoveRows()
 
     def appendResults(self, fileResultList ):
@@ -268,23 +398,48 @@ class SearchResultsModel(QAbstractItemModel):
         self.fileResults.extend(fileResultList)
         self.endInsertRows()
     
-    def onResultsHandledByReplaceThread(self, fileName, results):
-        """Replace thread has processed result, need to it from the model
+    def checkedMatches(self):
+        """Get matches, which must be replaced, as dictionary {file name : (regExp, list of (start, end), scanAfter)}
+        scanAfter is (start, end) of the last stored match of a truncated file, not stored matches after it
+        are replaced too. None for not truncated files
+        """
+        items = {}
+        for fileRes in self.fileResults:
+            spans = [(fileRes.starts[row], fileRes.ends[row]) \
+                        for row, state in enumerate(fileRes.checkStates) \
+                            if state == Qt.Checked]
+            if spans:
+                scanAfter = (fileRes.starts[-1], fileRes.ends[-1]) if fileRes.truncated else None
+                items[fileRes.fileName] = (fileRes.regExp, spans, scanAfter)
+        return items
+
+    def onResultsHandledByReplaceThread(self, fileName, spans):
+        """Replace thread has processed matches, need to remove it from the model.
+        spans is list of (start, end) of the matches
         """
         for index, fileRes in enumerate(self.fileResults):  # try to find FileResults
             if fileRes.fileName == fileName:  # found
-                fileResIndex = self.createIndex(index, 0, fileRes)
-                if len(results) == len(fileRes.results):  # removing all
+                self._lineCache.clear()
+                fileRes.truncated = False  # not stored matches have been replaced
+                if len(spans) == fileRes.count():  # removing all
                     self.beginRemoveRows(QModelIndex(), index, index)
                     self.fileResults.pop(index)
                     self.endRemoveRows()                    
                 else:
-                    for res in results:
-                        resIndex = fileRes.results.index(res)
-                        self.beginRemoveRows(fileResIndex, resIndex, resIndex)
-                        fileRes.results.pop(resIndex)
+                    fileResIndex = self.createIndex(index, 0, fileRes)
+                    handledStarts = set([start for start, end in spans])  # pylint: disable=W0612
+                    rows = [row for row, start in enumerate(fileRes.starts) \
+                                if start in handledStarts]
+                    # remove ranges of rows, from the end
+                    while rows:
+                        last = rows.pop()
+                        first = last
+                        while rows and rows[-1] == first - 1:
+                            first = rows.pop()
+                        self.beginRemoveRows(fileResIndex, first, last)
+                        fileRes.removeRows(first, last)
                         self.endRemoveRows()
-                    if not fileRes.results:  # no results left
+                    if not fileRes.count():  # no results left
                         self.beginRemoveRows(QModelIndex(), index, index)
                         self.fileResults.pop(index)
                         self.endRemoveRows()
@@ -297,7 +452,7 @@ class SearchResultsModel(QAbstractItemModel):
     def matchesCount(self):
         """Get count of matches, stored by the model
         """
-        return sum([len (fileRes.results) for fileRes in self.fileResults])
+        return sum([fileRes.count() for fileRes in self.fileResults])
 
     def empty(self):
         """Check if have some items
@@ -481,10 +481,11 @@ class SearchWidget(QFrame):
         self._progress.setVisible( inProgress )
 
     def onSearchProgressChanged(self, value, total ):
-        """Signal from the thread, progress changed
+        """Signal from the thread, progress changed.
+        total is 0, while count of files is not known. Progress bar shows busy indicator
         """
-        self._progress.setValue( value )
         self._progress.setMaximum( total )
+        self._progress.setValue( value )
 
     def setReplaceInProgress(self, inProgress):
         """Replace thread started or stopped
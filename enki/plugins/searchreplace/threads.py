@@ -9,21 +9,22 @@ import os.path
 import re
 import time
 import fnmatch
+import multiprocessing
+import threading
+import itertools
+import collections
+import Queue
 
 from PyQt4.QtCore import pyqtSignal, \
                          QThread
 
 from enki.core.core import core
+from enki.lib import dirwalker
 import searchresultsmodel
-import substitutions
-
-def _isBinary(fileObject):
-    """Expects, that file position is 0, when exits, file position is 0
-    """
-    binary = '\0' in fileObject.read( 4096 )
-    fileObject.seek(0)
-    return binary
-
+import scanner
+import searchindex
+import planner
+import replacer
 
 class StopableThread(QThread):
     """Stoppable thread class. Used as base for search and replace thread.
@@ -51,11 +52,26 @@ class StopableThread(QThread):
 
 class SearchThread(StopableThread):
     """Thread builds list of files for search and than searches in this files.append
+
+    Files are searched while the directory is being walked. Walking is done by a producer thread, which
+    puts files to a bounded queue. Count of files is unknown until walking is finished, therefore
+    progressChanged is emitted with total 0 until then.
+
+    If there are many files, reading and scanning is done by a pool of worker processes.
+    Python threads can't use more than one CPU core
+
+    When searching in a directory, files which can't contain the searched text are skipped with help of
+    :class:`searchindex.SearchIndex`
     """
     RESULTS_EMIT_TIMEOUT = 1.0
+    PARALLEL_SEARCH_MIN_FILES = 64  # Starting processes is not free. Do not use them for small searches
+    PARALLEL_SEARCH_CHUNK_SIZE = 16  # Count of files, sent to a worker at once
+    PARALLEL_SEARCH_CHUNKS_PER_PROCESS = 4  # Count of chunks, queued for a worker. Limits memory usage
+    FILE_QUEUE_SIZE = 1024  # Count of found, but not searched yet files
+    POLL_TIMEOUT = 0.1  # Check if thread is stopped with this interval, while waiting for workers or walker
 
     resultsAvailable = pyqtSignal(list)  # list of searchresultsmodel.FileResults
-    progressChanged = pyqtSignal(int, int)  # int value, int total
+    progressChanged = pyqtSignal(int, int)  # int value, int total. Total is 0, if not known yet
 
     def search(self, regExp, mask, inOpenedFiles, searchPath):
         """Start search process.
@@ -63,10 +79,12 @@ class SearchThread(StopableThread):
         """
         self.stop()
         
-        self._regExp = regExp
+        self._plan = planner.SearchPlan(regExp)
         self._mask = mask
         self._inOpenedFiles = inOpenedFiles
         self._searchPath = searchPath
+        self._useIndex = core.config()['SearchReplace']['UseIndex']
+        self._totalFiles = 0  # count of files for search. Set, when walking is finished
         
         self._openedFiles = {}
         for document in core.workspace().documents():
@@ -76,34 +94,19 @@ class SearchThread(StopableThread):
         self.start()
 
     def _getFiles(self, path, maskRegExp, filterRegExp):
-        """Get recursive list of files from directory.
-        maskRegExp is regExp object for check if file matches mask
+        """Get recursive list of files from directory. Generator. Yields (path, ``os.stat()`` result or None).
+        maskRegExp is regExp object for check if file matches mask.
+        Files are stat'ed only if the index is used, stat is required to check if the index is outdated
         """
-        retFiles = []
-        for root, dirs, files in os.walk(os.path.abspath(path)):  # pylint: disable=W0612
-            if root.startswith('.') or (os.path.sep + '.') in root:
+        walk = dirwalker.walker().walk(path, filterRegExp, lambda: self._exit, withStat=self._useIndex)
+        for item in walk:
+            fullPath, fileStat = item if self._useIndex else (item, None)
+            if maskRegExp and not maskRegExp.match(os.path.basename(fullPath)):
                 continue
-            for fileName in files:
-                if fileName.startswith('.'):
-                    continue
-                if maskRegExp and not maskRegExp.match(fileName):
-                    continue
-                
-                if filterRegExp.match(fileName):
-                    continue
-                
-                fullPath = os.path.join(root, fileName)
-                if not os.path.isfile(fullPath):
-                    continue
-                retFiles.append(root + os.path.sep + fileName)
-
-            if self._exit :
-                break
-
-        return retFiles
+            yield fullPath, fileStat
     
     def _getFilesToScan(self):
-        """Get list of files for search.
+        """Get files for search. Returns iterable of (path, ``os.stat()`` result or None)
         """
         files = set()
 
@@ -119,205 +122,325 @@ class SearchThread(StopableThread):
             if maskRegExp:
                 basenames = [os.path.basename(f) for f in files]
                 files = [f for f in basenames if maskRegExp.match(f)]
-            return files
+            return [(fileName, None) for fileName in sorted(files)]
         else:
             path = self._searchPath
             return self._getFiles(path, maskRegExp, core.fileFilter().regExp())
 
-    def _fileContent(self, fileName):
-        """Read text from file
+    def _putToQueue(self, fileQueue, item):
+        """Put item to the queue. Returns False, if thread has been stopped while the queue was full
+        """
+        while not self._exit:
+            try:
+                fileQueue.put(item, timeout=self.POLL_TIMEOUT)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def _produceFiles(self, fileQueue, index):
+        """Producer thread function.
+        Walks the directory, and puts (file name, need signature) to the queue. None is put, when finished.
+
+        Need signature is True, if the index shall be updated for the file.
+        Opened files are not indexed, because its text might be not equal to the file on the disk.
+        Opened files are always searched
+        """
+        try:
+            walkedFiles = []
+            count = 0
+            for fileName, fileStat in self._getFilesToScan():
+                walkedFiles.append(fileName)
+                needSignature = False
+                if index is not None:
+                    candidate, stale = index.filterFile(fileName, fileStat)
+                    opened = fileName in self._openedFiles
+                    if not candidate and not opened:
+                        continue
+                    needSignature = stale and not opened
+
+                if not self._putToQueue(fileQueue, (fileName, needSignature)):
+                    return
+                count += 1
+
+            if not self._exit:
+                self._totalFiles = count
+                if index is not None and not self._mask:  # files, not matching the mask, are not walked
+                    index.removeMissing(walkedFiles)
+        finally:
+            self._putToQueue(fileQueue, None)
+
+    def _iterQueue(self, fileQueue):
+        """Get items from the queue, until None is received or thread is stopped. Generator
+        """
+        while not self._exit:
+            try:
+                item = fileQueue.get(timeout=self.POLL_TIMEOUT)
+            except Queue.Empty:
+                continue
+
+            if item is None:
+                return
+            yield item
+
+    @staticmethod
+    def _processCount():
+        """Count of worker processes for parallel search
+        """
+        try:
+            return multiprocessing.cpu_count()
+        except NotImplementedError:
+            return 1
+
+    def _iterSearchResults(self, files):
+        """Search in the files. Generator.
+        files is iterable of (file name, need signature).
+        Yields (file name, compact matches, trigram signature or None) in order of files.
+        See :func:`scanner.compactMatches`
+        """
+        files = iter(files)
+        firstFiles = list(itertools.islice(files, self.PARALLEL_SEARCH_MIN_FILES))
+        if len(firstFiles) == self.PARALLEL_SEARCH_MIN_FILES and \
+           self._processCount() > 1:
+            return self._iterSearchResultsParallel(itertools.chain(firstFiles, files))
+        else:
+            return self._iterSearchResultsSequential(itertools.chain(firstFiles, files))
+
+    def _iterSearchResultsSequential(self, files):
+        """Search in the files in this thread
         """
-        if fileName in self._openedFiles:
-            return self._openedFiles[ fileName ]
+        for fileName, needSignature in files:
+            matches, signature = scanner.scanFile(self._plan,
+                                                  fileName,
+                                                  self._openedFiles.get(fileName),
+                                                  needSignature)
+            yield fileName, scanner.compactMatches(matches), signature
+            if self._exit:
+                break
+
+    def _iterSearchResultsParallel(self, files):
+        """Search in the files with pool of worker processes.
 
+        Limited count of chunks is sent to the pool, results are received in order of files.
+        Pool is terminated, when all files are processed or when the thread is stopped
+        """
+        processCount = self._processCount()
+        pool = multiprocessing.Pool(processCount, scanner.initWorker, (self._plan,))
         try:
-            with open(fileName) as openedFile:
-                if _isBinary(openedFile):
-                    return ''
-                return unicode(openedFile.read(), 'utf8', errors = 'ignore')
-        except IOError as ex:
-            print ex
-            return ''
+            tasks = ((fileName, self._openedFiles.get(fileName), needSignature) \
+                        for fileName, needSignature in files)
+            pending = collections.deque()  # AsyncResult s
+            filesFinished = False
+            while True:
+                while not filesFinished and \
+                      len(pending) < processCount * self.PARALLEL_SEARCH_CHUNKS_PER_PROCESS:
+                    chunk = list(itertools.islice(tasks, self.PARALLEL_SEARCH_CHUNK_SIZE))
+                    if chunk:
+                        pending.append(pool.apply_async(scanner.scanFilesInWorker, (chunk,)))
+                    if len(chunk) < self.PARALLEL_SEARCH_CHUNK_SIZE:
+                        filesFinished = True
+
+                if not pending:
+                    break
+
+                while True:
+                    if self._exit:
+                        return
+                    try:
+                        chunkResults = pending[0].get(self.POLL_TIMEOUT)
+                        break
+                    except multiprocessing.TimeoutError:
+                        pass
+                pending.popleft()
+
+                for fileName, found, signature in chunkResults:
+                    yield fileName, found, signature
+        finally:
+            pool.terminate()
+            pool.join()
 
     def run(self):
         """Start point of the code, running in thread.
-        Build list of files for search, than do search
+        Start producer thread, which walks the directory, and search in found files
         """
-        startTime = time.clock()
         self.progressChanged.emit( -1, 0 )
 
-        files = sorted(self._getFilesToScan())
+        index = None
+        if self._useIndex and not self._inOpenedFiles:
+            index = searchindex.SearchIndex(os.path.abspath(self._searchPath), self._plan)
 
-        if  self._exit :
-            return
-        
-        self.progressChanged.emit( 0, len(files))
-        
-        # Prepare data for search process        
-        lastResultsEmitTime = time.clock()
+        fileQueue = Queue.Queue(self.FILE_QUEUE_SIZE)
+        producer = threading.Thread(target=self._produceFiles, args=(fileQueue, index))
+        producer.start()
+
+        lastResultsEmitTime = None
         notEmittedFileResults = []
+        fileIndex = 0
         # Search for all files
-        for fileIndex, fileName in enumerate(files):
-            results = self._searchInFile(fileName)
-            if  results:
+        for fileIndex, (fileName, found, signature) in \
+                        enumerate(self._iterSearchResults(self._iterQueue(fileQueue))):
+            if signature is not None:
+                index.update(fileName, signature)
+
+            if  found[0]:  # has starts
                 newFileRes = searchresultsmodel.FileResults(self._searchPath,
                                                             fileName,
-                                                            results)
+                                                            self._plan.regExp,
+                                                            found)
                 notEmittedFileResults.append(newFileRes)
 
+            # first results are emitted immediately
             if notEmittedFileResults and \
-               (time.clock() - lastResultsEmitTime) > self.RESULTS_EMIT_TIMEOUT:
-                self.progressChanged.emit( fileIndex, len(files))
+               (lastResultsEmitTime is None or \
+                (time.time() - lastResultsEmitTime) > self.RESULTS_EMIT_TIMEOUT):
+                self.progressChanged.emit( fileIndex, self._totalFiles)
                 self.resultsAvailable.emit(notEmittedFileResults)
                 notEmittedFileResults = []
-                lastResultsEmitTime = time.clock()
+                lastResultsEmitTime = time.time()
 
             if  self._exit :
-                self.progressChanged.emit( fileIndex, len(files))
                 break
         
+        self.progressChanged.emit( fileIndex, self._totalFiles)
         if notEmittedFileResults:
             self.resultsAvailable.emit(notEmittedFileResults)
 
-    def _searchInFile(self, fileName):
-        """Search in the file and return searchresultsmodel.Result s
-        """
-        lastPos = 0
-        eolCount = 0
-        results = []
-        eol = "\n"
-        
-        content = self._fileContent( fileName )
-        
-        # Process result for all occurrences
-        for match in self._regExp.finditer(content):
-            start = match.start()
-            
-            eolStart = content.rfind( eol, 0, start)
-            eolEnd = content.find( eol, start + len(match.group(0)))
-            eolCount += content[lastPos:start].count( eol )
-            lastPos = start
-            
-            wholeLine = content[eolStart+1 : eolEnd]
-            column = start - eolStart
-            if eolStart != 0:
-                column -= 1
-            
-            result = searchresultsmodel.Result( fileName = fileName, \
-                             wholeLine = wholeLine, \
-                             line = eolCount, \
-                             column = column, \
-                             match=match)
-            results.append(result)
-
-            if self._exit:
-                break
-        return results
+        producer.join()
+        if index is not None:
+            index.save()
 
 class ReplaceThread(StopableThread):
     """Thread does replacements in the directory according to checked items
     
-    Replacements in opened documents are done by GUI thread, in other - by new thread
+    Replacements in opened documents are done by GUI thread, in other - by a pool of worker processes.
+    Files are written atomically, original files are kept in the :class:`replacer.Journal`,
+    therefore the last replace can be rolled back
     """
+    PARALLEL_REPLACE_MIN_FILES = 8  # Do not start processes for small replacements
+    TASKS_PER_PROCESS = 4  # Count of files, queued for a worker
+    POLL_TIMEOUT = 0.1  # Check if thread is stopped with this interval, while waiting for workers
+
     resultsHandled = pyqtSignal(unicode, list)
     finalStatus = pyqtSignal(unicode)
     error = pyqtSignal(unicode)
 
     def replace(self, results, replaceText):
-        """Run replace process
+        """Run replace process.
+        results is dictionary {file name: (regExp, list of (start, end), scanAfter)}.
+        See :func:`replacer.findReplacements` about scanAfter
         """
         self.stop()
         
         self._replaceText = replaceText
-        self._totalCount = sum([len(v) for v in results.itervalues()])
+        self._umask = core.workspace().saveQueue().umask()  # umask is not read by the thread, it is not safe
         
         # do replacements in opened files, prepare for replacing in not opened
         self._results = {}
-        for filePath, matches in results.iteritems():
+        self._openedFilesCount = 0
+        for filePath, (regExp, spans, scanAfter) in results.iteritems():
             foundDocument = core.workspace().findDocumentForPath(filePath)
             if foundDocument is not None:
-                self._replaceInOpenedDocument(foundDocument, matches)
-                self.resultsHandled.emit( filePath, matches)
+                self._replaceInOpenedDocument(foundDocument, regExp, spans, scanAfter)
+                self.resultsHandled.emit( filePath, spans)
+                self._openedFilesCount += 1
             else:
-                self._results[filePath] = matches
+                self._results[filePath] = (regExp, spans, scanAfter)
         
         self.start()
 
-    def _replaceInOpenedDocument(self, document, matches):
+    def _replaceInOpenedDocument(self, document, regExp, spans, scanAfter):
         """Do replacements in opened document
         """
-        oldText = document.text()
-        newText = self._doReplacements(document.text(), matches)
-        document.replace(newText, startAbsPos=0, endAbsPos=len(oldText))
+        replacements = replacer.findReplacements(document.text(), regExp, spans, self._replaceText, scanAfter)
+        document.replaceMatches(replacements)
 
-    def _saveContent(self, fileName, content):
-        """Write text to the file
+    def _iterReplaceResults(self, tasks):
+        """Do replacements. Generator. Yields results of replacer.replaceInFile()
         """
-        try:
-            content = content.encode('utf8')
-        except UnicodeEncodeError as ex:
-            pattern = self.tr("Failed to encode file to utf8: %s")
-            text = unicode(str(ex), 'utf8')
-            self.error.emit(pattern % text)
+        processCount = SearchThread._processCount()  # pylint: disable=W0212
+        if len(tasks) < self.PARALLEL_REPLACE_MIN_FILES or processCount < 2:
+            for task in tasks:
+                if self._exit:
+                    return
+                yield replacer.replaceInFile(task)
             return
-        
-        try:
-            with open(fileName, 'w') as openFile:
-                openFile.write(content)
-        except IOError as ex:
-            pattern = self.tr("Error while saving replaced content: %s")
-            text = unicode(str(ex), 'utf8')
-            self.error.emit(pattern % text)
-
-    def _fileContent(self, fileName):
-        """Read file
-        """
-        try:
-            with open(fileName) as openFile:
-                content = openFile.read()
-        except IOError as ex:
-            self.error.emit( self.tr( "Error opening file: %s" % str(ex) ) )
-            return ''
-        
+
+        pool = multiprocessing.Pool(processCount)
         try:
-            return unicode(content, 'utf8')
-        except UnicodeDecodeError as ex:
-            self.error.emit(self.tr( "File %s not read: unicode error '%s'. File may be corrupted" % \
-                            (fileName, str(ex) ) ))
-            return None
+            tasks = iter(tasks)
+            pending = collections.deque()  # AsyncResult s
+            while True:
+                # Not all tasks are sent at once, so stopping doesn't wait for all files
+                while not self._exit and \
+                      len(pending) < processCount * self.TASKS_PER_PROCESS:
+                    try:
+                        task = tasks.next()
+                    except StopIteration:
+                        break
+                    pending.append(pool.apply_async(replacer.replaceInFile, (task,)))
+
+                if not pending:
+                    break
+
+                try:
+                    result = pending[0].get(self.POLL_TIMEOUT)
+                except multiprocessing.TimeoutError:
+                    continue
+                pending.popleft()
+                yield result
+        finally:
+            # Files, which are being processed, are finished. Processes are not killed in the middle of writing
+            pool.close()
+            pool.join()
 
     def run(self):
         """Start point of the code, running i thread
         Does thread job
         """
-        startTime = time.clock()
-        
-        for fileName in self._results.keys():
-            content = self._fileContent(fileName)
-            if content is None:  # if failed to read file
+        startTime = time.time()
+
+        journal = replacer.Journal()
+        backupPaths = {}
+        if self._results:  # journal of the previous replace is kept, if there is nothing to write
+            try:
+                backupPaths = journal.create(self._results.keys())
+            except (IOError, OSError) as ex:
+                self.error.emit(self.tr("Failed to create replace journal: %s") % unicode(str(ex), 'utf8'))
+                return
+
+        tasks = [(fileName, regExp, spans, scanAfter, self._replaceText, backupPaths[fileName], self._umask) \
+                    for fileName, (regExp, spans, scanAfter) in self._results.iteritems()]
+
+        replacementsCount = 0
+        filesCount = 0
+        failedCount = 0
+        replacedFiles = []
+        for fileName, count, error in self._iterReplaceResults(tasks):
+            if error is not None:
+                if isinstance(error, str):  # message contains unicode file name, if the name is unicode
+                    error = unicode(error, 'utf8', 'replace')
+                self.error.emit(error)
+                failedCount += 1
                 continue
-            
-            matches = self._results[ fileName ]
-            
-            content = self._doReplacements(content, matches)
-            
-            self._saveContent(fileName, content)
-            
-            self.resultsHandled.emit( fileName, matches)
-
-            if  self._exit :
-                break
 
-        self.finalStatus.emit("%d replacements in %d second(s)" % \
-                              (self._totalCount,
-                               time.clock() - startTime))
-
-    def _doReplacements(self, content, matches):
-        """Do replacements for one file
-        """
-        for result in matches[::-1]:  # count from end to begin because we are replacing by offset in content
-            replaceTextWithMatches = substitutions.makeSubstitutions(self._replaceText,
-                                                                     result.match)
-            content = content[:result.match.start()] + replaceTextWithMatches + content[result.match.end():]
-        
-        return content
\ No newline at end of file
+            replacementsCount += count
+            filesCount += 1
+            if count:
+                replacedFiles.append(fileName)
+            self.resultsHandled.emit( fileName, self._results[fileName][1])
+
+        if self._results:
+            try:
+                journal.finish(replacedFiles)
+            except (IOError, OSError) as ex:
+                self.error.emit(self.tr("Failed to save replace journal: %s") % unicode(str(ex), 'utf8'))
+
+        elapsed = time.time() - startTime
+        self.finalStatus.emit(self.tr("%d replacements in %d file(s) in %.1f second(s) (%d files/s). "
+                                      "%d failed, %d opened file(s) changed in the editor") % \
+                              (replacementsCount,
+                               filesCount,
+                               elapsed,
+                               filesCount / elapsed if elapsed else filesCount,
+                               failedCount,
+                               self._openedFilesCount))
@@ -39,32 +39,24 @@ class Plugin:
         session = enki.core.json_wrapper.load(_SESSION_FILE_PATH, 'session', None)
         
         if session is not None:
-            for filePath in session['opened']:
-                if os.path.exists(filePath):
-                    core.workspace().openFile(filePath)
+            filePaths = [filePath for filePath in session['opened'] \
+                            if os.path.exists(filePath)]
+            if not filePaths:
+                return
             
-            if session['current'] is not None:
-                document = self._documentForPath(session['current'])
-                if document is not None: # document might be already deleted
-                    core.workspace().setCurrentDocument(document)
-
-    def _documentForPath(self, filePath):
-        """Find document by it's file path.
-        Raises ValueError, if document hasn't been found
-        """
-        for document in core.workspace().documents():
-            if document.filePath() is not None and \
-               document.filePath() == filePath:
-                return document
-        
-        return None
+            # only the current file is opened now, other files are opened, when activated
+            core.workspace().addPlaceholders(filePaths)
+            if session['current'] in filePaths:
+                core.workspace().openFile(session['current'])
+            else:
+                core.workspace().openFile(filePaths[0])
 
     def _onAboutToTerminate(self):
         """Enki is going to be terminated.
         Save session
         """
         fileList = [document.filePath() \
-                        for document in core.workspace().documents() \
+                        for document in core.workspace().documents(includePlaceholders=True) \
                             if document.filePath() is not None and \
                                 os.path.exists(document.filePath()) and \
                                 not '/.git/' in document.filePath() and \
@@ -58,7 +58,7 @@ class Plugin(QObject):
         core.actionManager().action( "mFile/aPrint" ).setEnabled( newDocument is not None )
         
         # update view menu
-        moreThanOneDocument = len(core.workspace().documents()) > 1
+        moreThanOneDocument = len(core.workspace().documents(includePlaceholders=True)) > 1
         core.actionManager().action( "mNavigation/aNext" ).setEnabled( moreThanOneDocument )
         core.actionManager().action( "mNavigation/aPrevious" ).setEnabled( moreThanOneDocument )
 
@@ -68,8 +68,7 @@ class Plugin(QObject):
         fileNames = QFileDialog.getOpenFileNames( core.mainWindow(),
                                                   self.tr( "Classic open dialog. Main menu -> Navigation -> Locator is better" ))
                 
-        for path in fileNames:
-            core.workspace().openFile(path)
+        core.workspace().openFiles(fileNames)
     
     def _onFileReloadTriggered(self):
         """Handler of File->Reload->Current
@@ -120,13 +119,13 @@ class Plugin(QObject):
     def _onFileSaveCurrentTriggered(self):
         """Handler of File->Save->Current
         """
-        return core.workspace().currentDocument().saveFile()
+        return core.workspace().currentDocument().saveFile(wait=False)
     
     def _onFileSaveAllTriggered(self):
         """Handler of File->Save->All
         """
         for document in core.workspace().documents():
-            document.saveFile()
+            document.saveFile(wait=False)
     
     def _onFileSaveAsTriggered(self):
         """Handler for File->Save->Save as
@@ -1,6 +1,6 @@
 """
-workspace_commands --- Open, SaveAs, GotoLine commands
-======================================================
+workspace_commands --- Open, SaveAs, GotoLine, FindFile commands
+==================================================================
 """
 
 import os.path
@@ -8,8 +8,10 @@ import glob
 
 from enki.core.core import core
 from enki.lib.pathcompleter import makeSuitableCompleter, PathCompleter
+from enki.lib.htmldelegate import htmlEscape
+from enki.lib import fileindex
 
-from enki.core.locator import AbstractCommand
+from enki.core.locator import AbstractCommand, AbstractCompleter
 
 
 class CommandGotoLine(AbstractCommand):
@@ -182,12 +184,17 @@ class CommandOpen(AbstractCommand):
                     pass
                 expandedPathes.append(path)
         
-            # 2 loops, because we should open absolute pathes. When opening files, enki changes its current directory
-            for path in expandedPathes:
-                if self._line is None:
-                    core.workspace().goTo(path)
-                else:
-                    core.workspace().goTo(path, line = self._line - 1)
+            # Files are opened asynchronously, by absolute pathes. When opening files, enki changes its current directory
+            line = self._line
+            
+            def goToLine(documents):
+                """Files have been opened. Go to the line in every file
+                """
+                if line is not None:
+                    for document in documents:
+                        document.goTo(line = line - 1, grabFocus = True)
+            
+            core.workspace().openFiles(expandedPathes, goToLine)
 
         else:  # file may be not existing
             path = os.path.expanduser(self._path)
@@ -283,15 +290,142 @@ class CommandSaveAs(AbstractCommand):
         core.workspace().currentDocument().saveFile()
 
 
+class _FindFileCompleter(AbstractCompleter):
+    """Completer for the Find file command. Shows found files, best first
+    """
+    def __init__(self, matches):
+        self._matches = matches
+
+    def rowCount(self):
+        """AbstractCompleter method implementation
+        """
+        return max(len(self._matches), 1)
+
+    def text(self, row, column):
+        """AbstractCompleter method implementation.
+        Matched characters are bold
+        """
+        if not self._matches:
+            return '<i>No matching files</i>'
+
+        match = self._matches[row]
+        parts = []
+        end = 0
+        for pos in match.positions:
+            parts.append(htmlEscape(match.path[end:pos]))
+            parts.append('<b>%s</b>' % htmlEscape(match.path[pos]))
+            end = pos + 1
+        parts.append(htmlEscape(match.path[end:]))
+        return ''.join(parts)
+
+    def getFullText(self, row):
+        """AbstractCompleter method implementation
+        """
+        if row < len(self._matches):
+            return self._matches[row].path
+        return None
+
+
+class CommandFindFile(AbstractCommand):
+    """Find file Locator command. Fuzzy search of a file in the current directory tree.
+    Files are found with :mod:`enki.lib.fileindex`
+    """
+
+    @staticmethod
+    def signature():
+        """Command signature. For Help
+        """
+        return 'ff NAME'
+
+    @staticmethod
+    def description():
+        """Command description. For Help
+        """
+        return 'Find file in the current directory tree'
+
+    @staticmethod
+    def pattern():
+        """pyparsing pattern
+        """
+        from pyparsing import Literal, Optional, Regex, Suppress, White  # delayed import, performance optimization
+
+        pat = Literal('ff ') + Suppress(Optional(White())) + Optional(Regex('.+')("query"))
+        pat.leaveWhitespace()
+        pat.setParseAction(CommandFindFile.create)
+        return pat
+
+    @staticmethod
+    def create(str, loc, tocs):
+        """pyparsing callback. Creates an instance of command
+        """
+        return [CommandFindFile(tocs.query.strip() if tocs.query else '')]
+
+    _lastResult = None  # (root, query, matches) of the last search, completed by the completer thread
+
+    def __init__(self, query):
+        self._query = query
+
+    @staticmethod
+    def _root():
+        """Root directory of the searched tree. Unicode
+        """
+        root = os.path.abspath(os.path.curdir)
+        if isinstance(root, str):
+            root = root.decode(fileindex.ENCODING)
+        return root
+
+    def _lastMatches(self, root):
+        """Matches of the last completed search for the query, or None, if it has not been completed.
+        The index is never searched here, because it is called in the GUI thread
+        """
+        lastResult = CommandFindFile._lastResult
+        if lastResult is not None and lastResult[:2] == (root, self._query):
+            return lastResult[2]
+        return None
+
+    def completer(self, text, pos):
+        """Command completer. Called by the completer thread. Indexes the tree, when called first time
+        """
+        if not self._query:
+            return None
+        root = self._root()
+        matches = fileindex.index().find(root, self._query, core.fileFilter().regExp())
+        CommandFindFile._lastResult = (root, self._query, matches)
+        return _FindFileCompleter(matches)
+
+    def constructCommand(self, completableText):
+        """Construct command by the clicked path
+        """
+        return 'ff ' + completableText
+
+    def isReadyToExecute(self):
+        """Check if command is complete and ready to execute
+        """
+        if not self._query:
+            return False
+        root = self._root()
+        return os.path.isfile(os.path.join(root, self._query)) or bool(self._lastMatches(root))
+
+    def execute(self):
+        """Open the file. If the query is path of a file, i.e. a clicked completion, it is opened,
+        otherwise the best match of the last completed search
+        """
+        root = self._root()
+        path = os.path.join(root, self._query)
+        if not os.path.isfile(path):
+            path = os.path.join(root, self._lastMatches(root)[0].path)
+        core.workspace().goTo(path)
+
+
 class Plugin:
     """Plugin interface
     """
     def __init__(self):
-        for comClass in (CommandGotoLine, CommandOpen, CommandSaveAs):
+        for comClass in (CommandGotoLine, CommandOpen, CommandSaveAs, CommandFindFile):
             core.locator().addCommandClass(comClass)
 
     def del_(self):
         """Explicitly called destructor
         """
-        for comClass in (CommandGotoLine, CommandOpen, CommandSaveAs):
+        for comClass in (CommandGotoLine, CommandOpen, CommandSaveAs, CommandFindFile):
             core.locator().removeCommandClass(comClass)
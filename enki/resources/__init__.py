@@ -0,0 +1,41 @@
+"""
+resources --- Icons, compiled to Qt resources
+=============================================
+
+Icons from ``icons/enkiicons.qrc`` are available as ``:/enkiicons/...`` paths.
+
+Binary resource file ``icons.rcc`` is registered, if it exists. It is much cheaper, than importing the generated
+``icons.py`` module, which contains the same data as Python string literals.
+``icons.py`` is used, if ``icons.rcc`` is not available.
+
+Both files are generated by ``tools/make-resources.sh``
+"""
+
+import os.path
+
+from PyQt4.QtCore import QResource
+
+_RCC_PATH = os.path.join(os.path.dirname(__file__), 'icons.rcc')
+
+_registeredRcc = False
+
+
+def initResources():
+    """Register resources. Called by the core on startup
+    """
+    global _registeredRcc  # pylint: disable=W0603
+    _registeredRcc = QResource.registerResource(_RCC_PATH)
+    if not _registeredRcc:
+        from enki.resources.icons import qInitResources  # slow, the module is big
+        qInitResources()
+
+def cleanupResources():
+    """Unregister resources. Called by the core on termination
+    """
+    global _registeredRcc  # pylint: disable=W0603
+    if _registeredRcc:
+        QResource.unregisterResource(_RCC_PATH)
+        _registeredRcc = False
+    else:
+        from enki.resources.icons import qCleanupResources
+        qCleanupResources()
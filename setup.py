@@ -41,6 +41,11 @@ def _checkDepencencies():
         print '\t' + str(ex)
         ok = False
     
+    try:
+        import scandir
+    except ImportError:  # optional
+        print "scandir is not installed. Search in directories will be slower"
+
     if not ok:
         print 'See http://enki-editor.org/install-sources.html'
 
@@ -113,7 +118,8 @@ packages=['enki',
           'enki/resources']
 
 package_data={'enki' : ['ui/*.ui',
-                           'config/*.json']
+                           'config/*.json',
+                           'resources/*.rcc']
              }
 
 for loader, name, ispkg in pkgutil.iter_modules(['enki/plugins']):
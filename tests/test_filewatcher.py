@@ -0,0 +1,128 @@
+"""Stress test of :mod:`enki.core.filewatcher`.
+Thousands of files are touched in a directory with hundreds of watched files
+"""
+
+import hashlib
+import os
+import os.path
+import shutil
+import tempfile
+import time
+import unittest
+
+from PyQt4.QtCore import QCoreApplication, QEventLoop, QThread, QTimer
+
+from enki.core.filewatcher import FileWatcher
+
+_app = QCoreApplication.instance() or QCoreApplication([])
+
+
+def _processEvents(seconds):
+    """Run the event loop during the time
+    """
+    loop = QEventLoop()
+    QTimer.singleShot(int(seconds * 1000), loop.quit)
+    loop.exec_()
+
+
+class Test(unittest.TestCase):
+    WATCHED_COUNT = 300
+    TOUCHED_COUNT = 3000
+    WAIT_SEC = (FileWatcher.MAX_DELAY_MS + 500) / 1000.
+
+    def setUp(self):
+        self._dirPath = tempfile.mkdtemp()
+        self._watcher = FileWatcher()
+        self._calls = []  # list of (path, stat)
+
+    def tearDown(self):
+        self._watcher.del_()
+        shutil.rmtree(self._dirPath)
+
+    def _write(self, name, data='text', mode='w'):
+        path = os.path.join(self._dirPath, name)
+        with open(path, mode) as openedFile:
+            openedFile.write(data)
+        return path
+
+    def _watch(self, path):
+        self._watcher.watch(path, lambda stat: self._calls.append((path, stat)))
+
+    def test_touch_thousands(self):
+        watched = [self._write('watched%d' % index) for index in range(self.WATCHED_COUNT)]
+        for path in watched:
+            self._watch(path)
+        _processEvents(0.1)
+
+        for index in range(self.TOUCHED_COUNT):
+            self._write('other%d' % index)
+        changed = watched[::10]
+        for path in changed:
+            self._write(os.path.basename(path), 'changed text')
+        removed = watched[1]
+        os.remove(removed)
+
+        _processEvents(self.WAIT_SEC)
+
+        lastStats = dict(self._calls)
+        for path in changed:
+            self.assertEqual(lastStats[path].st_size, len('changed text'))
+        self.assertIsNone(lastStats[removed])
+        self.assertTrue(set(lastStats.keys()).issubset(set(watched)))  # not watched files are not reported
+
+        # notifications are batched. Every file is stat'ed and reported once per batch
+        for path in watched:
+            self.assertLessEqual(len([call for call in self._calls if call[0] == path]), 3)
+
+    def test_continuous_writes(self):
+        """File, which is written more often, than COALESCE_MS, is reported after MAX_DELAY_MS
+        """
+        path = self._write('log')
+        self._watch(path)
+        _processEvents(0.1)
+
+        startTime = time.time()
+        while not self._calls and time.time() - startTime < self.WAIT_SEC * 2:
+            self._write('log', 'line\n', 'a')
+            _processEvents(FileWatcher.COALESCE_MS / 4 / 1000.)
+
+        self.assertTrue(self._calls)
+        self.assertLess(time.time() - startTime, self.WAIT_SEC)
+
+    def test_batch_time(self):
+        """Processing of a batch with all watched files is fast
+        """
+        watched = [self._write('watched%d' % index) for index in range(self.WATCHED_COUNT)]
+        for path in watched:
+            self._watch(path)
+        self._watcher._pending.update(watched)  # pylint: disable=W0212
+
+        startTime = time.time()
+        self._watcher._processPending()  # pylint: disable=W0212
+        elapsed = time.time() - startTime
+
+        self.assertEqual(len(self._calls), self.WATCHED_COUNT)
+        self.assertLess(elapsed, 0.1)
+
+    def test_hash_file(self):
+        """Files are hashed by a background thread, digests are delivered to the GUI thread
+        """
+        path = self._write('big', 'x' * (3 * 1024 * 1024 + 1))
+        results = []
+        self._watcher.hashFile(path, hashlib.sha1,
+                               lambda digest: results.append((digest, QThread.currentThread())))
+        self._watcher.hashFile(path + '.missing', hashlib.sha1,
+                               lambda digest: results.append((digest, QThread.currentThread())))
+
+        startTime = time.time()
+        while len(results) < 2 and time.time() - startTime < 5:
+            _processEvents(0.05)
+
+        self.assertEqual(results[0][0], hashlib.sha1('x' * (3 * 1024 * 1024 + 1)).digest())
+        self.assertIsNone(results[1][0])
+        for digest, thread in results:  # pylint: disable=W0612
+            self.assertEqual(thread, _app.thread())
+
+
+if __name__ == '__main__':
+    unittest.main()
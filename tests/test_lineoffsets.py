@@ -0,0 +1,83 @@
+"""Test of the table of the line starts of the text editors.
+Random edits are applied to a text and to the table, which is compared with lines of the text
+"""
+
+import random
+import unittest
+
+from enki.core.abstractdocument import _LineOffsets
+
+
+def _lines(text):
+    """Lines of the text, as AbstractTextEditor.lines() returns them
+    """
+    lines = text.splitlines()
+    if text.endswith('\n') or not lines:
+        lines.append('')
+    return lines
+
+
+class Test(unittest.TestCase):
+    EDIT_COUNT = 1000
+
+    def setUp(self):
+        self._generator = random.Random(0)
+
+    def _randomText(self, maxLength):
+        return ''.join([self._generator.choice('abc \n') for index in range(self._generator.randint(0, maxLength))])
+
+    def _checkTable(self, offsets, text):
+        lines = _lines(text)
+        self.assertEqual(offsets.lineCount(), len(lines))
+        self.assertEqual(offsets.textLength(), len(text))
+        pos = 0
+        for index, line in enumerate(lines):
+            self.assertEqual(offsets.lineStart(index), pos)
+            self.assertEqual(offsets.lineLength(index), len(line))
+            self.assertEqual(offsets.lineForPosition(pos), index)
+            self.assertEqual(offsets.lineForPosition(pos + len(line)), index)  # EOL belongs to the line
+            pos += len(line) + 1
+
+    def _edit(self, offsets, text):
+        """Insert or delete random text, notify the table as the editor does. Returns new text
+        """
+        start = self._generator.randint(0, len(text))
+        if self._generator.random() < 0.5:  # insert
+            inserted = self._randomText(20)
+            newText = text[:start] + inserted + text[start:]
+            linesAdded = inserted.count('\n')
+        else:  # delete
+            end = min(len(text), start + self._generator.randint(0, 20))
+            newText = text[:start] + text[end:]
+            linesAdded = -text.count('\n', start, end)
+
+        line = text.count('\n', 0, start)
+        newLines = _lines(newText)
+        newLineLengths = [len(newLine) + 1 for newLine in newLines[line:line + max(linesAdded, 0) + 1]]
+        if line + max(linesAdded, 0) == len(newLines) - 1:  # the last line of the text doesn't have EOL
+            newLineLengths[-1] -= 1
+        offsets.linesChanged(line, linesAdded, newLineLengths)
+        return newText
+
+    def test_build(self):
+        for text in ['', '\n', 'a', 'a\n', '\n\n', 'ab\ncd', 'ab\ncd\n', self._randomText(1000)]:
+            self._checkTable(_LineOffsets(text), text)
+
+    def test_random_edits(self):
+        text = self._randomText(2000)
+        offsets = _LineOffsets(text)
+        for index in range(self.EDIT_COUNT):
+            text = self._edit(offsets, text)
+            self._checkTable(offsets, text)
+
+    def test_edit_to_empty(self):
+        text = 'ab\ncd\nef'
+        offsets = _LineOffsets(text)
+        offsets.linesChanged(0, -2, [0])  # everything deleted
+        self._checkTable(offsets, '')
+        offsets.linesChanged(0, 1, [2, 1])  # 'a\nb' inserted
+        self._checkTable(offsets, 'a\nb')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+"""Test of replacing in files, which have more matches, than the search results store
+"""
+
+import re
+import unittest
+
+from enki.plugins.searchreplace import replacer, scanner
+
+
+class _Plan:
+    """Search plan, which is used by scanner.scanFile()
+    """
+    def __init__(self, pattern):
+        self.regExp = re.compile(pattern)
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self._maxMatches = scanner.MAX_MATCHES_PER_FILE
+        scanner.MAX_MATCHES_PER_FILE = 10
+
+    def tearDown(self):
+        scanner.MAX_MATCHES_PER_FILE = self._maxMatches
+
+    def _search(self, pattern, content):
+        """Returns (regExp, list of stored (start, end), truncated)
+        """
+        plan = _Plan(pattern)
+        matches, signature = scanner.scanFile(plan, 'file.txt', content, False)  # pylint: disable=W0612
+        starts, ends, lines, columns, truncated = scanner.compactMatches(matches)  # pylint: disable=W0612
+        return plan.regExp, zip(starts, ends), truncated
+
+    def test_not_truncated(self):
+        regExp, spans, truncated = self._search('ab', u'ab\n' * 10)
+        self.assertEqual(len(spans), 10)
+        self.assertFalse(truncated)
+
+    def test_replace_truncated(self):
+        content = u'x ab\n' * 25
+        regExp, spans, truncated = self._search('ab', content)
+        self.assertEqual(len(spans), 10)
+        self.assertTrue(truncated)
+
+        # the first match is unchecked, not stored matches are replaced
+        replacements = replacer.findReplacements(content, regExp, spans[1:], 'Z', spans[-1])
+        self.assertEqual(replacer.applyReplacements(content, replacements), u'x ab\n' + u'x Z\n' * 24)
+
+    def test_replace_truncated_empty_matches(self):
+        content = u'ab' * 30
+        regExp, spans, truncated = self._search('(?=b)|a', content)
+        self.assertTrue(truncated)
+
+        replacements = replacer.findReplacements(content, regExp, spans, '-', spans[-1])
+        self.assertEqual([(start, end) for start, end, text in replacements],  # pylint: disable=W0612
+                         [match.span() for match in regExp.finditer(content)])
+
+
+if __name__ == '__main__':
+    unittest.main()
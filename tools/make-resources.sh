@@ -0,0 +1,12 @@
+#!/bin/bash
+
+#
+# Regenerate compiled icons after icons/enkiicons.qrc or the icons have been changed.
+# Script shall be executed from the source tree root
+#
+
+# Binary resource file, registered on startup
+rcc -binary icons/enkiicons.qrc -o enki/resources/icons.rcc || exit 1
+
+# Python module. Used, if the binary file is not available
+pyrcc4 icons/enkiicons.qrc -o enki/resources/icons.py || exit 1